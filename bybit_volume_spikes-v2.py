@@ -1,26 +1,410 @@
 import sys
 import asyncio
-import aiohttp
+import importlib
 from datetime import datetime, timedelta, timezone
-import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QLabel,
     QComboBox, QPushButton, QHBoxLayout, QAbstractItemView, QDialog, QFormLayout, QDialogButtonBox,
-    QDoubleSpinBox, QGroupBox, QCheckBox, QLineEdit, QSystemTrayIcon, QMessageBox, QMenu, QAction, QSpinBox, QRadioButton, QButtonGroup, QTextEdit
+    QDoubleSpinBox, QGroupBox, QCheckBox, QLineEdit, QSystemTrayIcon, QMessageBox, QMenu, QAction, QSpinBox, QRadioButton, QButtonGroup, QTextEdit,
+    QListWidget, QListWidgetItem, QTableView, QDateEdit, QStyledItemDelegate, QStyle, QStyleOptionViewItem
 )
-from PyQt5.QtCore import QTimer, Qt, QSettings
-from PyQt5.QtGui import QColor, QBrush, QFont
-from PyQt5.QtMultimedia import QSound
+from PyQt5.QtCore import QTimer, Qt, QSettings, QAbstractListModel, QModelIndex, QDate
+from PyQt5.QtGui import QColor, QBrush, QFont, QFontMetrics, QPixmap, QPainter, QPen
 import qasync
 import webbrowser
 import os
-import requests
+import random
+import struct
+import json
+import ast
+import re
+import time
+import functools
+from urllib.parse import quote, urlsplit
 
-BYBIT_SYMBOLS_URL = "https://api.bybit.com/v5/market/instruments-info?category={category}"
-BYBIT_KLINE_URL = "https://api.bybit.com/v5/market/kline?category={category}&symbol={symbol}&interval=15&from={from_ts}&limit=200"
+class LazyModule:
+    # Тяжёлый модуль импортируется при первом обращении, а не до показа окна
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+np = LazyModule("numpy")
+aiohttp = LazyModule("aiohttp")
+requests = LazyModule("requests")
+
+BYBIT_API_URL = os.environ.get("BYBIT_API_URL", "https://api.bybit.com")  # подменяется стендом --soak
+BYBIT_SYMBOLS_URL = BYBIT_API_URL + "/v5/market/instruments-info?category={category}&limit=1000"
+BYBIT_KLINE_URL = BYBIT_API_URL + "/v5/market/kline?category={category}&symbol={symbol}&interval=15&start={start_ms}&limit={limit}"
+BYBIT_TICKERS_URL = BYBIT_API_URL + "/v5/market/tickers?category={category}"
+BYBIT_ORDERBOOK_URL = BYBIT_API_URL + "/v5/market/orderbook?category={category}&symbol={symbol}&limit=50"
+BYBIT_OPEN_INTEREST_URL = BYBIT_API_URL + "/v5/market/open-interest?category={category}&symbol={symbol}&intervalTime=1h&limit=2"
+BYBIT_TRADE_WS_URL = "wss://stream.bybit.com/v5/public/{category}"
 CATEGORIES = ["spot", "linear"]
 
+SETTINGS_APP = "BybitMonitor"  # прогон --soak работает со своими настройками
 NOTIFICATION_LOG_FILE = "notification_log.txt"
+SNAPSHOT_FILE = "state_snapshot.bin"
+SNAPSHOT_INTERVAL = 300  # сек между периодическими сохранениями снимка
+SKETCH_FILE = "volume_sketch.bin"  # квантили объёма по тикерам, сохраняются вместе со снимком
+TRACE_FILE = "alert_trace.bin"  # записи задержек уведомлений фиксированной длины, только дозапись
+TRACE_RECENT = 500  # последних уведомлений для перцентилей в окне
+PROFILE_DIR = "profiles"
+PROFILE_CYCLES = 5  # циклов в профиле, запущенном кнопкой или сигналом
+PROFILE_INTERVAL = 0.005  # сек между снимками стека потока event loop
+HISTORY_DIR = "history"
+TRADE_BUCKET_SECONDS = 2  # корзина ленты сделок
+TRADE_SLOTS = 64  # корзин в кольце на тикер (~2 минуты)
+TRADE_HORIZON = 30  # сек, окно раннего всплеска
+TRADE_SUBSCRIBE_CHUNK = 10  # топиков в одном запросе подписки (лимит Bybit для спота)
+TRADE_PING_INTERVAL = 20  # сек, Bybit закрывает молчащее соединение
+SPARK_CANDLES = 24  # свечей в мини-графике объёма
+SPARK_CACHE = 5000  # тикеров с готовой картинкой мини-графика
+POPUP_AUTOHIDE = 5  # сек до скрытия панели уведомлений
+TELEGRAM_MAX_LENGTH = 4096
+
+HUB_PORT = 8787
+HUB_BIND = "127.0.0.1"  # только этот компьютер; 0.0.0.0 — раздача в локальную сеть, без авторизации
+HUB_QUEUE_LIMIT = 64  # неотправленных сообщений на подписчика, дальше он отключается
+
+ENRICH_TTL = 60  # сек, сколько живут OI/фандинг/стакан по тикеру
+ENRICH_MAX_PER_CYCLE = 20  # тикеров с доп. данными за цикл, самые сильные всплески первыми
+ENRICH_TIMEOUT = 5  # сек на стадию обогащения в цикле
+ENRICH_FIELDS = ["oi_change", "funding", "imbalance"]
+
+CANDLE_SECONDS = 900  # базовая свеча 15 минут, старшие таймфреймы собираются из неё
+CANDLE_RETAIN = 200  # свечей на тикер в памяти: ровно одна страница ответа биржи
+MIN_BASELINE_CANDLES = 4  # минимум свечей в окне для базовой линии
+TIMEFRAMES = {15: "15 мин", 30: "30 мин", 60: "1 час", 240: "4 часа"}
+BASELINES = {"mean": "Среднее", "median": "Медиана"}
+PROJECTIONS = {"off": "Выкл.", "linear": "Линейно", "curve": "По профилю объёма"}
+PROJECTION_FLOOR = 0.1  # минимальная ожидаемая доля объёма: прогноз не больше 10 объёмов свечи
+PROFILE_BINS = 12  # точек профиля набора объёма внутри свечи
+PROFILE_ALPHA = 0.2  # вес новой закрытой свечи в профиле
+PROFILE_MIN_ROWS = 20  # тикеров, нужных для обновления точки профиля
+CLUSTER_MIN_CORR = 0.6  # корреляция приращений log-объёма, при которой тикеры движутся вместе
+CLUSTER_MIN_SIZE = 3  # тикеров во всплеске, начиная с которых уведомление одно на группу
+CLUSTER_SHOW = 12  # тикеров, перечисляемых в групповом уведомлении
+SKETCH_GAMMA = 1.1  # соседние корзины скетча отличаются на 10%: квантиль с точностью (γ-1)/(γ+1) ≈ 4,8%
+                   # к точному квантилю с тем же забыванием старых свечей
+SKETCH_MIN_VOLUME = 1e-4  # верхняя граница первой корзины
+SKETCH_BINS = 400  # последняя корзина ~5e12
+SKETCH_MIN_CANDLES = 96  # сутки 15м свечей до первого порога
+QUANTILES = {0.95: "p95", 0.99: "p99", 0.999: "p99.9"}
+
+CYCLE_BUDGET = 0.8  # доля интервала обновления, отведённая на один цикл опроса
+STALE_AFTER_CYCLES = 2  # строка считается устаревшей, если не обновлялась столько интервалов
+
+class ExchangeAdapter:
+    # Описание площадки: эндпоинты, пагинация, разбор свечей, лимиты запросов и ссылки на график.
+    # Свечи приводятся к формату Bybit: [start_ms, open, high, low, close, volume, turnover],
+    # от самой свежей к самой старой, поэтому остальной код не зависит от площадки.
+    name = ""
+    tv_prefix = ""
+    kline_page_size = 200
+    rate_limit_rps = 10
+
+    def category(self, market):
+        # Категория в ключе тикера; у эталонной площадки (Bybit) она совпадает с рынком
+        return f"{self.name}-{market}"
+
+    def instruments_url(self, market, cursor=None):
+        raise NotImplementedError
+
+    def decode_instruments(self, data):
+        # -> (список символов, курсор следующей страницы или None)
+        raise NotImplementedError
+
+    def kline_url(self, symbol, market, start_ms, end_ms=None):
+        raise NotImplementedError
+
+    def decode_klines(self, data, market):
+        raise NotImplementedError
+
+    def tickers_url(self, market):
+        raise NotImplementedError
+
+    def decode_tickers(self, data, market):
+        # -> {symbol: {'turnover24h': оборот за 24ч в котируемой валюте, 'change24h': изменение цены в %}}
+        raise NotImplementedError
+
+    def enrichment_urls(self, symbol, market):
+        # Точечные запросы для тикера со всплеском: {вид: url}, разбираются decode_enrichment
+        return {}
+
+    def decode_enrichment(self, kind, data):
+        # -> часть полей ENRICH_FIELDS: 'oi_change' (% за час), 'funding' (%), 'imbalance' (% стакана)
+        return {}
+
+    def is_rate_limited(self, status, data):
+        return status == 429
+
+    def tv_symbol(self, symbol, market):
+        tv_symbol = f"{self.tv_prefix}:{symbol}"
+        if market == 'linear':
+            tv_symbol += '.P'
+        return tv_symbol
+
+    def chart_url(self, symbol, market):
+        return f"https://www.tradingview.com/chart/?symbol={self.tv_symbol(symbol, market)}"
+
+    async def fetch_instruments(self, get_json, market):
+        # get_json(url) -> разобранный JSON или None; подмена get_json позволяет
+        # проверять адаптер на записанных ответах без сети
+        symbols = []
+        cursor = None
+        while True:
+            data = await get_json(self.instruments_url(market, cursor))
+            if data is None:
+                break
+            page, cursor = self.decode_instruments(data)
+            symbols.extend(page)
+            if not cursor:
+                break
+        return symbols
+
+    async def fetch_klines(self, get_json, symbol, market, from_ts):
+        start_ms = int(from_ts) * 1000
+        klines = []
+        end_ms = None
+        while True:
+            data = await get_json(self.kline_url(symbol, market, start_ms, end_ms))
+            if data is None:
+                break
+            page = self.decode_klines(data, market)
+            klines.extend(page)
+            # Листаем назад, пока страница полная и окно не покрыто
+            if len(page) < self.kline_page_size or int(page[-1][0]) <= start_ms:
+                break
+            end_ms = int(page[-1][0]) - 1
+        return [k for k in klines if int(k[0]) >= start_ms]
+
+class BybitAdapter(ExchangeAdapter):
+    name = "bybit"
+    tv_prefix = "BYBIT"
+    kline_page_size = 200
+    rate_limit_rps = 100  # 600 запросов за 5 секунд на IP
+
+    def category(self, market):
+        return market
+
+    def instruments_url(self, market, cursor=None):
+        url = BYBIT_SYMBOLS_URL.format(category=market)
+        if cursor:
+            url += f"&cursor={quote(cursor)}"
+        return url
+
+    def decode_instruments(self, data):
+        result = data.get('result') or {}
+        symbols = [x['symbol'] for x in result.get('list', []) if x.get('status', 'Trading') == 'Trading']
+        return symbols, result.get('nextPageCursor') or None
+
+    def kline_url(self, symbol, market, start_ms, end_ms=None):
+        url = BYBIT_KLINE_URL.format(category=market, symbol=symbol, start_ms=start_ms, limit=self.kline_page_size)
+        if end_ms is not None:
+            url += f"&end={end_ms}"
+        return url
+
+    def decode_klines(self, data, market):
+        return (data.get('result') or {}).get('list', [])
+
+    def tickers_url(self, market):
+        return BYBIT_TICKERS_URL.format(category=market)
+
+    def decode_tickers(self, data, market):
+        return {x['symbol']: {'turnover24h': float(x.get('turnover24h') or 0),
+                              'change24h': float(x.get('price24hPcnt') or 0) * 100}
+                for x in (data.get('result') or {}).get('list', [])}
+
+    def enrichment_urls(self, symbol, market):
+        urls = {'orderbook': BYBIT_ORDERBOOK_URL.format(category=market, symbol=symbol)}
+        if market == 'linear':
+            urls['open_interest'] = BYBIT_OPEN_INTEREST_URL.format(category=market, symbol=symbol)
+            urls['ticker'] = BYBIT_TICKERS_URL.format(category=market) + f"&symbol={symbol}"
+        return urls
+
+    def decode_enrichment(self, kind, data):
+        result = data.get('result') or {}
+        if kind == 'orderbook':
+            return {'imbalance': book_imbalance(result.get('b', []), result.get('a', []))}
+        if kind == 'open_interest':
+            rows = result.get('list', [])  # от новых к старым
+            if len(rows) >= 2 and float(rows[1]['openInterest']):
+                return {'oi_change': (float(rows[0]['openInterest']) / float(rows[1]['openInterest']) - 1) * 100}
+        if kind == 'ticker':
+            rows = result.get('list', [])
+            if rows and rows[0].get('fundingRate'):
+                return {'funding': float(rows[0]['fundingRate']) * 100}
+        return {}
+
+    def is_rate_limited(self, status, data):
+        return status in (403, 429) or (isinstance(data, dict) and data.get('retCode') == 10006)
+
+class BinanceAdapter(ExchangeAdapter):
+    name = "binance"
+    tv_prefix = "BINANCE"
+    kline_page_size = 500
+    rate_limit_rps = 20  # вес 2400 в минуту, свеча стоит 2
+
+    def _base(self, market):
+        return "https://fapi.binance.com/fapi/v1" if market == 'linear' else "https://api.binance.com/api/v3"
+
+    def instruments_url(self, market, cursor=None):
+        return f"{self._base(market)}/exchangeInfo"
+
+    def decode_instruments(self, data):
+        symbols = []
+        for x in data.get('symbols', []):
+            # Пороги объёма в USD: пары к BTC, FDUSD и т. п. в вселенную не попадают
+            if x.get('status') != 'TRADING' or x.get('quoteAsset') != 'USDT':
+                continue
+            if 'contractType' in x and x['contractType'] != 'PERPETUAL':
+                continue
+            symbols.append(x['symbol'])
+        return symbols, None
+
+    def kline_url(self, symbol, market, start_ms, end_ms=None):
+        url = f"{self._base(market)}/klines?symbol={symbol}&interval=15m&limit={self.kline_page_size}"
+        # Binance отдаёт свечи от старых к новым, поэтому страницы листаются через endTime
+        if end_ms is not None:
+            url += f"&endTime={end_ms}"
+        return url
+
+    def decode_klines(self, data, market):
+        if not isinstance(data, list):
+            return []
+        # [open_time, o, h, l, c, volume, close_time, quote_volume, ...]
+        return [[k[0], k[1], k[2], k[3], k[4], k[5], k[7]] for k in reversed(data)]
+
+    def tickers_url(self, market):
+        return f"{self._base(market)}/ticker/24hr"
+
+    def decode_tickers(self, data, market):
+        if not isinstance(data, list):
+            return {}
+        return {x['symbol']: {'turnover24h': float(x.get('quoteVolume') or 0),
+                              'change24h': float(x.get('priceChangePercent') or 0)}
+                for x in data}
+
+    def enrichment_urls(self, symbol, market):
+        urls = {'orderbook': f"{self._base(market)}/depth?symbol={symbol}&limit=50"}
+        if market == 'linear':
+            urls['open_interest'] = f"https://fapi.binance.com/futures/data/openInterestHist?symbol={symbol}&period=1h&limit=2"
+            urls['funding'] = f"{self._base(market)}/premiumIndex?symbol={symbol}"
+        return urls
+
+    def decode_enrichment(self, kind, data):
+        if kind == 'orderbook':
+            return {'imbalance': book_imbalance(data.get('bids', []), data.get('asks', []))}
+        if kind == 'open_interest' and isinstance(data, list) and len(data) >= 2:
+            # от старых к новым
+            prev, last = float(data[-2]['sumOpenInterest']), float(data[-1]['sumOpenInterest'])
+            if prev:
+                return {'oi_change': (last / prev - 1) * 100}
+        if kind == 'funding' and data.get('lastFundingRate'):
+            return {'funding': float(data['lastFundingRate']) * 100}
+        return {}
+
+    def is_rate_limited(self, status, data):
+        return status in (418, 429)
+
+class OkxAdapter(ExchangeAdapter):
+    name = "okx"
+    tv_prefix = "OKX"
+    kline_page_size = 300
+    rate_limit_rps = 20  # 40 запросов за 2 секунды
+
+    def _inst_type(self, market):
+        return "SWAP" if market == 'linear' else "SPOT"
+
+    def instruments_url(self, market, cursor=None):
+        return f"https://www.okx.com/api/v5/public/instruments?instType={self._inst_type(market)}"
+
+    def decode_instruments(self, data):
+        symbols = [x['instId'] for x in data.get('data', [])
+                   if x.get('state') == 'live' and x['instId'].split('-')[1] in ('USDT', 'USDC')]
+        return symbols, None
+
+    def kline_url(self, symbol, market, start_ms, end_ms=None):
+        url = f"https://www.okx.com/api/v5/market/candles?instId={symbol}&bar=15m&limit={self.kline_page_size}"
+        if end_ms is not None:
+            url += f"&after={end_ms + 1}"
+        return url
+
+    def decode_klines(self, data, market):
+        rows = data.get('data', []) if isinstance(data, dict) else []
+        # [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]; у SWAP vol в контрактах,
+        # объём в базовой монете лежит в volCcy
+        vol_idx = 6 if market == 'linear' else 5
+        return [[k[0], k[1], k[2], k[3], k[4], k[vol_idx], k[7]] for k in rows]
+
+    def tickers_url(self, market):
+        return f"https://www.okx.com/api/v5/market/tickers?instType={self._inst_type(market)}"
+
+    def decode_tickers(self, data, market):
+        stats = {}
+        for x in data.get('data', []) if isinstance(data, dict) else []:
+            last = float(x.get('last') or 0)
+            open24h = float(x.get('open24h') or 0)
+            # volCcy24h: у SWAP в базовой монете, у SPOT уже в котируемой
+            turnover = float(x.get('volCcy24h') or 0)
+            if market == 'linear':
+                turnover *= last
+            stats[x['instId']] = {'turnover24h': turnover,
+                                  'change24h': (last / open24h - 1) * 100 if open24h else 0.0}
+        return stats
+
+    def enrichment_urls(self, symbol, market):
+        urls = {'orderbook': f"https://www.okx.com/api/v5/market/books?instId={symbol}&sz=50"}
+        if market == 'linear':
+            urls['open_interest'] = f"https://www.okx.com/api/v5/rubik/stat/contracts/open-interest-history?instId={symbol}&period=1H&limit=2"
+            urls['funding'] = f"https://www.okx.com/api/v5/public/funding-rate?instId={symbol}"
+        return urls
+
+    def decode_enrichment(self, kind, data):
+        rows = data.get('data', []) if isinstance(data, dict) else []
+        if not rows:
+            return {}
+        if kind == 'orderbook':
+            return {'imbalance': book_imbalance(rows[0].get('bids', []), rows[0].get('asks', []))}
+        if kind == 'open_interest' and len(rows) >= 2 and float(rows[1][1]):
+            # [ts, oi, oiCcy, oiUsd], от новых к старым
+            return {'oi_change': (float(rows[0][1]) / float(rows[1][1]) - 1) * 100}
+        if kind == 'funding' and rows[0].get('fundingRate'):
+            return {'funding': float(rows[0]['fundingRate']) * 100}
+        return {}
+
+    def is_rate_limited(self, status, data):
+        return status == 429 or (isinstance(data, dict) and data.get('code') == '50011')
+
+    def tv_symbol(self, symbol, market):
+        parts = symbol.split('-')
+        tv_symbol = f"{self.tv_prefix}:{parts[0]}{parts[1]}"
+        if market == 'linear':
+            tv_symbol += '.P'
+        return tv_symbol
+
+def book_imbalance(bids, asks):
+    # Перекос стакана в %: +100 — только покупатели, -100 — только продавцы
+    bid = sum(float(level[0]) * float(level[1]) for level in bids)
+    ask = sum(float(level[0]) * float(level[1]) for level in asks)
+    return (bid - ask) / (bid + ask) * 100 if bid + ask else None
+
+EXCHANGES = {adapter.name: adapter for adapter in (BybitAdapter(), BinanceAdapter(), OkxAdapter())}
+
+def resolve_category(category):
+    # Категория тикера -> (адаптер площадки, рынок spot/linear)
+    if '-' in category:
+        venue, market = category.split('-', 1)
+        return EXCHANGES[venue], market
+    return EXCHANGES["bybit"], category
+
+def category_market(category):
+    return category.split('-', 1)[-1]
 
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
@@ -62,9 +446,109 @@ class SettingsDialog(QDialog):
         self.candles_spin.setValue(parent.settings.get("mean_candles", 20))
         update_layout.addRow("Кол-во свечей для среднего:", self.candles_spin)
         
+        # Таймфрейм свечей и метод базовой линии — собираются из сохранённых 15м свечей
+        self.timeframe_combo = QComboBox()
+        for minutes, title in TIMEFRAMES.items():
+            self.timeframe_combo.addItem(title, minutes)
+        self.timeframe_combo.setCurrentIndex(max(0, self.timeframe_combo.findData(parent.settings.get("timeframe", 15))))
+        update_layout.addRow("Таймфрейм свечей:", self.timeframe_combo)
+        self.baseline_combo = QComboBox()
+        for method, title in BASELINES.items():
+            self.baseline_combo.addItem(title, method)
+        self.baseline_combo.setCurrentIndex(max(0, self.baseline_combo.findData(parent.settings.get("baseline", "mean"))))
+        update_layout.addRow("Базовая линия:", self.baseline_combo)
+        self.projection_combo = QComboBox()
+        for mode, title in PROJECTIONS.items():
+            self.projection_combo.addItem(title, mode)
+        self.projection_combo.setCurrentIndex(max(0, self.projection_combo.findData(parent.settings.get("projection", "off"))))
+        self.projection_combo.setToolTip("Объём незакрытой свечи делится на ожидаемую долю к текущему моменту: "
+                                         "линейно по прошедшему времени или по профилю, выученному на закрытых свечах")
+        update_layout.addRow("Прогноз текущей свечи:", self.projection_combo)
+        
+        # Долгий горизонт: квантиль 15м объёма тикера по потоковому скетчу
+        self.sketch_quantile_combo = QComboBox()
+        for q, title in QUANTILES.items():
+            self.sketch_quantile_combo.addItem(title, q)
+        self.sketch_quantile_combo.setCurrentIndex(max(0, self.sketch_quantile_combo.findData(parent.settings.get("sketch_quantile", 0.99))))
+        update_layout.addRow("Квантиль объёма 15м:", self.sketch_quantile_combo)
+        self.sketch_days_spin = QSpinBox()
+        self.sketch_days_spin.setRange(7, 90)
+        self.sketch_days_spin.setValue(parent.settings.get("sketch_days", 30))
+        self.sketch_days_spin.setToolTip("Свечи старше горизонта забываются постепенно; память не зависит от горизонта")
+        update_layout.addRow("Горизонт квантиля, дней:", self.sketch_days_spin)
+        
+        # Шардированное сканирование несколькими процессами
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(0, 32)
+        self.workers_spin.setValue(parent.settings.get("worker_processes", 0))
+        self.workers_spin.setSpecialValueText("выкл.")
+        update_layout.addRow("Процессов-сканеров:", self.workers_spin)
+        self.rate_limit_spin = QSpinBox()
+        self.rate_limit_spin.setRange(1, 120)
+        self.rate_limit_spin.setValue(parent.settings.get("rate_limit_rps", 50))
+        self.rate_limit_spin.setSuffix(" запр/сек")
+        update_layout.addRow("Лимит запросов (на все процессы):", self.rate_limit_spin)
+        self.universe_ttl_spin = QSpinBox()
+        self.universe_ttl_spin.setRange(1, 120)
+        self.universe_ttl_spin.setValue(parent.settings.get("universe_ttl", 5))
+        self.universe_ttl_spin.setSuffix(" мин")
+        update_layout.addRow("Проверка новых листингов:", self.universe_ttl_spin)
+        self.enrich_ratio_spin = QDoubleSpinBox()
+        self.enrich_ratio_spin.setRange(0, 100)
+        self.enrich_ratio_spin.setSingleStep(0.1)
+        self.enrich_ratio_spin.setValue(parent.settings.get("enrich_ratio", 1.5))
+        self.enrich_ratio_spin.setSpecialValueText("выкл.")
+        self.enrich_ratio_spin.setToolTip("OI, фандинг и стакан запрашиваются только для тикеров с кратностью не ниже этой")
+        update_layout.addRow("Доп. данные от кратности:", self.enrich_ratio_spin)
+        self.trade_ratio_spin = QDoubleSpinBox()
+        self.trade_ratio_spin.setRange(0, 100)
+        self.trade_ratio_spin.setSingleStep(0.5)
+        self.trade_ratio_spin.setValue(parent.settings.get("trade_ratio", 0.0))
+        self.trade_ratio_spin.setSpecialValueText("выкл.")
+        self.trade_ratio_spin.setToolTip(f"Лента сделок Bybit: уведомление, если объём за последние {TRADE_HORIZON} с "
+                                         "идёт во столько раз быстрее среднего темпа свечи")
+        update_layout.addRow("Ранний всплеск по ленте, темп:", self.trade_ratio_spin)
+        self.history_cb = QCheckBox("Сохранять историю циклов (папка history)")
+        self.history_cb.setChecked(parent.settings.get("history_enabled", True))
+        update_layout.addRow(self.history_cb)
+        
         update_group.setLayout(update_layout)
         layout.addWidget(update_group)
         
+        # Площадки
+        exchanges_group = QGroupBox("Площадки")
+        exchanges_layout = QHBoxLayout()
+        enabled = parent.settings.get("exchanges", "bybit").split(";")
+        self.exchange_cbs = {}
+        for name in EXCHANGES:
+            cb = QCheckBox(name.capitalize())
+            cb.setChecked(name in enabled)
+            exchanges_layout.addWidget(cb)
+            self.exchange_cbs[name] = cb
+        exchanges_group.setLayout(exchanges_layout)
+        layout.addWidget(exchanges_group)
+        
+        # Общий сканер для нескольких рабочих мест
+        hub_group = QGroupBox("Хаб")
+        hub_layout = QFormLayout()
+        self.hub_mode_combo = QComboBox()
+        for mode, title in (("off", "Выключен"), ("publish", "Раздавать данные"), ("subscribe", "Получать с хаба")):
+            self.hub_mode_combo.addItem(title, mode)
+        self.hub_mode_combo.setCurrentIndex(max(0, self.hub_mode_combo.findData(parent.settings.get("hub_mode", "off"))))
+        hub_layout.addRow("Режим:", self.hub_mode_combo)
+        self.hub_port_spin = QSpinBox()
+        self.hub_port_spin.setRange(1024, 65535)
+        self.hub_port_spin.setValue(parent.settings.get("hub_port", HUB_PORT))
+        hub_layout.addRow("Порт раздачи:", self.hub_port_spin)
+        self.hub_bind_edit = QLineEdit(parent.settings.get("hub_bind", HUB_BIND))
+        self.hub_bind_edit.setToolTip("127.0.0.1 — только этот компьютер. 0.0.0.0 или адрес сетевой карты открывают "
+                                      "состояние сканера всем, кто может подключиться к порту: авторизации нет")
+        hub_layout.addRow("Адрес раздачи:", self.hub_bind_edit)
+        self.hub_url_edit = QLineEdit(parent.settings.get("hub_url", f"ws://127.0.0.1:{HUB_PORT}/ws"))
+        hub_layout.addRow("Адрес хаба:", self.hub_url_edit)
+        hub_group.setLayout(hub_layout)
+        layout.addWidget(hub_group)
+        
         # Уведомления
         notify_group = QGroupBox("Уведомления")
         notify_layout = QVBoxLayout()
@@ -75,6 +559,15 @@ class SettingsDialog(QDialog):
         self.enable_popup_cb = QCheckBox("Всплывающие уведомления")
         self.enable_popup_cb.setChecked(parent.settings["enable_popup"])
         notify_layout.addWidget(self.enable_popup_cb)
+        popup_interval_layout = QFormLayout()
+        self.popup_interval_spin = QSpinBox()
+        self.popup_interval_spin.setRange(0, 600)
+        self.popup_interval_spin.setValue(parent.settings.get("popup_min_interval", 10))
+        self.popup_interval_spin.setSuffix(" сек")
+        popup_interval_layout.addRow("Показывать окно не чаще, чем раз в:", self.popup_interval_spin)
+        notify_layout.addLayout(popup_interval_layout)
+        notify_group.setLayout(notify_layout)
+        layout.addWidget(notify_group)
         
         # Telegram
         telegram_group = QGroupBox("Telegram уведомления")
@@ -95,14 +588,46 @@ class SettingsDialog(QDialog):
         self.test_telegram_btn = QPushButton("Отправить тестовое сообщение")
         self.test_telegram_btn.clicked.connect(self.send_test_telegram)
         telegram_layout.addRow(self.test_telegram_btn)
-        # Лимит журнала уведомлений
-        self.log_limit_spin = QSpinBox()
-        self.log_limit_spin.setRange(10, 500)
-        self.log_limit_spin.setValue(parent.settings.get("log_limit", 50))
-        telegram_layout.addRow("Лимит журнала:", self.log_limit_spin)
         telegram_group.setLayout(telegram_layout)
         layout.addWidget(telegram_group)
         
+        # Свои системы получают каждое уведомление JSON-ом; пустое поле — получатель выключен
+        sinks_group = QGroupBox("Внешние получатели")
+        sinks_layout = QFormLayout()
+        self.sink_webhook_edit = QLineEdit(parent.settings.get("sink_webhook_url", ""))
+        self.sink_webhook_edit.setPlaceholderText("https://... — POST пачки JSON-массивом")
+        sinks_layout.addRow("Webhook:", self.sink_webhook_edit)
+        self.sink_jsonl_edit = QLineEdit(parent.settings.get("sink_jsonl_path", ""))
+        self.sink_jsonl_edit.setPlaceholderText("alerts.jsonl — строка JSON на уведомление")
+        sinks_layout.addRow("Файл JSON Lines:", self.sink_jsonl_edit)
+        self.sink_socket_edit = QLineEdit(parent.settings.get("sink_socket_path", ""))
+        self.sink_socket_edit.setPlaceholderText("/tmp/volume_spikes.sock")
+        sinks_layout.addRow("Unix-сокет:", self.sink_socket_edit)
+        sinks_group.setLayout(sinks_layout)
+        layout.addWidget(sinks_group)
+        
+        # Правила уведомлений
+        rules_group = QGroupBox("Правила уведомлений")
+        rules_layout = QVBoxLayout()
+        rules_help = QLabel(
+            "Одно правило на строку: имя | выражение | пауза, мин | получатели (log, telegram, sound, popup)\n"
+            "Переменные: ratio, volume, mean, price, change, prev_ratio, streak, turnover24h, change24h,\n"
+            "ratio_pct, turnover_pct (перцентиль в категории, 0–100),\n"
+            "min_ratio, min_volume, symbol, market, exchange, quote;\n"
+            "с прогнозом: raw_ratio, raw_volume (факт незакрытой свечи), projected (1 — по прогнозу);\n"
+            "quantile (квантиль 15м объёма за горизонт), q_ratio (текущая 15м свеча в долях от него). Пример:\n"
+            "Мелкие перпы | ratio >= 3 and market == 'linear' and quote == 'USDT' and turnover24h < 50e6 | 30 | telegram"
+        )
+        rules_help.setWordWrap(True)
+        rules_layout.addWidget(rules_help)
+        self.rules_edit = QTextEdit()
+        self.rules_edit.setAcceptRichText(False)
+        self.rules_edit.setPlainText(parent.settings.get("alert_rules", DEFAULT_ALERT_RULES))
+        self.rules_edit.setMinimumHeight(80)
+        rules_layout.addWidget(self.rules_edit)
+        rules_group.setLayout(rules_layout)
+        layout.addWidget(rules_group)
+        
         # Размер шрифта интерфейса
         self.font_size_spin = QSpinBox()
         self.font_size_spin.setRange(8, 24)
@@ -133,19 +658,47 @@ class SettingsDialog(QDialog):
         buttons.rejected.connect(self.reject)
         layout.addWidget(buttons)
 
+    def accept(self):
+        try:
+            parse_alert_rules(self.rules_edit.toPlainText())
+        except RuleError as e:
+            QMessageBox.warning(self, "Ошибка в правилах", str(e))
+            return
+        super().accept()
+
     def get_settings(self):
         s = {
             "min_ratio": self.min_ratio_spin.value(),
             "min_volume": self.min_volume_spin.value(),
             "update_interval": self.update_interval_spin.value(),
             "mean_candles": self.candles_spin.value(),
+            "baseline": self.baseline_combo.currentData(),
+            "timeframe": self.timeframe_combo.currentData(),
+            "projection": self.projection_combo.currentData(),
+            "sketch_quantile": self.sketch_quantile_combo.currentData(),
+            "sketch_days": self.sketch_days_spin.value(),
+            "worker_processes": self.workers_spin.value(),
+            "rate_limit_rps": self.rate_limit_spin.value(),
+            "universe_ttl": self.universe_ttl_spin.value(),
+            "enrich_ratio": self.enrich_ratio_spin.value(),
+            "trade_ratio": self.trade_ratio_spin.value(),
+            "history_enabled": self.history_cb.isChecked(),
+            "alert_rules": self.rules_edit.toPlainText().strip() or DEFAULT_ALERT_RULES,
+            "exchanges": ";".join(name for name, cb in self.exchange_cbs.items() if cb.isChecked()) or "bybit",
+            "hub_mode": self.hub_mode_combo.currentData(),
+            "hub_port": self.hub_port_spin.value(),
+            "hub_bind": self.hub_bind_edit.text().strip() or HUB_BIND,
+            "hub_url": self.hub_url_edit.text().strip() or f"ws://127.0.0.1:{HUB_PORT}/ws",
             "enable_sound": self.enable_sound_cb.isChecked(),
             "enable_popup": self.enable_popup_cb.isChecked(),
+            "popup_min_interval": self.popup_interval_spin.value(),
             "telegram_token": self.telegram_token_edit.text().strip(),
             "telegram_chat_id": self.telegram_chat_id_edit.text().strip(),
             "telegram_thread_id": self.telegram_thread_id_edit.text().strip(),
             "enable_telegram": self.enable_telegram_cb.isChecked(),
-            "log_limit": self.log_limit_spin.value(),
+            "sink_webhook_url": self.sink_webhook_edit.text().strip(),
+            "sink_jsonl_path": self.sink_jsonl_edit.text().strip(),
+            "sink_socket_path": self.sink_socket_edit.text().strip(),
             "font_size": self.font_size_spin.value(),
             "font_size_table": self.font_size_table_spin.value(),
             "font_size_panel": self.font_size_panel_spin.value(),
@@ -179,6 +732,181 @@ class SettingsDialog(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Ошибка Telegram: {e}")
 
+LOG_LINE_RE = re.compile(r"^\[(\d{4}-\d\d-\d\d) [\d:]+\] (\S+) \(([^)]*)\)(?: \[[^\]]*\])? - ([\d.]+)x")
+LOG_PAGE = 200  # строк журнала, читаемых за одно обращение к файлу
+LOG_SCAN_STEP = 20000  # строк за один шаг фильтрации между перерисовками
+
+class LogIndex:
+    # Индекс журнала (файл только дописывается): смещения концов строк лежат рядом
+    # в <журнал>.idx, при открытии дочитывается только новый хвост файла
+    def __init__(self, path):
+        from array import array
+        self.path = path
+        self.index_path = path + ".idx"
+        self.ends = array('q')
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                self.ends.frombytes(f.read())
+        if self.ends and not self.valid():
+            del self.ends[:]
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        self.refresh()
+
+    def valid(self):
+        # Журнал могли удалить или переписать — тогда индекс строится заново
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.ends[-1]:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self.ends[-1] - 1)
+            return f.read(1) == b"\n"
+
+    def refresh(self):
+        # -> число новых строк
+        if not os.path.exists(self.path):
+            return 0
+        start = self.ends[-1] if self.ends else 0
+        new = []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            pos = start
+            while True:
+                chunk = f.read(1 << 22)
+                if not chunk:
+                    break
+                new.extend((np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10) + pos + 1).tolist())
+                pos += len(chunk)
+        if new:
+            self.ends.extend(new)
+            with open(self.index_path, "ab") as f:
+                f.write(self.ends[-len(new):].tobytes())
+        return len(new)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def read_lines(self, lo, hi):
+        # Строки [lo, hi) одним чтением
+        if lo >= hi:
+            return []
+        start = self.ends[lo - 1] if lo > 0 else 0
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(self.ends[hi - 1] - start)
+        return data.decode("utf-8", errors="replace").split("\n")[:-1]
+
+    def bisect_date(self, date_str):
+        # Первая строка с датой >= date_str (ГГГГ-ММ-ДД); журнал упорядочен по времени
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.read_lines(mid, mid + 1)[0][1:11] < date_str:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+def migrate_notification_log(path):
+    # Старый журнал хранился от новых записей к старым и переписывался целиком;
+    # теперь он только дописывается, поэтому старый файл один раз разворачивается
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f:
+        first = f.readline()
+        f.seek(max(0, os.path.getsize(path) - 4096))
+        last = f.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    if first[1:20] <= last[1:20]:
+        return
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        for line in reversed(lines):
+            f.write(line + "\n")
+    os.replace(path + ".tmp", path)
+    if os.path.exists(path + ".idx"):
+        os.remove(path + ".idx")
+
+class LogFilter:
+    def __init__(self, symbol="", category="", ratio_min=0.0, ratio_max=0.0, date_from=None, date_to=None):
+        self.symbol = symbol.upper()
+        self.category = category
+        self.ratio_min = ratio_min
+        self.ratio_max = ratio_max
+        self.date_from = date_from  # "ГГГГ-ММ-ДД" или None
+        self.date_to = date_to
+
+    def active(self):
+        return bool(self.symbol or self.category or self.ratio_min or self.ratio_max or self.date_from or self.date_to)
+
+    def match(self, line):
+        m = LOG_LINE_RE.match(line)
+        if m is None:
+            return False
+        date, symbol, category, ratio = m.group(1), m.group(2), m.group(3), float(m.group(4))
+        return ((not self.symbol or self.symbol in symbol.upper()) and
+                (not self.category or category == self.category) and
+                ratio >= self.ratio_min and (not self.ratio_max or ratio <= self.ratio_max) and
+                (not self.date_from or date >= self.date_from) and
+                (not self.date_to or date <= self.date_to))
+
+class LogListModel(QAbstractListModel):
+    # Список строк журнала, новые сверху. Строки читаются из файла страницами
+    # только для видимой части списка; при фильтре хранятся лишь номера строк
+    def __init__(self, log_index, parent=None):
+        super().__init__(parent)
+        self.log_index = log_index
+        self.total = len(log_index)
+        self.rows = None  # None — все строки, иначе номера строк от новых к старым
+        self.cache = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return self.total if self.rows is None else len(self.rows)
+
+    def line_no(self, row):
+        return self.total - 1 - row if self.rows is None else self.rows[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        line_no = self.line_no(index.row())
+        if line_no not in self.cache:
+            if len(self.cache) > 20 * LOG_PAGE:
+                self.cache.clear()
+            lo = line_no // LOG_PAGE * LOG_PAGE
+            for i, line in enumerate(self.log_index.read_lines(lo, min(lo + LOG_PAGE, self.total)), lo):
+                self.cache[i] = line
+        return self.cache.get(line_no, "")
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def append_rows(self, line_numbers):
+        if line_numbers:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(line_numbers) - 1)
+            self.rows.extend(line_numbers)
+            self.endInsertRows()
+
+    def follow(self, log_filter):
+        # Дочитать новые строки журнала и добавить их сверху
+        old_total = self.total
+        if not self.log_index.refresh():
+            return
+        new_total = len(self.log_index)
+        if self.rows is None:
+            self.beginInsertRows(QModelIndex(), 0, new_total - old_total - 1)
+            self.total = new_total
+            self.endInsertRows()
+            return
+        self.total = new_total
+        lines = self.log_index.read_lines(old_total, new_total)
+        matches = [old_total + i for i in reversed(range(len(lines))) if log_filter.match(lines[i])]
+        if matches:
+            self.beginInsertRows(QModelIndex(), 0, len(matches) - 1)
+            self.rows[:0] = matches
+            self.endInsertRows()
+
 class NotificationLogDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -186,141 +914,2397 @@ class NotificationLogDialog(QDialog):
         self.setMinimumWidth(600)
         self.setMinimumHeight(400)
         layout = QVBoxLayout(self)
-        self.text_edit = QTextEdit(self)
-        self.text_edit.setReadOnly(True)
-        layout.addWidget(self.text_edit)
-        self.load_log()
-        log_font = self.text_edit.font()
+        
+        # Фильтры
+        filter_layout = QHBoxLayout()
+        self.symbol_edit = QLineEdit()
+        self.symbol_edit.setPlaceholderText("Тикер")
+        filter_layout.addWidget(self.symbol_edit)
+        self.category_combo = QComboBox()
+        self.category_combo.addItem("Все рынки", "")
+        for adapter in EXCHANGES.values():
+            for market in CATEGORIES:
+                self.category_combo.addItem(adapter.category(market), adapter.category(market))
+        filter_layout.addWidget(self.category_combo)
+        self.ratio_min_spin = QDoubleSpinBox()
+        self.ratio_min_spin.setRange(0, 1000)
+        self.ratio_min_spin.setPrefix("от ")
+        self.ratio_min_spin.setSuffix("x")
+        filter_layout.addWidget(self.ratio_min_spin)
+        self.ratio_max_spin = QDoubleSpinBox()
+        self.ratio_max_spin.setRange(0, 1000)
+        self.ratio_max_spin.setSpecialValueText("до ∞")
+        self.ratio_max_spin.setPrefix("до ")
+        self.ratio_max_spin.setSuffix("x")
+        filter_layout.addWidget(self.ratio_max_spin)
+        self.date_cb = QCheckBox("Даты:")
+        filter_layout.addWidget(self.date_cb)
+        self.date_from_edit = QDateEdit(QDate.currentDate().addDays(-7))
+        self.date_from_edit.setCalendarPopup(True)
+        filter_layout.addWidget(self.date_from_edit)
+        self.date_to_edit = QDateEdit(QDate.currentDate())
+        self.date_to_edit.setCalendarPopup(True)
+        filter_layout.addWidget(self.date_to_edit)
+        layout.addLayout(filter_layout)
+        
+        migrate_notification_log(NOTIFICATION_LOG_FILE)
+        self.log_index = LogIndex(NOTIFICATION_LOG_FILE)
+        self.model = LogListModel(self.log_index, self)
+        # Таблица с одной колонкой и строками фиксированной высоты: в отличие от QListView
+        # раскладка не перебирает все строки, поэтому открытие не зависит от размера журнала
+        self.log_view = QTableView(self)
+        self.log_view.setModel(self.model)
+        self.log_view.horizontalHeader().hide()
+        self.log_view.horizontalHeader().setStretchLastSection(True)
+        self.log_view.verticalHeader().hide()
+        self.log_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.log_view.setShowGrid(False)
+        self.log_view.setWordWrap(False)
+        self.log_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.log_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.log_view)
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        
+        self.log_filter = LogFilter()
+        self.filter_task = None
+        # Фильтр применяется после паузы в вводе
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        for signal in (self.symbol_edit.textChanged, self.category_combo.currentIndexChanged,
+                       self.ratio_min_spin.valueChanged, self.ratio_max_spin.valueChanged,
+                       self.date_cb.stateChanged, self.date_from_edit.dateChanged, self.date_to_edit.dateChanged):
+            signal.connect(lambda *_: self.filter_timer.start(300))
+        
+        log_font = self.log_view.font()
         log_font.setPointSize(parent.settings.get("font_size_log", 12))
-        self.text_edit.setFont(log_font)
+        self.set_log_font(log_font)
+        self.update_status()
         self.restore_log_window_geometry()
-    def load_log(self):
-        limit = getattr(self.parent(), 'settings', {}).get('log_limit', 50) if self.parent() else 50
-        if os.path.exists(NOTIFICATION_LOG_FILE):
-            with open(NOTIFICATION_LOG_FILE, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-                self.text_edit.setPlainText(''.join(lines[:limit]))
+
+    def set_log_font(self, font):
+        self.log_view.setFont(font)
+        self.log_view.verticalHeader().setDefaultSectionSize(QFontMetrics(font).height() + 4)
+
+    def update_status(self, scanning=False):
+        shown = self.model.rowCount()
+        text = f"Записей: {shown}" if self.model.rows is None else f"Найдено: {shown} из {self.model.total}"
+        self.status_label.setText(text + (" (поиск...)" if scanning else ""))
+
+    def apply_filter(self):
+        date_on = self.date_cb.isChecked()
+        self.log_filter = LogFilter(
+            self.symbol_edit.text().strip(),
+            self.category_combo.currentData(),
+            self.ratio_min_spin.value(),
+            self.ratio_max_spin.value(),
+            self.date_from_edit.date().toString("yyyy-MM-dd") if date_on else None,
+            self.date_to_edit.date().toString("yyyy-MM-dd") if date_on else None,
+        )
+        if self.filter_task is not None:
+            self.filter_task.cancel()
+            self.filter_task = None
+        if not self.log_filter.active():
+            self.model.set_rows(None)
+            self.update_status()
+            return
+        self.model.set_rows([])
+        self.filter_task = asyncio.ensure_future(self.scan(self.log_filter))
+
+    async def scan(self, log_filter):
+        # Просмотр от новых строк к старым порциями: результаты видны сразу, окно не подвисает
+        lo, hi = 0, self.model.total
+        if log_filter.date_from:
+            lo = self.log_index.bisect_date(log_filter.date_from)
+        if log_filter.date_to:
+            next_day = (datetime.strptime(log_filter.date_to, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            hi = min(hi, self.log_index.bisect_date(next_day))
+        pos = hi
+        while pos > lo:
+            start = max(lo, pos - LOG_SCAN_STEP)
+            lines = self.log_index.read_lines(start, pos)
+            self.model.append_rows([start + i for i in reversed(range(len(lines))) if log_filter.match(lines[i])])
+            pos = start
+            self.update_status(scanning=pos > lo)
+            await asyncio.sleep(0)
+        self.update_status()
+
+    def follow(self):
+        # Новые записи появляются сверху, с учётом текущего фильтра
+        if self.filter_task is not None and not self.filter_task.done():
+            self.filter_timer.start(0)  # идёт поиск — проще перезапустить его с новыми строками
+            return
+        self.model.follow(self.log_filter)
+        self.update_status()
+
+    def restore_log_window_geometry(self):
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
+        geometry = settings.value("log_window_geometry")
+        if geometry:
+            self.restoreGeometry(geometry)
+        pos = settings.value("log_window_pos")
+        if pos:
+            self.move(pos)
+
+    def closeEvent(self, event):
+        if self.filter_task is not None:
+            self.filter_task.cancel()
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
+        settings.setValue("log_window_geometry", self.saveGeometry())
+        settings.setValue("log_window_pos", self.pos())
+        super().closeEvent(event)
+
+RULE_VARIABLES = {
+    # числовые
+    "ratio", "volume", "mean", "price", "change", "prev_ratio", "streak",
+    "turnover24h", "change24h", "min_ratio", "min_volume",
+    "ratio_pct", "turnover_pct", "raw_volume", "raw_ratio", "projected", "quantile", "q_ratio",
+    # строковые
+    "symbol", "market", "exchange", "quote",
+}
+RULE_DESTINATIONS = ["log", "telegram", "sound", "popup"]
+DEFAULT_ALERT_RULES = "Основное | ratio >= min_ratio and volume >= min_volume | 0 | log,telegram,sound,popup"
+
+class RuleError(Exception):
+    pass
+
+class _RuleCompiler(ast.NodeTransformer):
+    # Переписывает выражение правила в векторные операции над массивами:
+    # and/or/not -> & | ~, цепочки сравнений -> конъюнкция, in -> np.isin
+    ALLOWED_BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+    ALLOWED_CMPOPS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq, ast.In, ast.NotIn)
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.Load, ast.Tuple, ast.List)):
+            raise RuleError(f"недопустимая конструкция: {type(node).__name__}")
+        return super().generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id not in RULE_VARIABLES:
+            raise RuleError(f"неизвестная переменная: {node.id}")
+        return node
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (int, float, str)) or isinstance(node.value, bool):
+            raise RuleError(f"недопустимая константа: {node.value!r}")
+        return node
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(v) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=self.visit(node.operand))
+        if isinstance(node.op, ast.USub):
+            return ast.UnaryOp(op=ast.USub(), operand=self.visit(node.operand))
+        raise RuleError("недопустимый унарный оператор")
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, self.ALLOWED_BINOPS):
+            raise RuleError("недопустимый арифметический оператор")
+        return ast.BinOp(left=self.visit(node.left), op=node.op, right=self.visit(node.right))
+
+    def visit_Compare(self, node):
+        parts = []
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            if not isinstance(op, self.ALLOWED_CMPOPS):
+                raise RuleError("недопустимое сравнение")
+            right = self.visit(comparator)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, (ast.Tuple, ast.List)):
+                    raise RuleError("после in ожидается список значений")
+                part = ast.Call(func=ast.Name(id="_isin", ctx=ast.Load()),
+                                args=[left, ast.List(elts=right.elts, ctx=ast.Load())], keywords=[])
+                if isinstance(op, ast.NotIn):
+                    part = ast.UnaryOp(op=ast.Invert(), operand=part)
+            else:
+                part = ast.Compare(left=left, ops=[op], comparators=[right])
+            parts.append(part)
+            left = right
+        result = parts[0]
+        for part in parts[1:]:
+            result = ast.BinOp(left=result, op=ast.BitAnd(), right=part)
+        return result
+
+def compile_rule_expression(expression):
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"синтаксическая ошибка: {e.msg}")
+    tree = ast.fix_missing_locations(_RuleCompiler().visit(tree))
+    code = compile(tree, "<rule>", "eval")
+
+    def evaluate(env):
+        mask = eval(code, {"__builtins__": {}, "_isin": np.isin}, env)
+        n = len(env["ratio"])
+        return np.broadcast_to(np.asarray(mask, dtype=bool), (n,))
+    return evaluate
+
+class AlertRule:
+    def __init__(self, name, expression, cooldown=0, destinations=None):
+        self.name = name
+        self.expression = expression
+        self.cooldown = cooldown  # минуты
+        self.destinations = set(destinations or RULE_DESTINATIONS)
+        self.evaluate = compile_rule_expression(expression)
+
+def parse_alert_rules(text):
+    # Одно правило на строку: имя | выражение | пауза, мин | получатели через запятую
+    rules = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) < 2:
+            raise RuleError(f"строка {line_no}: ожидается «имя | выражение | пауза | получатели»")
+        name, expression = parts[0], parts[1]
+        try:
+            cooldown = float(parts[2]) if len(parts) > 2 and parts[2] else 0
+        except ValueError:
+            raise RuleError(f"строка {line_no}: пауза должна быть числом")
+        destinations = [d.strip() for d in parts[3].split(",") if d.strip()] if len(parts) > 3 else None
+        unknown = set(destinations or []) - set(RULE_DESTINATIONS)
+        if unknown:
+            raise RuleError(f"строка {line_no}: неизвестные получатели {', '.join(sorted(unknown))}")
+        try:
+            rules.append(AlertRule(name, expression, cooldown, destinations))
+        except RuleError as e:
+            raise RuleError(f"строка {line_no} ({name}): {e}")
+    return rules
+
+RANK_GRID = 100      # точность перцентилей для больших категорий (1%)
+RANK_EXACT_LIMIT = 512  # до этого размера категории ранг считается точно
+TOP_K = 10
+
+def percentile_ranks(values, groups):
+    # Перцентиль значения внутри своей группы (категории), 0..100; NaN — нет данных.
+    # Для больших групп без полной сортировки: сетка квантилей (partition) + searchsorted
+    ranks = np.full(len(values), np.nan)
+    for group in set(groups.tolist()):
+        idx = np.flatnonzero(groups == group)
+        sample = values[idx]
+        finite = np.isfinite(sample)
+        if not finite.any():
+            continue
+        known = sample[finite]
+        if len(known) <= RANK_EXACT_LIMIT:
+            grid = np.sort(known)
+            pct = np.searchsorted(grid, sample, side='right') / len(grid) * 100
+        else:
+            grid = np.quantile(known, np.linspace(0, 1, RANK_GRID + 1))
+            pct = np.clip(np.searchsorted(grid, sample, side='right') - 1, 0, RANK_GRID) * (100 / RANK_GRID)
+        ranks[idx] = np.where(finite, pct, np.nan)
+    return ranks
+
+def top_k_indices(values, k):
+    # Индексы k наибольших значений по убыванию: частичная сортировка O(n) + сортировка k
+    if len(values) <= k:
+        return np.argsort(-values, kind='stable')
+    part = np.argpartition(-values, k)[:k]
+    return part[np.argsort(-values[part], kind='stable')]
+
+class AlertRuleEngine:
+    # Все правила вычисляются одним проходом: состояние тикеров собирается в колонки
+    # numpy, каждое правило даёт булеву маску по всей вселенной сразу
+    def __init__(self):
+        self.rules = []
+        self.last_fired = {}  # (правило, ключ) -> время последнего срабатывания
+
+    def set_rules(self, text):
+        self.rules = parse_alert_rules(text)
+
+    @staticmethod
+    def build_state(ticker_data, market_stats, settings):
+        keys = [k for k, v in ticker_data.items() if v.get('datetime') and not v.get('from_snapshot')]
+        rows = [ticker_data[k] for k in keys]
+        n = len(rows)
+        col = lambda name, default=0.0: np.fromiter(((r.get(name) or default) for r in rows), dtype=np.float64, count=n)
+        volume, mean, price, open_ = col('volume'), col('mean'), col('price'), col('open')
+        ratio = col('ratio')
+        raw_volume, raw_ratio = volume, ratio
+        if settings["projection"] != "off":
+            # Незакрытая свеча оценивается по прогнозу итогового объёма
+            volume = np.fromiter((r.get('proj_volume') or r['volume'] for r in rows), dtype=np.float64, count=n)
+            ratio = np.fromiter((r.get('proj_ratio') or r['ratio'] for r in rows), dtype=np.float64, count=n)
+        prev_ratio = col('prev_volume') / (mean + 1e-9)
+        prev2_ratio = col('prev2_volume') / (mean + 1e-9)
+        min_ratio = settings["min_ratio"]
+        # Сколько последних свечей подряд (включая текущую) выше минимальной кратности
+        streak = ((ratio >= min_ratio).astype(np.int64) *
+                  (1 + (prev_ratio >= min_ratio) * (1 + (prev2_ratio >= min_ratio))))
+        stats = [market_stats.get(k, {}) for k in keys]
+        categories = np.array([k[1] for k in keys], dtype=object)
+        env = {
+            "ratio": ratio,
+            "volume": volume,
+            "mean": mean,
+            "price": price,
+            "change": np.where(open_ > 0, (price / np.where(open_ > 0, open_, 1.0) - 1) * 100, 0.0),
+            "prev_ratio": prev_ratio,
+            "streak": streak,
+            # Фактические объём и кратность незакрытой свечи; projected — кратность взята из прогноза
+            "raw_volume": raw_volume,
+            "raw_ratio": raw_ratio,
+            "projected": (ratio > raw_ratio).astype(np.float64),
+            # Квантиль 15м объёма тикера за горизонт и текущая 15м свеча в долях от него (NaN — мало данных)
+            "quantile": col('quantile', np.nan),
+            "q_ratio": col('q_ratio', np.nan),
+            "turnover24h": np.fromiter((st.get('turnover24h', np.nan) for st in stats), dtype=np.float64, count=n),
+            "change24h": np.fromiter((st.get('change24h', np.nan) for st in stats), dtype=np.float64, count=n),
+            # Место тикера среди своей категории: ранг кратности и оборота свечи
+            "ratio_pct": percentile_ranks(ratio, categories),
+            "turnover_pct": percentile_ranks(volume * price, categories),
+            "min_ratio": min_ratio,
+            "min_volume": settings["min_volume"],
+            "symbol": np.array([k[0] for k in keys], dtype=object),
+            "market": np.array([category_market(k[1]) for k in keys], dtype=object),
+            "exchange": np.array([resolve_category(k[1])[0].name for k in keys], dtype=object),
+            "quote": np.array([quote_currency(k[0]) for k in keys], dtype=object),
+        }
+        return keys, env
+
+    @staticmethod
+    def confirmed_env(env):
+        # Те же переменные по фактическому объёму: проверка подтверждения и запись истории
+        return dict(env, volume=env["raw_volume"], ratio=env["raw_ratio"])
+
+    def evaluate(self, keys, env, now, pending=frozenset()):
+        # -> список (правило, индексы сработавших тикеров) с учётом пауз правил;
+        # pending — пары (правило, ключ), ждущие подтверждения уже отправленного прогноза:
+        # пауза их не глушит, иначе подтверждение той же свечи не пришло бы никогда
+        fired = []
+        for rule in self.rules:
+            try:
+                idx = np.flatnonzero(rule.evaluate(env))
+            except Exception as e:
+                print(f"[Правила] Ошибка вычисления «{rule.name}»: {e}")
+                continue
+            if rule.cooldown > 0:
+                idx = [i for i in idx
+                       if now - self.last_fired.get((rule.name, keys[i]), 0) >= rule.cooldown * 60
+                       or (rule.name, keys[i]) in pending]
+            fired.append((rule, idx))
+        return fired
+
+    def mark_fired(self, rule, key, now):
+        self.last_fired[(rule.name, key)] = now
+
+    def forget(self, keys):
+        # Делистингованные тикеры не должны копиться в паузах правил
+        self.last_fired = {k: v for k, v in self.last_fired.items() if k[1] not in keys}
+
+def quote_currency(symbol):
+    for quote_ccy in ("USDT", "USDC", "USD", "BTC", "ETH", "EUR"):
+        if symbol.replace("-SWAP", "").replace("-", "").endswith(quote_ccy):
+            return quote_ccy
+    return ""
+
+class NotificationPanel(QDialog):
+    # Одно немодальное окно для всех уведомлений: новые строки добавляются сверху,
+    # окно поднимается не чаще, чем раз в popup_min_interval секунд
+    MAX_ITEMS = 200
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("Уведомления")
+        self.setModal(False)
+        self.setMinimumWidth(600)
+        self.setMinimumHeight(300)
+        layout = QVBoxLayout(self)
+        self.header = QLabel()
+        layout.addWidget(self.header)
+        self.list_widget = QListWidget(self)
+        layout.addWidget(self.list_widget)
+        btn_box = QDialogButtonBox(QDialogButtonBox.Ok)
+        btn_box.accepted.connect(self.hide)
+        layout.addWidget(btn_box)
+        self.last_presented = 0.0
+        self.unseen = 0
+        # Авто-скрытие, таймер переиспользуется
+        self.hide_timer = QTimer(self)
+        self.hide_timer.setSingleShot(True)
+        self.hide_timer.timeout.connect(self.hide)
+
+    def add_alerts(self, entries):
+        for entry in entries:
+            self.list_widget.insertItem(0, QListWidgetItem(entry))
+        while self.list_widget.count() > self.MAX_ITEMS:
+            self.list_widget.takeItem(self.list_widget.count() - 1)
+        self.unseen += len(entries)
+        self.header.setText(f"<b>Новых уведомлений: {self.unseen}</b> (последнее в {datetime.now().strftime('%H:%M:%S')})")
+
+    def present(self, min_interval):
+        now = time.time()
+        if self.isVisible() or now - self.last_presented >= min_interval:
+            if not self.isVisible():
+                self.show()
+                self.raise_()
+            self.last_presented = now
+            self.hide_timer.start(POPUP_AUTOHIDE * 1000)
+
+    def hideEvent(self, event):
+        self.unseen = 0
+        super().hideEvent(event)
+
+TRACE_STAGES = ["candle_open", "fetch_start", "fetch_end", "detected", "enqueued", "telegram_ack", "displayed"]
+
+@functools.lru_cache(maxsize=None)
+def trace_dtype():
+    # Запись пути уведомления; строится при первом обращении — numpy не нужен до показа окна
+    return np.dtype([("symbol", "S24"), ("category", "S16")] + [(stage, "<f8") for stage in TRACE_STAGES])
+
+TRACE_SEGMENTS = [
+    # (название, от, до); delivered — первая доставка: Telegram или окно, иначе постановка в очередь
+    ("ожидание опроса", "candle_open", "fetch_start"),
+    ("запрос свечей", "fetch_start", "fetch_end"),
+    ("обработка цикла", "fetch_end", "detected"),
+    ("до очереди", "detected", "enqueued"),
+    ("Telegram", "enqueued", "telegram_ack"),
+    ("окно", "enqueued", "displayed"),
+    ("итого от открытия свечи", "candle_open", "delivered"),
+]
+
+class AlertTraceLog:
+    # Путь каждого уведомления от открытия свечи до доставки: записи trace_dtype()
+    # (NaN — стадии не было) дописываются в TRACE_FILE, последние держатся в памяти
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self.recent = np.zeros(0, dtype=trace_dtype())
+        if os.path.exists(path):
+            try:
+                self.recent = self.load(path)[-TRACE_RECENT:]
+            except (OSError, ValueError) as e:
+                print(f"Не удалось прочитать {path}: {e}")
+
+    @staticmethod
+    def load(path):
+        records = np.memmap(path, dtype=np.uint8, mode="r")
+        dtype = trace_dtype()
+        n = len(records) // dtype.itemsize
+        return np.array(records[:n * dtype.itemsize]).view(dtype)
+
+    @staticmethod
+    def new(data, detected):
+        trace = dict.fromkeys(TRACE_STAGES, np.nan)
+        trace.update(symbol=data['symbol'], category=data['category'], detected=detected,
+                     candle_open=data.get('candle_ts') or np.nan,
+                     fetch_start=data.get('fetch_started') or np.nan,
+                     fetch_end=data.get('updated_at') or np.nan)
+        return trace
+
+    def append(self, traces):
+        if not traces:
+            return
+        records = np.zeros(len(traces), dtype=trace_dtype())
+        for i, trace in enumerate(traces):
+            records[i] = (trace['symbol'].encode()[:24], trace['category'].encode()[:16],
+                          *(trace[stage] for stage in TRACE_STAGES))
+        try:
+            with open(self.path, "ab") as f:
+                records.tofile(f)
+        except OSError as e:
+            print(f"Ошибка записи {self.path}: {e}")
+        self.recent = np.concatenate([self.recent, records])[-TRACE_RECENT:]
+
+    @staticmethod
+    def segments(records):
+        # -> {название: длительности в секундах} по записям, где обе стадии были
+        stages = {stage: records[stage] for stage in TRACE_STAGES}
+        delivered = np.fmin(stages["telegram_ack"], stages["displayed"])
+        stages["delivered"] = np.where(np.isnan(delivered), stages["enqueued"], delivered)
+        result = {}
+        for name, start, end in TRACE_SEGMENTS:
+            values = stages[end] - stages[start]
+            result[name] = values[np.isfinite(values)]
+        return result
+
+    @classmethod
+    def table(cls, records):
+        lines = [f"{'участок':<26}{'уведомл.':>9}{'p50':>9}{'p90':>9}{'p99':>9}"]
+        for name, values in cls.segments(records).items():
+            if len(values):
+                p50, p90, p99 = np.percentile(values, [50, 90, 99])
+                lines.append(f"{name:<26}{len(values):>9}{format_delay(p50):>9}{format_delay(p90):>9}{format_delay(p99):>9}")
+            else:
+                lines.append(f"{name:<26}{0:>9}{'—':>9}{'—':>9}{'—':>9}")
+        return "\n".join(lines)
+
+    def summary(self):
+        total = self.segments(self.recent)["итого от открытия свечи"] if len(self.recent) else np.zeros(0)
+        if not len(total):
+            return "Задержка уведомлений: нет данных"
+        p50, p90 = np.percentile(total, [50, 90])
+        return (f"Задержка уведомлений от открытия свечи: p50 {format_delay(p50)}, p90 {format_delay(p90)} "
+                f"(последние {len(total)})")
+
+def format_delay(seconds):
+    return f"{seconds:.1f} с" if seconds < 60 else f"{seconds / 60:.1f} мин"
+
+ALERT_FIELDS = ["type", "time", "symbol", "category", "exchange", "rule", "tag", "flag",
+                "ratio", "volume", "price", "candle_ts", "members", "text"]
+
+def alert_payload(alert):
+    # Уведомление для внешних систем: только данные, без служебных полей шины
+    return {field: alert[field] for field in ALERT_FIELDS if field in alert}
+
+class AlertSink:
+    # Получатель уведомлений шины: своя ограниченная очередь, окно сборки пачки и политика
+    # переполнения. Публикация никогда не ждёт получателя: при полной очереди теряется самое
+    # старое (drop_oldest) или новое (drop_newest) уведомление, пачки доставляются своей задачей
+    def __init__(self, name, queue_size=1000, window=0.5, max_batch=100, policy="drop_oldest"):
+        from collections import deque
+        self.name = name
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.window = window
+        self.max_batch = max_batch
+        self.policy = policy
+        self.dropped = 0
+        self.delivered = 0
+        self.ready = None
+        self.task = None
+
+    def accepts(self, alert):
+        return True
+
+    def offer(self, alert):
+        # -> уведомления, вытесненные из очереди
+        if self.ready is None:
+            self.ready = asyncio.Event()
+        if len(self.queue) >= self.queue_size:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                print(f"[{self.name}] Очередь полна, потеряно уведомлений: {self.dropped}")
+            if self.policy == "drop_newest":
+                return [alert]
+            victim = self.queue.popleft()
+            self.queue.append(alert)
+            return [victim]
+        self.queue.append(alert)
+        self.ready.set()
+        return []
+
+    async def run(self, on_done):
+        while True:
+            await self.ready.wait()
+            await asyncio.sleep(self.window)  # окно: уведомления одного прохода уходят одной пачкой
+            batch = [self.queue.popleft() for _ in range(min(self.max_batch, len(self.queue)))]
+            if not self.queue:
+                self.ready.clear()
+            try:
+                await self.deliver(batch)
+                self.delivered += len(batch)
+            except asyncio.CancelledError:
+                on_done(batch)
+                raise
+            except Exception as e:
+                print(f"[{self.name}] Ошибка доставки {len(batch)} уведомлений: {e!r}")
+            on_done(batch)
+
+    async def deliver(self, batch):
+        raise NotImplementedError
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+class DestinationSink(AlertSink):
+    # Встроенные получатели выбираются в правилах уведомлений (log, telegram, sound, popup)
+    def __init__(self, name, notifier, **kwargs):
+        super().__init__(name, **kwargs)
+        self.notifier = notifier
+
+    def accepts(self, alert):
+        return self.name in alert["destinations"] and self.enabled(self.notifier.parent.settings)
+
+    def enabled(self, s):
+        return True
+
+class LogSink(DestinationSink):
+    def __init__(self, notifier):
+        super().__init__("log", notifier, queue_size=10000, window=0.2, max_batch=1000)
+
+    async def deliver(self, batch):
+        await asyncio.get_running_loop().run_in_executor(None, append_log_lines, [alert["text"] for alert in batch])
+        dialog = self.notifier.parent.notification_log_dialog
+        if dialog is not None and dialog.isVisible():
+            dialog.follow()
+
+class TelegramSink(DestinationSink):
+    def __init__(self, notifier):
+        super().__init__("telegram", notifier, queue_size=500, window=1.0, max_batch=50)
+
+    def enabled(self, s):
+        return bool(s.get("enable_telegram") and s.get("telegram_token") and s.get("telegram_chat_id"))
+
+    async def deliver(self, batch):
+        s = self.notifier.parent.settings
+        loop = asyncio.get_running_loop()
+        delivered = True
+        for text in chunk_messages([alert["message"] for alert in batch], TELEGRAM_MAX_LENGTH):
+            # requests блокирует — отправка в потоке, цикл опроса не ждёт Telegram
+            delivered &= await loop.run_in_executor(None, self.notifier.send_telegram_message, s["telegram_token"],
+                                                    s["telegram_chat_id"], text, s.get("telegram_thread_id"), "Markdown")
+        # Подтверждение — ответ Telegram на последний блок пачки
+        if delivered:
+            acked = time.time()
+            for alert in batch:
+                for trace in alert["traces"]:
+                    trace['telegram_ack'] = acked
+
+class SoundSink(DestinationSink):
+    def __init__(self, notifier):
+        super().__init__("sound", notifier, queue_size=10, window=0.5, max_batch=10, policy="drop_newest")
+
+    def enabled(self, s):
+        return s["enable_sound"]
+
+    async def deliver(self, batch):
+        # Один звук на пачку
+        try:
+            from PyQt5.QtMultimedia import QSound
+            QSound.play("alert.wav")
+        except:
+            print("Не удалось воспроизвести звук alert.wav")
+
+class PopupSink(DestinationSink):
+    def __init__(self, notifier):
+        super().__init__("popup", notifier, queue_size=1000, window=0.2, max_batch=200)
+
+    def enabled(self, s):
+        return s.get("enable_popup", True)
+
+    async def deliver(self, batch):
+        notifier = self.notifier
+        if notifier.panel is None:
+            notifier.panel = NotificationPanel(notifier.parent)
+        notifier.panel.add_alerts([alert["text"] for alert in batch])
+        notifier.panel.present(notifier.parent.settings.get("popup_min_interval", 10))
+        if notifier.panel.isVisible():
+            shown = time.time()
+            for alert in batch:
+                for trace in alert["traces"]:
+                    trace['displayed'] = shown
+
+class WebhookSink(AlertSink):
+    # POST пачки уведомлений JSON-массивом
+    def __init__(self, url):
+        super().__init__("webhook", queue_size=1000, window=1.0, max_batch=100)
+        self.url = url
+        self.session = None
+
+    async def deliver(self, batch):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        async with self.session.post(self.url, json=[alert_payload(alert) for alert in batch],
+                                     timeout=aiohttp.ClientTimeout(total=5)) as resp:
+            if resp.status >= 300:
+                print(f"[webhook] HTTP {resp.status}")
+
+    def close(self):
+        super().close()
+        if self.session is not None:
+            asyncio.ensure_future(self.session.close())
+            self.session = None
+
+class JsonLinesSink(AlertSink):
+    # Уведомление на строку JSON — для локальных ботов, читающих файл хвостом
+    def __init__(self, path):
+        super().__init__("jsonl", queue_size=10000, window=0.5, max_batch=1000)
+        self.path = path
+
+    async def deliver(self, batch):
+        lines = [json.dumps(alert_payload(alert), ensure_ascii=False) for alert in batch]
+        await asyncio.get_running_loop().run_in_executor(None, append_lines, self.path, lines)
+
+class UnixSocketSink(AlertSink):
+    # Строки JSON в Unix-сокет; без слушателя пачка теряется, подключение — при следующей
+    def __init__(self, path):
+        super().__init__("socket", queue_size=1000, window=0.5, max_batch=200)
+        self.path = path
+        self.writer = None
+
+    async def deliver(self, batch):
+        if self.writer is None or self.writer.is_closing():
+            _, self.writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), timeout=2)
+        data = "".join(json.dumps(alert_payload(alert), ensure_ascii=False) + "\n" for alert in batch)
+        self.writer.write(data.encode("utf-8"))
+        try:
+            await asyncio.wait_for(self.writer.drain(), timeout=5)
+        except (OSError, asyncio.TimeoutError):
+            self.writer.close()
+            self.writer = None
+            raise
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def append_lines(path, lines):
+    with open(path, "a", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+def append_log_lines(entries):
+    # Журнал только дописывается: старые записи не переписываются при каждом уведомлении
+    append_lines(NOTIFICATION_LOG_FILE, [entry.replace("\n", " ") for entry in entries])
+
+class AlertBus:
+    # Шина уведомлений в процессе: уведомление публикуется один раз, каждый получатель
+    # забирает его своей задачей. Медленный получатель не задерживает ни цикл опроса, ни
+    # остальных. Путь уведомления (AlertTraceLog) закрывается, когда его отработали все
+    def __init__(self, on_finished):
+        self.sinks = []
+        self.on_finished = on_finished
+
+    def set_sinks(self, sinks):
+        for sink in self.sinks:
+            sink.close()
+            self.release(list(sink.queue))
+            sink.queue.clear()
+        self.sinks = sinks
+
+    def publish(self, alert):
+        targets = [sink for sink in self.sinks if sink.accepts(alert)]
+        for trace in alert["traces"]:
+            trace['pending'] = trace.get('pending', 0) + len(targets)
+        for sink in targets:
+            if sink.task is None:
+                sink.task = asyncio.ensure_future(sink.run(self.release))
+            self.release(sink.offer(alert))
+        if not targets:
+            # Участник группы может попасть к получателям сообщением группы — проверка после прохода
+            asyncio.get_event_loop().call_soon(self.release, [alert], 0)
+
+    def release(self, alerts, count=1):
+        for alert in alerts:
+            for trace in alert["traces"]:
+                if 'pending' not in trace:
+                    continue  # уже закрыт: участник группы без получателей отпускается и группой
+                trace['pending'] -= count
+                if trace['pending'] == 0:
+                    del trace['pending']
+                    self.on_finished(trace)
+
+    def stats(self):
+        return {sink.name: (len(sink.queue), sink.queue_size, sink.dropped) for sink in self.sinks}
+
+class NotificationSystem:
+    def __init__(self, parent):
+        self.parent = parent
+        self.notified_candles = {}  # (правило, тикер) -> (свеча последнего уведомления, подтверждено)
+        self.early_rule = AlertRule("Лента", "ratio >= min_ratio", 0, RULE_DESTINATIONS)
+        self.panel = None
+        self.handled = []
+        self.bus = AlertBus(self.alert_handled)
+        self.apply_sinks()
+        migrate_notification_log(NOTIFICATION_LOG_FILE)
+    def apply_sinks(self):
+        s = self.parent.settings
+        sinks = [LogSink(self), TelegramSink(self), SoundSink(self), PopupSink(self)]
+        if s.get("sink_webhook_url"):
+            sinks.append(WebhookSink(s["sink_webhook_url"]))
+        if s.get("sink_jsonl_path"):
+            sinks.append(JsonLinesSink(s["sink_jsonl_path"]))
+        if s.get("sink_socket_path") and hasattr(asyncio, "open_unix_connection"):
+            sinks.append(UnixSocketSink(s["sink_socket_path"]))
+        self.bus.set_sinks(sinks)
+    def close(self):
+        # Журнал не теряет уведомления, ждавшие окна сборки пачки при закрытии
+        for sink in self.bus.sinks:
+            if isinstance(sink, LogSink) and sink.queue:
+                append_log_lines([alert["text"] for alert in sink.queue])
+        self.bus.set_sinks([])
+    def alert_handled(self, trace):
+        # Уведомление отработано всеми получателями — путь записывается в журнал задержек,
+        # пачка получателя одной записью на диск
+        self.handled.append(trace)
+        if len(self.handled) == 1:
+            asyncio.get_event_loop().call_soon(self.record_handled)
+    def record_handled(self):
+        handled, self.handled = self.handled, []
+        self.parent.trace_log().append(handled)
+        self.parent.update_latency_label()
+    def forget(self, keys):
+        self.notified_candles = {k: v for k, v in self.notified_candles.items() if k[1] not in keys}
+        self.parent.rule_engine.forget(keys)
+    def check_and_notify(self, ticker_data, keys, env):
+        if not self.parent.isVisible():
+            return
+        engine = self.parent.rule_engine
+        if not keys:
+            return
+        now = time.time()
+        projecting = self.parent.settings["projection"] != "off"
+        confirmed_env = engine.confirmed_env(env) if projecting else env
+        pending = set()
+        if projecting:
+            # Прогнозы по ещё открытым свечам: их подтверждение проходит сквозь паузу правила
+            for (name, key), (candle, done) in self.notified_candles.items():
+                data = ticker_data.get(key)
+                if not done and data is not None and (data.get('candle_ts') or data.get('datetime')) == candle:
+                    pending.add((name, key))
+        for rule, idx in engine.evaluate(keys, env, now, pending):
+            if not len(idx):
+                continue
+            confirmed = np.ones(len(keys), dtype=bool)
+            if projecting:
+                # Подтверждено — правило выполняется и по фактическому объёму незакрытой свечи
+                try:
+                    confirmed = np.broadcast_to(np.asarray(rule.evaluate(confirmed_env), dtype=bool), (len(keys),))
+                except Exception:
+                    confirmed = np.zeros(len(keys), dtype=bool)
+            alerts = []  # (данные уведомления, пометка, подтверждено)
+            for i in idx:
+                key = keys[i]
+                data = ticker_data[key]
+                # Одна запись на пару правило–тикер вместо множества, растущего с каждой свечой;
+                # по прогнозу уведомление приходит раньше, после подтверждения — ещё одно
+                candle = data.get('candle_ts') or data['datetime']
+                last = self.notified_candles.get((rule.name, key))
+                if last is not None and last[0] == candle and (last[1] or not confirmed[i]):
+                    continue
+                self.notified_candles[(rule.name, key)] = (candle, bool(confirmed[i]))
+                if last is None or last[0] != candle:
+                    # Пауза отсчитывается от первого уведомления по свече, не от подтверждения
+                    engine.mark_fired(rule, key, now)
+                if projecting:
+                    flag = "подтверждено" if confirmed[i] else f"прогноз, сейчас {data['ratio']:.1f}x"
+                    alerts.append((dict(data, ratio=env["ratio"][i], volume=env["volume"][i]), flag, bool(confirmed[i])))
+                else:
+                    alerts.append((data, None, True))
+            # Тикеры, чей объём обычно движется вместе (рынок за BTC), — одно уведомление на группу
+            for group in self.parent.spike_groups([(d['symbol'], d['category']) for d, _, _ in alerts]):
+                if len(group) >= CLUSTER_MIN_SIZE:
+                    self.send_group([alerts[i] for i in group], rule, detected=now)
+                else:
+                    for i in group:
+                        self.send_notification(alerts[i][0], rule, flag=alerts[i][1], detected=now)
+    def notify_early(self, data, candle, ratio, volume):
+        # Ранний всплеск по ленте сделок: не чаще раза за свечу тикера, свеча — по времени ленты
+        if not self.parent.isVisible():
+            return
+        key = (data['symbol'], data['category'])
+        if self.notified_candles.get((self.early_rule.name, key), (None,))[0] == candle:
+            return
+        self.notified_candles[(self.early_rule.name, key)] = (candle, False)
+        self.send_notification(dict(data, ratio=ratio, volume=volume), self.early_rule,
+                               tag=f"лента {TRADE_HORIZON} с, темп", kind="early")
+    def send_group(self, alerts, rule=None, detected=None):
+        # Совместный всплеск: одно сообщение в Telegram, звук и строка панели на группу,
+        # в журнал (если правило туда пишет) — строка на каждый тикер с пометкой группы
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        alerts = sorted(alerts, key=lambda alert: alert[0]['ratio'], reverse=True)
+        lead = alerts[0][0]
+        tag = f"группа {lead['symbol']} +{len(alerts) - 1}"
+        if rule is not None and len(self.parent.rule_engine.rules) > 1:
+            tag = f"{rule.name}, {tag}"
+        member_destinations = (rule.destinations if rule is not None else set(RULE_DESTINATIONS)) & {"log"}
+        if member_destinations:
+            traces = [self.send_notification(data, rule, tag=tag, flag=flag, destinations=member_destinations,
+                                             detected=detected) for data, flag, _ in alerts]
         else:
-            self.text_edit.setPlainText("Журнал пуст.")
+            # Путь участников всё равно записывается — его закроет доставка сообщения группы
+            traces = [AlertTraceLog.new(data, detected or time.time()) for data, _, _ in alerts]
+            for trace in traces:
+                trace['enqueued'] = time.time()
+        members = ", ".join(f"{data['symbol']} {data['ratio']:.1f}x" for data, _, _ in alerts[:CLUSTER_SHOW])
+        if len(alerts) > CLUSTER_SHOW:
+            members += f" и ещё {len(alerts) - CLUSTER_SHOW}"
+        projected = sum(1 for _, flag, confirmed in alerts if flag and not confirmed)
+        projected_str = f", по прогнозу {projected} из {len(alerts)}" if projected else ""
+        adapter, market = resolve_category(lead['category'])
+        header = f"Совместный всплеск: {len(alerts)} тикеров ({lead['category']}) [{tag}] - до {lead['ratio']:.1f}x{projected_str}"
+        message = (f"{header} - [график #{lead['symbol']}]({adapter.chart_url(lead['symbol'], market)})\n"
+                   f"{members}\n"
+                   f"Время: {now}")
+        print(f"[ALERT] {now} - {message}")
+        destinations = (rule.destinations if rule is not None else set(RULE_DESTINATIONS)) - {"log"}
+        self.bus.publish({
+            "type": "group", "time": now, "symbol": lead['symbol'], "category": lead['category'],
+            "exchange": adapter.name, "rule": rule.name if rule is not None else None, "tag": tag,
+            "ratio": float(lead['ratio']), "candle_ts": lead.get('candle_ts'),
+            "members": [{"symbol": data['symbol'], "category": data['category'], "ratio": float(data['ratio']),
+                         "volume": float(data['volume']), "flag": flag} for data, flag, _ in alerts],
+            "text": f"[{now}] {header}: {members}", "message": message,
+            "destinations": destinations, "traces": traces,
+        })
+
+    def send_notification(self, data, rule=None, tag=None, flag=None, destinations=None, detected=None, kind="spike"):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        adapter, market = resolve_category(data['category'])
+        tv_url = adapter.chart_url(data['symbol'], market)
+        hashtag_symbol = f"#{data['symbol']}"
+        price = data.get('price', None)
+        price_str = f"цена: {price:.3f}" if price is not None else ""
+        # Ссылка в формате Markdown
+        link_md = f"[ссылка на график]({tv_url})"
+        if destinations is None:
+            destinations = rule.destinations if rule is not None else set(RULE_DESTINATIONS)
+        rule_str = f" [{rule.name}]" if rule is not None and len(self.parent.rule_engine.rules) > 1 else ""
+        if tag:
+            rule_str = f" [{tag}]"
+        extra = format_enrichment(data, self.parent.market_stats.get((data['symbol'], data['category'])))
+        flag_str = f" ({flag})" if flag else ""
+        message = (f"{hashtag_symbol} ({data['category']}){rule_str} - {data['ratio']:.1f}x{flag_str} - {link_md}\n"
+                   f"{price_str}\n"
+                   f"Объем: {data['volume']:,.0f} USD\n"
+                   + (f"{extra}\n" if extra else "") +
+                   f"Время: {now}")
+        log_entry = f"[{now}] {data['symbol']} ({data['category']}){rule_str} - {data['ratio']:.1f}x{flag_str}, {price_str}, Объем: {data['volume']:,.0f} USD"
+        if extra:
+            log_entry += f", {extra}"
+        print(f"[ALERT] {now} - {message}")
+        trace = AlertTraceLog.new(data, detected or time.time())
+        trace['enqueued'] = time.time()
+        # Уведомление публикуется один раз; доставку каждый получатель шины ведёт сам
+        self.bus.publish({
+            "type": kind, "time": now, "symbol": data['symbol'], "category": data['category'],
+            "exchange": adapter.name, "rule": rule.name if rule is not None else None, "tag": tag, "flag": flag,
+            "ratio": float(data['ratio']), "volume": float(data['volume']),
+            "price": float(price) if price is not None else None, "candle_ts": data.get('candle_ts'),
+            "text": log_entry, "message": message, "destinations": destinations, "traces": [trace],
+        })
+        return trace
+
+    def send_telegram_message(self, token, chat_id, text, thread_id=None, parse_mode="HTML"):
+        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        data = {
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "disable_web_page_preview": True
+        }
+        if thread_id:
+            if thread_id.isdigit():
+                data["message_thread_id"] = int(thread_id)
+            else:
+                print(f"[Telegram] Некорректный message_thread_id: {thread_id}")
+        try:
+            resp = requests.post(url, data=data, timeout=10)
+            if not resp.ok:
+                print(f"[Telegram] Ошибка отправки: {resp.status_code} {resp.text}")
+            return resp.ok
+        except Exception as e:
+            print(f"[Telegram] Ошибка отправки: {e}")
+            return False
+
+def chunk_messages(messages, limit):
+    # Склеивает сообщения пачки в блоки не длиннее limit символов
+    chunks, current = [], ""
+    for message in messages:
+        candidate = f"{current}\n\n{message}" if current else message
+        if len(candidate) > limit and current:
+            chunks.append(current)
+            candidate = message
+        current = candidate[:limit]
+    if current:
+        chunks.append(current)
+    return chunks
+
+class RateLimiter:
+    # Простой темп-лимитер: не больше rps запусков запросов в секунду
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds):
+        # Площадка сообщила о превышении лимита: сдвигаем все следующие слоты
+        now = asyncio.get_running_loop().time()
+        self.next_slot = max(self.next_slot, now + seconds)
+
+class CircuitOpenError(Exception):
+    pass
+
+class RetryableError(Exception):
+    pass
+
+class CircuitBreaker:
+    # После failure_threshold неудач подряд эндпоинт «размыкается» на reset_timeout
+    # секунд; затем пропускается один пробный запрос (half-open)
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self, now):
+        if self.opened_at is None:
+            return True
+        if not self.probing and now - self.opened_at >= self.reset_timeout:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = now
+            self.probing = False
+
+    def abandon(self):
+        # Пробный запрос отменён, не дождавшись ответа: следующий запрос снова может стать пробным
+        self.probing = False
+
+class LatencyTracker:
+    # Скользящее окно задержек эндпоинта для оценки p95
+    def __init__(self, size=200, default=2.0):
+        from collections import deque
+        self.samples = deque(maxlen=size)
+        self.default = default
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        if len(self.samples) < 20:
+            return self.default
+        return float(np.percentile(self.samples, q))
+
+class ResilientFetcher:
+    # Запросы с дедлайном, повторами с джиттером, дублирующим (hedged) запросом
+    # для «отстающих» после p95 задержки и размыкателем на каждый эндпоинт
+    def __init__(self, session, limiters, deadline=8.0, retries=2, backoff=0.5, min_hedge_delay=0.3, profiler=None):
+        self.session = session
+        self.profiler = profiler
+        self.min_hedge_delay = min_hedge_delay
+        self.limiters = limiters
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breakers = {}
+        self.latency = {}
+
+    def getter(self, adapter):
+        async def get_json(url):
+            return await self.get_json(adapter, url)
+        return get_json
+
+    def endpoint(self, adapter, url):
+        return adapter.name + urlsplit(url).path
+
+    async def get_json(self, adapter, url):
+        loop = asyncio.get_running_loop()
+        endpoint = self.endpoint(adapter, url)
+        breaker = self.breakers.setdefault(endpoint, CircuitBreaker())
+        if not breaker.allow(loop.time()):
+            raise CircuitOpenError(endpoint)
+        probe = breaker.probing
+        last_error = None
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # Экспоненциальная задержка с полным джиттером
+                    await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                try:
+                    data = await self._hedged(adapter, url, endpoint)
+                    breaker.record_success()
+                    return data
+                except (RetryableError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    last_error = e
+            breaker.record_failure(loop.time())
+            raise last_error
+        finally:
+            # Отмена (бюджет цикла, таймаут обогащения) не должна оставить эндпоинт разомкнутым навсегда
+            if probe and breaker.probing:
+                breaker.abandon()
+
+    async def _hedged(self, adapter, url, endpoint):
+        tracker = self.latency.setdefault(endpoint, LatencyTracker())
+        pending = {asyncio.ensure_future(self._once(adapter, url, tracker))}
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=max(tracker.percentile(95), self.min_hedge_delay))
+            if done:
+                pending = set()
+                return done.pop().result()
+            # Основной запрос дольше p95: параллельно отправляем дубль, берём первый успешный
+            pending.add(asyncio.ensure_future(self._once(adapter, url, tracker)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _once(self, adapter, url, tracker):
+        limiter = self.limiters[adapter.name]
+        await limiter.acquire()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=self.deadline)) as resp:
+            body = await resp.read()
+            parse_started = time.perf_counter()
+            try:
+                data = json.loads(body)
+            except ValueError:
+                raise RetryableError(f"{adapter.name}: некорректный ответ HTTP {resp.status}")
+            if self.profiler is not None:
+                self.profiler.add("json", time.perf_counter() - parse_started)
+            tracker.add(loop.time() - started)
+            if adapter.is_rate_limited(resp.status, data):
+                print(f"[{adapter.name}] Превышен лимит запросов, пауза")
+                limiter.penalize(5.0)
+                raise RetryableError(f"{adapter.name}: rate limit")
+            if resp.status >= 500:
+                raise RetryableError(f"{adapter.name}: HTTP {resp.status}")
+            if resp.status != 200:
+                return None
+            return data
+
+def make_limiters(total_rps, share=1.0):
+    # Отдельный лимитер на каждую площадку: лимиты у бирж независимы
+    return {name: RateLimiter(min(total_rps, adapter.rate_limit_rps) * share)
+            for name, adapter in EXCHANGES.items()}
+
+def bucket_open(klines, bucket_start_ms):
+    # Цена открытия свечи таймфрейма — open самой ранней 15-минутной свечи внутри неё
+    inside = [k for k in klines if int(k[0]) >= bucket_start_ms]
+    return float((inside or klines)[-1][1])
+
+class CandleStore:
+    # Последние CANDLE_RETAIN объёмов 15-минутных свечей по всем тикерам в одном кольце:
+    # ring[0, строка, слот] — объём, ring[1, строка, слот] — номер свечи (ts // 900).
+    # Окно, медиана/среднее и таймфрейм пересчитываются по нему векторно, без запросов.
+    # В режиме шардов кольцо лежит в shared_memory и заполняется воркерами.
+    def __init__(self, retain, capacity=256, ring=None, rows=None):
+        self.retain = retain
+        if ring is None:
+            ring = np.empty((2, capacity, retain))
+            ring[0] = 0.0
+            ring[1] = -1.0
+        self.ring = ring
+        self.rows = {} if rows is None else rows
+        self.free_rows = []
+
+    def row(self, key):
+        if key not in self.rows and self.free_rows:
+            # Строки делистингованных тикеров переиспользуются, кольцо не растёт от ротации
+            row = self.rows[key] = self.free_rows.pop()
+            self.ring[1, row] = -1.0
+        if key not in self.rows:
+            n = len(self.rows)
+            if n >= self.ring.shape[1]:
+                grown = np.empty((2, n * 2, self.retain))
+                grown[0] = 0.0
+                grown[1] = -1.0
+                grown[:, :n] = self.ring
+                self.ring = grown
+            self.rows[key] = n
+        return self.rows[key]
+
+    def drop(self, keys):
+        for key in keys:
+            if key in self.rows:
+                self.free_rows.append(self.rows.pop(key))
+
+    @staticmethod
+    def write(ring, row, klines):
+        retain = ring.shape[2]
+        for k in klines:
+            index = int(k[0]) // 1000 // CANDLE_SECONDS
+            slot = index % retain
+            if ring[1, row, slot] <= index:
+                ring[1, row, slot] = index
+                ring[0, row, slot] = float(k[5])
+
+    def put(self, key, klines):
+        self.write(self.ring, self.row(key), klines)
+
+    def covers(self, window, timeframe):
+        return required_retain(window, timeframe) <= self.retain
+
+    def resized(self, retain):
+        # Копия с более длинным кольцом: свечи раскладываются по новым слотам
+        grown = CandleStore(retain, capacity=self.ring.shape[1])
+        rows, slots = np.nonzero(self.ring[1] >= 0)
+        index = self.ring[1, rows, slots].astype(np.int64)
+        grown.ring[0, rows, index % retain] = self.ring[0, rows, slots]
+        grown.ring[1, rows, index % retain] = index
+        grown.rows = dict(self.rows)
+        grown.free_rows = list(self.free_rows)
+        return grown
+
+    def buckets(self, rows, now, count, timeframe):
+        # -> (строки, count) объёмов последних свечей таймфрейма, последняя — текущая;
+        # свеча таймфрейма — сумма входящих в неё 15-минутных, NaN — свечи нет в кольце
+        m = timeframe // 15
+        first = int(now) // CANDLE_SECONDS // m * m  # первая 15м свеча текущей свечи таймфрейма
+        index = np.arange(first - (count - 1) * m, first + m)
+        cells = np.ix_(np.asarray(rows, dtype=np.int64), index % self.retain)
+        valid = (self.ring[1][cells] == index).reshape(len(rows), count, m)
+        volumes = np.where(valid, self.ring[0][cells].reshape(len(rows), count, m), 0.0)
+        return np.where(valid.any(axis=2), volumes.sum(axis=2), np.nan)
+
+    def derive(self, rows, now, window, timeframe, method):
+        # -> (базовая линия, объём текущей свечи, предыдущей, позапрошлой) по строкам rows;
+        # окно включает текущую свечу
+        import warnings
+        buckets = self.buckets(rows, now, max(window, 3), timeframe)
+        recent = buckets[:, -window:]
+        enough = np.isfinite(recent).sum(axis=1) >= min(MIN_BASELINE_CANDLES, window)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # строки без данных дают NaN
+            baseline = (np.nanmedian if method == "median" else np.nanmean)(recent, axis=1)
+        return (np.where(enough, baseline, np.nan), np.nan_to_num(buckets[:, -1]),
+                np.nan_to_num(buckets[:, -2]), np.nan_to_num(buckets[:, -3]))
+
+def required_retain(window, timeframe):
+    # Свечей 15м, нужных для окна из window свечей таймфрейма (+1 свеча на выравнивание)
+    return (window + 1) * (timeframe // 15)
+
+class VolumeCurve:
+    # Профиль набора объёма внутри свечи таймфрейма: какая доля итогового объёма обычно
+    # набрана к моменту t. Частичные объёмы каждого цикла запоминаются по строкам кольца
+    # свечей; когда свеча закрывается, их доли от итога по всем тикерам сводятся медианой
+    # в точки профиля. До обучения профиль линейный.
+    def __init__(self, shape=None, bins=PROFILE_BINS):
+        self.bins = bins
+        centers = (np.arange(bins) + 0.5) / bins
+        self.shape = np.array(shape, dtype=np.float64) if shape is not None and len(shape) == bins else centers
+        self.x = np.concatenate((centers, [1.0]))  # до первой точки доля не экстраполируется к нулю
+        self.partial = np.full((0, bins), np.nan)  # строка кольца -> частичные объёмы текущей свечи
+        self.candle = np.empty(0, dtype=np.int64)
+
+    def share(self, fraction):
+        return float(np.interp(fraction, self.x, np.concatenate((self.shape, [1.0]))))
+
+    def observe(self, rows, candle, fraction, volume, prev):
+        # rows, volume, prev — строки кольца, объёмы текущей и предыдущей свечи одного цикла
+        import warnings
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        if rows.max() >= len(self.candle):
+            n = max(rows.max() + 1, 2 * len(self.candle))
+            self.partial = np.concatenate([self.partial, np.full((n - len(self.candle), self.bins), np.nan)])
+            self.candle = np.concatenate([self.candle, np.full(n - len(self.candle), -1, dtype=np.int64)])
+        last = self.candle[rows]
+        closed = last == candle - 1
+        if closed.any():
+            final = np.asarray(prev, dtype=np.float64)[closed]
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                shares = np.clip(self.partial[rows[closed]] / np.where(final > 0, final, np.nan)[:, None], 0.0, 1.0)
+                median = np.nanmedian(shares, axis=0)
+            enough = np.isfinite(shares).sum(axis=0) >= PROFILE_MIN_ROWS
+            self.shape[enough] += PROFILE_ALPHA * (median[enough] - self.shape[enough])
+            self.shape = np.clip(np.maximum.accumulate(self.shape), 1e-3, 1.0)
+        self.partial[rows[last != candle]] = np.nan
+        self.candle[rows] = candle
+        self.partial[rows, min(int(fraction * self.bins), self.bins - 1)] = volume
+
+    def reset(self):
+        self.partial = np.full((0, self.bins), np.nan)
+        self.candle = np.empty(0, dtype=np.int64)
+
+class VolumeCorrelation:
+    # Экспоненциально взвешенная ковариация приращений log-объёма 15-минутных свечей
+    # между всеми строками кольца свечей. Строится один раз по сохранённому окну, затем на
+    # каждой закрытой свече обновляется ранг-1 поправкой всей матрицы; вес свечи 2 / (retain + 1)
+    def __init__(self):
+        self.store = None
+        self.index = None  # последняя учтённая закрытая 15м свеча
+        self.mean = self.cov = None
+        self.owners = {}  # строка -> тикер, по которому накоплена её история
+
+    def update(self, store, now):
+        closed = int(now) // CANDLE_SECONDS - 1
+        if (store is not self.store or self.cov is None or self.cov.shape[0] < store.ring.shape[1]
+                or closed - self.index >= store.retain // 2 or closed < self.index):
+            self.rebuild(store, closed)
+            return
+        self.clear_stale(store)
+        alpha = 2 / (store.retain + 1)
+        for index in range(self.index + 1, closed + 1):
+            x, valid = self.changes(store, np.array([index]))
+            d = np.where(valid[:, 0], x[:, 0] - self.mean, 0.0)
+            self.mean += alpha * d
+            d = d.astype(np.float32)
+            self.cov *= 1 - alpha
+            self.cov += np.outer(d * ((1 - alpha) * alpha), d)
+        self.index = closed
+
+    @staticmethod
+    def changes(store, index):
+        # -> (строки, свечи) приращений log1p(объёма) к предыдущей свече и маска наличия обеих
+        retain = store.retain
+        slots = np.concatenate([index - 1, index]) % retain
+        stamps = np.concatenate([index - 1, index])
+        logv = np.log1p(store.ring[0][:, slots])
+        ok = store.ring[1][:, slots] == stamps
+        k = len(index)
+        return logv[:, k:] - logv[:, :k], ok[:, k:] & ok[:, :k]
+
+    def rebuild(self, store, closed):
+        alpha = 2 / (store.retain + 1)
+        # В кольце закрыты retain - 1 свечей: слот самой старой уже занят текущей
+        index = np.arange(closed - store.retain + 3, closed + 1)
+        x, valid = self.changes(store, index)
+        weights = (1 - alpha) ** np.arange(len(index) - 1, -1, -1)
+        w = np.where(valid, weights, 0.0)
+        self.mean = (np.where(valid, x, 0.0) * w).sum(axis=1) / np.maximum(w.sum(axis=1), 1e-12)
+        d = (np.where(valid, x - self.mean[:, None], 0.0) * np.sqrt(weights / weights.sum())).astype(np.float32)
+        self.cov = d @ d.T
+        self.store, self.index = store, closed
+        self.owners = {}  # матрица собрана по кольцу заново — история строк уже своя
+        self.clear_stale(store)
+
+    def clear_stale(self, store):
+        # Освобождённая строка достанется новому тикеру — чужая история ему ни к чему. Строка
+        # может освободиться и занята снова между проходами, поэтому сверяется и владелец
+        owners = {row: key for key, row in store.rows.items()}
+        stale = [row for row, key in owners.items() if self.owners.get(row, key) != key]
+        stale += store.free_rows
+        if stale:
+            stale = np.array(stale)
+            self.cov[stale, :] = 0.0
+            self.cov[:, stale] = 0.0
+            self.mean[stale] = 0.0
+        self.owners = owners
+
+    def groups(self, rows):
+        # -> метка группы для каждой строки: связные компоненты графа «корреляция ≥ порога»
+        # среди переданных строк, метка — наименьшая позиция в компоненте
+        k = len(rows)
+        labels = np.arange(k)
+        if k < CLUSTER_MIN_SIZE or self.cov is None:
+            return labels
+        rows = np.asarray(rows, dtype=np.int64)
+        sub = self.cov[np.ix_(rows, rows)]
+        sd = np.sqrt(np.maximum(np.diag(sub), 0.0))
+        linked = sub >= CLUSTER_MIN_CORR * np.outer(sd, sd)
+        linked &= (sd > 0)[:, None] & (sd > 0)[None, :]
+        while True:
+            merged = np.minimum(labels, np.where(linked, labels[None, :], k).min(axis=1))
+            if (merged == labels).all():
+                return labels
+            labels = merged[merged]  # сжатие путей: метка метки
+
+class VolumeSketch:
+    # Потоковые квантили 15-минутного объёма по тикерам в постоянной памяти (в духе DDSketch):
+    # у тикера строка счётчиков по логарифмическим корзинам, старые свечи забываются
+    # экспоненциально с горизонтом в днях. Все тикеры — одна матрица float32.
+    # Файл: заголовок (magic, версия, длина JSON), JSON с ключами, затем last и counts
+    MAGIC = b"BVSQ"
+    VERSION = 1
+
+    def __init__(self, capacity=256):
+        self.counts = np.zeros((capacity, SKETCH_BINS), dtype=np.float32)
+        self.last = np.full(capacity, -1, dtype=np.int64)  # последняя учтённая 15м свеча
+        self.rows = {}
+        self.free_rows = []
+
+    def row(self, key):
+        if key not in self.rows and self.free_rows:
+            self.rows[key] = self.free_rows.pop()
+        if key not in self.rows:
+            n = len(self.rows)
+            if n >= len(self.last):
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                self.last = np.concatenate([self.last, np.full(len(self.last), -1, dtype=np.int64)])
+            self.rows[key] = n
+        return self.rows[key]
+
+    def drop(self, keys):
+        for key in keys:
+            if key in self.rows:
+                row = self.rows.pop(key)
+                self.counts[row] = 0.0
+                self.last[row] = -1
+                self.free_rows.append(row)
+
+    @staticmethod
+    def bins(volume):
+        ratio = np.maximum(volume, SKETCH_MIN_VOLUME) / SKETCH_MIN_VOLUME
+        return np.clip(np.ceil(np.log(ratio) / np.log(SKETCH_GAMMA)), 0, SKETCH_BINS - 1).astype(np.int64)
+
+    def update(self, keys, store, now, days):
+        # Закрытые 15м свечи из кольца, ещё не учтённые в скетчах, — векторно по всем тикерам
+        if not keys:
+            return
+        closed = int(now) // CANDLE_SECONDS - 1
+        rows = np.array([self.row(key) for key in keys], dtype=np.int64)
+        src = np.array([store.rows[key] for key in keys], dtype=np.int64)
+        decay = np.float32(1 - 1 / (days * 24 * 3600 / CANDLE_SECONDS))
+        # В кольце закрыты retain - 1 свечей: слот самой старой уже занят текущей
+        for index in range(max(int(self.last[rows].min()) + 1, closed - store.retain + 2), closed + 1):
+            slot = index % store.retain
+            take = (self.last[rows] < index) & (store.ring[1, src, slot] == index)
+            if not take.any():
+                continue
+            r = rows[take]
+            self.counts[r] *= decay
+            self.counts[r, self.bins(store.ring[0, src[take], slot])] += 1.0  # строки r различны
+            self.last[r] = index
+
+    def quantile(self, keys, q):
+        # -> квантиль q объёма 15м свечи по тикерам; NaN — скетч ещё не набрал сутки
+        rows = np.array([self.rows.get(key, -1) for key in keys], dtype=np.int64)
+        counts = self.counts[np.maximum(rows, 0)]
+        cum = np.cumsum(counts, axis=1)
+        total = cum[:, -1]
+        b = (cum < q * total[:, None]).sum(axis=1)
+        # Представитель корзины (γ^(b-1), γ^b] с равной относительной ошибкой к обеим границам
+        value = SKETCH_MIN_VOLUME * 2 * SKETCH_GAMMA ** b / (SKETCH_GAMMA + 1)
+        return np.where((rows >= 0) & (total >= SKETCH_MIN_CANDLES), value, np.nan)
+
+    def save(self, path):
+        keys = sorted(self.rows, key=self.rows.get)
+        rows = np.array([self.rows[key] for key in keys], dtype=np.int64)
+        header = json.dumps({"saved_at": time.time(), "keys": keys, "bins": SKETCH_BINS,
+                             "gamma": SKETCH_GAMMA}, ensure_ascii=False).encode("utf-8")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<4sHI", self.MAGIC, self.VERSION, len(header)))
+            f.write(header)
+            self.last[rows].tofile(f)
+            self.counts[rows].tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            magic, version, header_len = struct.unpack("<4sHI", f.read(10))
+            if magic != cls.MAGIC or version != cls.VERSION:
+                return None
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            if header["bins"] != SKETCH_BINS or header["gamma"] != SKETCH_GAMMA:
+                return None  # другая сетка корзин — счётчики несовместимы
+            n = len(header["keys"])
+            last = np.fromfile(f, dtype=np.int64, count=n)
+            counts = np.fromfile(f, dtype=np.float32, count=n * SKETCH_BINS).reshape(n, SKETCH_BINS)
+        sketch = cls(capacity=max(256, n))
+        sketch.last[:n] = last
+        sketch.counts[:n] = counts
+        sketch.rows = {tuple(key): i for i, key in enumerate(header["keys"])}
+        return sketch
+
+# Колонки общего буфера шардов (каждая колонка лежит в памяти непрерывно)
+SHARD_COLUMNS = ["ts", "price", "ok", "open"]
+COL_TS, COL_PRICE, COL_OK, COL_OPEN = range(len(SHARD_COLUMNS))
+
+def shard_columns(shm, capacity):
+    # Представление сегмента shared_memory как массива (колонка, строка) без копирования
+    return np.ndarray((len(SHARD_COLUMNS), capacity), dtype=np.float64, buffer=shm.buf)
+
+def shard_ring(shm, capacity, retain):
+    return np.ndarray((2, capacity, retain), dtype=np.float64, buffer=shm.buf)
+
+async def _shard_fetch_klines(getters, symbol, category, from_ts):
+    adapter, market = resolve_category(category)
+    try:
+        return await adapter.fetch_klines(getters[adapter.name], symbol, market, from_ts)
+    except Exception as e:
+        print(f"[Шард] Ошибка получения данных для {symbol}: {e}")
+        return []
+
+async def _shard_run(shm_name, ring_name, capacity, retain, assigned, rps_share, cmd_queue, done_queue, worker_id):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    cols = shard_columns(shm, capacity)
+    ring_shm = shared_memory.SharedMemory(name=ring_name)
+    ring = shard_ring(ring_shm, capacity, retain)
+    total_rps, n_workers = rps_share
+    limiters = make_limiters(total_rps, 1.0 / n_workers)
+    tickers = dict(assigned)  # строка буфера -> (symbol, category)
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit=8)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        fetcher = ResilientFetcher(session, limiters)
+        getters = {name: fetcher.getter(adapter) for name, adapter in EXCHANGES.items()}
+        sem = asyncio.Semaphore(8)
+
+        async def process(row, cmd):
+            symbol, category = tickers[row]
+            async with sem:
+                klines = await _shard_fetch_klines(getters, symbol, category, cmd[1])
+            if not klines:
+                cols[COL_OK, row] = 0.0
+                return 0
+            # Объёмы идут в общее кольцо свечей, базовую линию считает главный процесс
+            CandleStore.write(ring, row, klines)
+            if cmd[0] == "online":
+                # ("online", from_ts, начало текущей свечи таймфрейма, only)
+                cols[COL_TS, row] = cmd[2]
+                cols[COL_PRICE, row] = float(klines[0][4])
+                cols[COL_OPEN, row] = bucket_open(klines, cmd[2] * 1000)
+            cols[COL_OK, row] = 1.0
+            return 1
+
+        while True:
+            cmd = await loop.run_in_executor(None, cmd_queue.get)
+            if cmd[0] == "stop":
+                break
+            if cmd[0] == "assign":
+                tickers.update(cmd[1])
+                continue
+            if cmd[0] == "drop":
+                for row in cmd[1]:
+                    tickers.pop(row, None)
+                continue
+            # (..., only, номер цикла): ответ помечается номером, чтобы опоздавший не засчитался следующему циклу
+            only, cycle = cmd[-2:]
+            rows = [row for row in tickers if only is None or row in only]
+            results = await asyncio.gather(*(process(row, cmd) for row in rows))
+            done_queue.put((worker_id, cycle, sum(results)))
+    del cols, ring
+    shm.close()
+    ring_shm.close()
+
+def _shard_worker(shm_name, ring_name, capacity, retain, assigned, rps_share, cmd_queue, done_queue, worker_id):
+    asyncio.run(_shard_run(shm_name, ring_name, capacity, retain, assigned, rps_share, cmd_queue, done_queue, worker_id))
+
+class ShardedScanner:
+    # Делит вселенную тикеров между N процессами. У каждого процесса свой пул
+    # HTTP-соединений и своя доля лимита запросов, результаты пишутся в общий
+    # колоночный буфер и кольцо свечей в shared_memory, которые главный процесс читает
+    # без копирования. Буферы создаются с запасом строк под новые листинги.
+    def __init__(self, tickers, n_workers, total_rps, retain=CANDLE_RETAIN):
+        import multiprocessing as mp
+        from multiprocessing import shared_memory
+        self.tickers = list(tickers)
+        self.capacity = max(1, len(self.tickers) + len(self.tickers) // 4 + 64)
+        self.n_workers = max(1, min(n_workers, len(self.tickers) or 1))
+        self.tickers += [None] * (self.capacity - len(self.tickers))
+        ctx = mp.get_context("spawn")
+        self.shm = shared_memory.SharedMemory(create=True, size=len(SHARD_COLUMNS) * self.capacity * 8)
+        self.cols = shard_columns(self.shm, self.capacity)
+        self.cols[:] = 0.0
+        self.ring_shm = shared_memory.SharedMemory(create=True, size=2 * self.capacity * retain * 8)
+        ring = shard_ring(self.ring_shm, self.capacity, retain)
+        ring[0] = 0.0
+        ring[1] = -1.0
+        self.done_queue = ctx.Queue()
+        self.rows = {key: row for row, key in enumerate(self.tickers) if key is not None}
+        self.store = CandleStore(retain, ring=ring, rows=self.rows)
+        self.free_rows = [row for row, key in enumerate(self.tickers) if key is None]
+        self.cmd_queues = []
+        self.processes = []
+        self.cycle = 0
+        self.cycle_lock = asyncio.Lock()  # воркеры выполняют команды по очереди — циклы тоже
+        rps_share = (total_rps, self.n_workers)
+        for worker_id in range(self.n_workers):
+            # Чередование строк выравнивает нагрузку между шардами
+            assigned = [(row, key) for row, key in self.rows_of(worker_id)]
+            cmd_queue = ctx.Queue()
+            proc = ctx.Process(
+                target=_shard_worker,
+                args=(self.shm.name, self.ring_shm.name, self.capacity, retain, assigned, rps_share,
+                      cmd_queue, self.done_queue, worker_id),
+                daemon=True
+            )
+            proc.start()
+            self.cmd_queues.append(cmd_queue)
+            self.processes.append(proc)
+
+    def rows_of(self, worker_id):
+        return [(row, self.tickers[row]) for row in range(worker_id, self.capacity, self.n_workers)
+                if self.tickers[row] is not None]
+
+    def add(self, keys):
+        # Новые тикеры занимают свободные строки; False — запаса не хватило
+        keys = [key for key in keys if key not in self.rows]
+        if len(keys) > len(self.free_rows):
+            return False
+        per_worker = {}
+        for key in keys:
+            row = self.free_rows.pop(0)
+            self.tickers[row] = key
+            self.rows[key] = row
+            self.cols[:, row] = 0.0
+            self.store.ring[1, row] = -1.0
+            per_worker.setdefault(row % self.n_workers, []).append((row, key))
+        for worker_id, assigned in per_worker.items():
+            self.cmd_queues[worker_id].put(("assign", assigned))
+        return True
+
+    def drop(self, keys):
+        per_worker = {}
+        for key in keys:
+            row = self.rows.pop(key, None)
+            if row is None:
+                continue
+            self.tickers[row] = None
+            self.cols[COL_OK, row] = 0.0
+            self.free_rows.append(row)
+            per_worker.setdefault(row % self.n_workers, []).append(row)
+        for worker_id, rows in per_worker.items():
+            self.cmd_queues[worker_id].put(("drop", rows))
+
+    async def run_cycle(self, *cmd, only=None, timeout=300):
+        # only — подмножество строк (например, только новые листинги)
+        import queue
+        loop = asyncio.get_running_loop()
+        async with self.cycle_lock:
+            self.cycle += 1
+            cmd = cmd + (None if only is None else set(only), self.cycle)
+            for q in self.cmd_queues:
+                q.put(cmd)
+            total = 0
+            waiting = set(range(len(self.processes)))
+            deadline = loop.time() + timeout
+            while waiting:
+                try:
+                    worker_id, cycle, n_ok = await loop.run_in_executor(
+                        None, self.done_queue.get, True, max(0.0, deadline - loop.time()))
+                except queue.Empty:
+                    print(f"[Шард] Нет ответа от воркеров {sorted(waiting)} за {timeout} сек")
+                    break
+                if cycle != self.cycle:
+                    continue  # опоздавший ответ прошлого цикла
+                waiting.discard(worker_id)
+                total += n_ok
+            return total
+
+    def close(self):
+        for q in self.cmd_queues:
+            q.put(("stop",))
+        for proc in self.processes:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        del self.cols
+        self.store.ring = None
+        self.shm.close()
+        self.shm.unlink()
+        self.ring_shm.close()
+        self.ring_shm.unlink()
+
+class StateSnapshot:
+    # Компактный двоичный снимок последнего состояния таблицы:
+    # заголовок (magic, версия, длина JSON), JSON с ключами и временем свечей,
+    # затем колонки float64 в порядке SNAPSHOT_COLUMNS
+    MAGIC = b"BVSS"
+    VERSION = 1
+    COLUMNS = ["mean", "volume", "ratio", "price", "updated_at"]
+
+    @classmethod
+    def save(cls, path, ticker_data, selected_type):
+        from array import array
+        keys = list(ticker_data)
+        header = json.dumps({
+            "saved_at": time.time(),
+            "selected_type": selected_type,
+            "keys": keys,
+            "datetimes": [ticker_data[k].get('datetime', '') for k in keys],
+        }, ensure_ascii=False).encode("utf-8")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack("<4sHI", cls.MAGIC, cls.VERSION, len(header)))
+            f.write(header)
+            for col in cls.COLUMNS:
+                array('d', (float(ticker_data[k].get(col) or 0.0) for k in keys)).tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        from array import array
+        with open(path, "rb") as f:
+            magic, version, header_len = struct.unpack("<4sHI", f.read(10))
+            if magic != cls.MAGIC or version != cls.VERSION:
+                return None
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            n = len(header["keys"])
+            columns = {}
+            for col in cls.COLUMNS:
+                values = array('d')
+                values.fromfile(f, n)
+                columns[col] = values
+        ticker_data = {}
+        for i, (symbol, category) in enumerate(header["keys"]):
+            row = {col: columns[col][i] for col in cls.COLUMNS}
+            row.update(symbol=symbol, category=category, datetime=header["datetimes"][i], from_snapshot=True)
+            ticker_data[(symbol, category)] = row
+        return header, ticker_data
+
+class SpikeHistory:
+    # История каждого цикла по колонкам: history/ГГГГ-ММ-ДД/<колонка>.bin, только дозапись.
+    # Запросы читают нужные колонки через memmap по одному дню, поэтому память
+    # не растёт с глубиной истории. Символы хранятся номерами из symbols.txt.
+    COLUMNS = [("ts", "<f8"), ("candle", "<i8"), ("sym", "<i4"),
+               ("volume", "<f8"), ("mean", "<f8"), ("ratio", "<f8"), ("price", "<f8")]
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+        self.symbols = []  # номер -> "symbol|category"
+        self.ids = {}
+        path = os.path.join(root, "symbols.txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    self._register(line.rstrip("\n"))
+
+    def _register(self, name):
+        self.ids[name] = len(self.symbols)
+        self.symbols.append(name)
+
+    def symbol_ids(self, keys):
+        new = [f"{s}|{c}" for s, c in keys if f"{s}|{c}" not in self.ids]
+        if new:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, "symbols.txt"), "a", encoding="utf-8") as f:
+                for name in dict.fromkeys(new):
+                    self._register(name)
+                    f.write(name + "\n")
+        return np.fromiter((self.ids[f"{s}|{c}"] for s, c in keys), dtype=np.int32, count=len(keys))
+
+    def append(self, now, keys, env, candles):
+        if not keys:
+            return
+        day_dir = os.path.join(self.root, datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        values = {"ts": np.full(len(keys), now), "candle": candles, "sym": self.symbol_ids(keys),
+                  "volume": env["volume"], "mean": env["mean"], "ratio": env["ratio"], "price": env["price"]}
+        for name, dtype in self.COLUMNS:
+            with open(os.path.join(day_dir, name + ".bin"), "ab") as f:
+                np.asarray(values[name], dtype=dtype).tofile(f)
+
+    def load_day(self, day_dir, columns):
+        # Колонки одного дня; после обрыва записи длины могут разойтись — берём общий минимум
+        dtypes = dict(self.COLUMNS)
+        paths = {name: os.path.join(day_dir, name + ".bin") for name in columns}
+        if not all(os.path.exists(p) and os.path.getsize(p) for p in paths.values()):
+            return None
+        n = min(os.path.getsize(p) // np.dtype(dtypes[name]).itemsize for name, p in paths.items())
+        return {name: np.memmap(p, dtype=dtypes[name], mode="r", shape=(n,)) for name, p in paths.items()}
+
+    def scan(self, since, until=None, columns=("ts", "candle", "sym", "ratio")):
+        # -> итератор по дням: словарь колонок (memmap), только дни из диапазона [since, until]
+        until = until or time.time()
+        first = datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d")
+        last = datetime.fromtimestamp(until, timezone.utc).strftime("%Y-%m-%d")
+        if not os.path.isdir(self.root):
+            return
+        for day in sorted(os.listdir(self.root)):
+            if first <= day <= last and os.path.isdir(os.path.join(self.root, day)):
+                cols = self.load_day(os.path.join(self.root, day), set(columns) | {"ts"})
+                if cols is not None:
+                    mask = (cols["ts"] >= since) & (cols["ts"] <= until)
+                    yield {name: np.asarray(col[mask]) for name, col in cols.items()}
+
+    def spikes(self, symbol, category=None, days=30, min_ratio=2.0):
+        # Всплески тикера за период: по одной записи на свечу с максимальной кратностью
+        ids = [i for i, name in enumerate(self.symbols)
+               if name.split("|")[0] == symbol and (category is None or name.split("|")[1] == category)]
+        if not ids:
+            return []
+        best = {}
+        for cols in self.scan(time.time() - days * 86400, columns=("candle", "sym", "ratio", "volume", "price")):
+            mask = np.isin(cols["sym"], ids) & (cols["ratio"] >= min_ratio)
+            for sym, candle, ratio, volume, price in zip(cols["sym"][mask].tolist(), cols["candle"][mask].tolist(),
+                                                         cols["ratio"][mask].tolist(), cols["volume"][mask].tolist(),
+                                                         cols["price"][mask].tolist()):
+                key = (self.symbols[sym], candle)
+                if key not in best or ratio > best[key]["ratio"]:
+                    best[key] = {"symbol": self.symbols[sym], "candle": candle, "ratio": ratio,
+                                 "volume": volume, "price": price}
+        return sorted(best.values(), key=lambda x: x["candle"])
+
+    def repeat_offenders(self, days=7, min_ratio=2.0, min_spikes=3):
+        # Тикеры с числом свечей-всплесков не меньше min_spikes -> [("symbol|category", число)]
+        pairs = []
+        for cols in self.scan(time.time() - days * 86400, columns=("candle", "sym", "ratio")):
+            mask = cols["ratio"] >= min_ratio
+            pairs.append(np.unique(np.stack([cols["sym"][mask].astype(np.int64), cols["candle"][mask]]), axis=1))
+        if not pairs:
+            return []
+        # Одна свеча могла попасть в разные дни (запись до и после полуночи)
+        unique = np.unique(np.concatenate(pairs, axis=1), axis=1)
+        counts = np.bincount(unique[0], minlength=len(self.symbols))
+        hits = np.flatnonzero(counts >= min_spikes)
+        return sorted(((self.symbols[i], int(counts[i])) for i in hits), key=lambda x: -x[1])
+
+class InstrumentUniverse:
+    # Кэш списков инструментов по категориям с TTL. update() возвращает разницу
+    # с предыдущим списком: новые листинги и делистинги.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}  # category -> (время загрузки, frozenset символов)
+
+    def get(self, category):
+        entry = self.entries.get(category)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def update(self, category, symbols):
+        symbols = frozenset(symbols)
+        previous = self.entries.get(category, (0, None))[1]
+        self.entries[category] = (time.time(), symbols)
+        if previous is None:
+            return [], []
+        return sorted(symbols - previous), sorted(previous - symbols)
+
+class Enricher:
+    # Доп. данные (OI, фандинг, стакан) запрашиваются только для тикеров выше порога
+    # предупреждения и кэшируются на ENRICH_TTL: серия всплесков не повторяет запросы
+    def __init__(self, ttl=ENRICH_TTL):
+        self.ttl = ttl
+        self.cache = {}  # ключ -> (время получения, поля)
+
+    def get(self, key, now):
+        entry = self.cache.get(key)
+        if entry is None or now - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    async def enrich(self, fetcher, keys, now):
+        # Все запросы всех выбранных тикеров идут одной пачкой, темп задаёт ограничитель площадки
+        todo = [key for key in keys if self.get(key, now) is None][:ENRICH_MAX_PER_CYCLE]
+        for key in [k for k, (fetched_at, _) in self.cache.items() if now - fetched_at >= self.ttl]:
+            del self.cache[key]
+        if todo:
+            await asyncio.gather(*(self.fetch(fetcher, key) for key in todo))
+
+    async def fetch(self, fetcher, key):
+        symbol, category = key
+        adapter, market = resolve_category(category)
+        urls = adapter.enrichment_urls(symbol, market)
+        responses = await asyncio.gather(*(fetcher.get_json(adapter, url) for url in urls.values()),
+                                         return_exceptions=True)
+        fields = {}
+        for kind, data in zip(urls, responses):
+            if isinstance(data, BaseException) or not data:
+                continue
+            try:
+                fields.update(adapter.decode_enrichment(kind, data))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"Ошибка разбора {kind} для {symbol}: {e!r}")
+        # Пустой результат тоже кэшируется, чтобы не повторять неудачные запросы каждый цикл
+        self.cache[key] = (time.time(), fields)
+
+def format_enrichment(data, stats):
+    parts = []
+    if stats and stats.get('change24h') is not None:
+        parts.append(f"24ч: {stats['change24h']:+.1f}%")
+    if data.get('oi_change') is not None:
+        parts.append(f"OI 1ч: {data['oi_change']:+.1f}%")
+    if data.get('funding') is not None:
+        parts.append(f"фандинг: {data['funding']:+.4f}%")
+    if data.get('imbalance') is not None:
+        parts.append(f"стакан: {data['imbalance']:+.0f}%")
+    return " | ".join(parts)
+
+HUB_FIELDS = ["symbol", "category", "mean", "volume", "ratio", "proj_volume", "proj_ratio", "datetime", "price", "open",
+              "prev_volume", "prev2_volume", "candle_ts", "fetch_started", "updated_at", "from_snapshot", "ratio_pct", "turnover_pct",
+              "quantile", "q_ratio", "turnover24h", "change24h"] + ENRICH_FIELDS
+
+def hub_row(row, stats):
+    merged = dict(row, **stats)
+    return {field: merged.get(field) for field in HUB_FIELDS}
+
+class SpikeHub:
+    # Один сканер раздаёт состояние таблицы по WebSocket: при подключении — полный снимок,
+    # дальше после каждого цикла только изменившиеся и удалённые строки
+    def __init__(self, port, host=HUB_BIND):
+        self.port = port
+        self.host = host
+        self.runner = None
+        self.clients = set()  # очереди исходящих сообщений подписчиков
+        self.published = {}   # "symbol|category" -> строка, отправленная последней
+        self.market = None
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/ws', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        for queue in list(self.clients):
+            queue.put_nowait(None)
+        self.clients.clear()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        from aiohttp import web
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        # Снимок ставится в очередь до регистрации, поэтому ни одна дельта не потеряется
+        queue = asyncio.Queue()
+        queue.put_nowait(json.dumps({"type": "snapshot", "market": self.market,
+                                     "rows": list(self.published.values())}))
+        self.clients.add(queue)
+
+        async def sender():
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await ws.send_str(message)
+            await ws.close()
+
+        send_task = asyncio.ensure_future(sender())
+        try:
+            async for _ in ws:
+                pass  # входящие сообщения не ожидаются, чтение нужно для ping/close
+        finally:
+            self.clients.discard(queue)
+            send_task.cancel()
+        return ws
+
+    def publish(self, ticker_data, market_stats, market):
+        rows = {f"{k[0]}|{k[1]}": hub_row(v, market_stats.get(k, {})) for k, v in ticker_data.items()}
+        if market != self.market:
+            self.market = market
+            self.published = rows
+            self.broadcast({"type": "snapshot", "market": market, "rows": list(rows.values())})
+            return
+        upsert = [row for key, row in rows.items() if self.published.get(key) != row]
+        remove = [key.split("|", 1) for key in self.published if key not in rows]
+        self.published = rows
+        if upsert or remove:
+            self.broadcast({"type": "delta", "market": market, "upsert": upsert, "remove": remove})
+
+    def broadcast(self, message):
+        payload = json.dumps(message)
+        for queue in list(self.clients):
+            if queue.qsize() >= HUB_QUEUE_LIMIT:
+                # Подписчик не успевает читать: отключаем, после переподключения он получит снимок
+                self.clients.discard(queue)
+                queue.put_nowait(None)
+                continue
+            queue.put_nowait(payload)
+
+class HubSubscriber:
+    # Клиент хаба: держит соединение, переподключается с нарастающей паузой
+    def __init__(self, url, on_message, on_status):
+        self.url = url
+        self.on_message = on_message
+        self.on_status = on_status
+
+    async def run(self, session):
+        delay = 1
+        while True:
+            try:
+                async with session.ws_connect(self.url, heartbeat=30) as ws:
+                    delay = 1
+                    self.on_status(f"Хаб {self.url}: подключено")
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            try:
+                                self.on_message(json.loads(msg.data))
+                            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                                # Битое сообщение пропускается, соединение остаётся
+                                print(f"[Хаб] Пропущено некорректное сообщение: {e!r}")
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+                self.on_status(f"Хаб {self.url}: соединение закрыто, переподключение...")
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError, ValueError) as e:
+                self.on_status(f"Хаб {self.url}: нет соединения ({e}), повтор через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+class TradeStream:
+    # Лента publicTrade.<symbol> одной категории Bybit. Объём сделок копится в заранее
+    # выделенных кольцах: строка — тикер, слот — корзина в TRADE_BUCKET_SECONDS. Время берётся
+    # из меток сделок, поэтому расхождение локальных часов на окно не влияет
+    def __init__(self, category, url, capacity=1024):
+        self.category = category
+        self.url = url
+        self.volume = np.zeros((capacity, TRADE_SLOTS))
+        self.stamps = np.full((capacity, TRADE_SLOTS), -1, dtype=np.int64)
+        self.price = np.zeros(capacity)
+        self.baseline = np.zeros(capacity)  # объём в секунду при среднем темпе свечи
+        self.rows = {}  # топик -> строка
+        self.symbols = [None] * capacity  # строка -> символ
+        self.free_rows = list(range(capacity - 1, -1, -1))
+        self.last_ms = 0  # метка последней сделки — «текущее время» ленты
+        self.trades = 0
+        self.ws = None
+
+    def set_symbols(self, symbols):
+        # Синхронизация со вселенной: новые тикеры занимают свободные строки, подписка
+        # на живом соединении меняется только на разницу
+        wanted = {f"publicTrade.{symbol}" for symbol in symbols}
+        added = [topic for topic in wanted if topic not in self.rows]
+        removed = [topic for topic in self.rows if topic not in wanted]
+        for topic in removed:
+            row = self.rows.pop(topic)
+            self.symbols[row] = None
+            self.baseline[row] = 0.0
+            self.free_rows.append(row)
+        if len(added) > len(self.free_rows):
+            self.grow(len(self.rows) + len(added))
+        for topic in added:
+            row = self.rows[topic] = self.free_rows.pop()
+            self.symbols[row] = topic[len("publicTrade."):]
+            self.volume[row] = 0.0
+            self.stamps[row] = -1
+        if self.ws is not None and not self.ws.closed:
+            asyncio.ensure_future(self.send_topics("unsubscribe", removed))
+            asyncio.ensure_future(self.send_topics("subscribe", added))
+
+    def grow(self, needed):
+        old = len(self.symbols)
+        capacity = max(needed, old * 2)
+        self.volume = np.concatenate([self.volume, np.zeros((capacity - old, TRADE_SLOTS))])
+        self.stamps = np.concatenate([self.stamps, np.full((capacity - old, TRADE_SLOTS), -1, dtype=np.int64)])
+        self.price = np.concatenate([self.price, np.zeros(capacity - old)])
+        self.baseline = np.concatenate([self.baseline, np.zeros(capacity - old)])
+        self.symbols += [None] * (capacity - old)
+        self.free_rows += list(range(capacity - 1, old - 1, -1))
+
+    def set_baselines(self, rates):
+        # rates: символ -> объём в секунду (средняя свеча / длительность свечи)
+        for topic, row in self.rows.items():
+            self.baseline[row] = rates.get(self.symbols[row], 0.0)
+
+    def feed(self, raw):
+        # Горячий путь: сделки сообщения сначала суммируются по корзинам в локальных
+        # переменных, в массивы — одна запись на корзину, а не на сделку
+        message = json.loads(raw)
+        row = self.rows.get(message.get('topic'))
+        if row is None:
+            return  # ответы на подписку, pong
+        trades = message.get('data') or ()
+        bucket_ms = TRADE_BUCKET_SECONDS * 1000
+        bucket, total = -1, 0.0
+        for trade in trades:
+            b = trade['T'] // bucket_ms
+            if b != bucket:
+                if total:
+                    self.add(row, bucket, total)
+                bucket, total = b, 0.0
+            total += float(trade['v'])
+        if total:
+            self.add(row, bucket, total)
+        if trades:
+            last = trades[-1]
+            self.price[row] = float(last['p'])
+            if last['T'] > self.last_ms:
+                self.last_ms = last['T']
+            self.trades += len(trades)
+
+    def add(self, row, bucket, volume):
+        slot = bucket % TRADE_SLOTS
+        if self.stamps[row, slot] != bucket:
+            self.stamps[row, slot] = bucket
+            self.volume[row, slot] = 0.0
+        self.volume[row, slot] += volume
+
+    def bursts(self, threshold, horizon=TRADE_HORIZON):
+        # -> [(символ, объём за окно, темп к средней)] по всем тикерам одним проходом
+        now = self.last_ms // 1000 // TRADE_BUCKET_SECONDS
+        n = max(1, horizon // TRADE_BUCKET_SECONDS)
+        recent = (self.stamps > now - n) & (self.stamps <= now)
+        volume = np.where(recent, self.volume, 0.0).sum(axis=1)
+        pace = np.divide(volume / (n * TRADE_BUCKET_SECONDS), self.baseline,
+                         out=np.zeros_like(volume), where=self.baseline > 0)
+        return [(self.symbols[i], float(volume[i]), float(pace[i]))
+                for i in np.flatnonzero(pace >= threshold) if self.symbols[i] is not None]
+
+    async def send_topics(self, op, topics):
+        ws = self.ws
+        for i in range(0, len(topics), TRADE_SUBSCRIBE_CHUNK):
+            if ws is None or ws.closed:
+                return
+            await ws.send_str(json.dumps({"op": op, "args": topics[i:i + TRADE_SUBSCRIBE_CHUNK]}))
 
-    def restore_log_window_geometry(self):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
-        geometry = settings.value("log_window_geometry")
-        if geometry:
-            self.restoreGeometry(geometry)
-        pos = settings.value("log_window_pos")
-        if pos:
-            self.move(pos)
+    async def ping(self, ws):
+        while not ws.closed:
+            await asyncio.sleep(TRADE_PING_INTERVAL)
+            await ws.send_str('{"op":"ping"}')
 
-    def closeEvent(self, event):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
-        settings.setValue("log_window_geometry", self.saveGeometry())
-        settings.setValue("log_window_pos", self.pos())
-        super().closeEvent(event)
+    async def run(self, session, on_status):
+        # Соединение с переподключением; после каждого подключения — подписка на все топики
+        delay = 1
+        while True:
+            pinger = None
+            try:
+                async with session.ws_connect(self.url, heartbeat=30) as ws:
+                    self.ws = ws
+                    delay = 1
+                    await self.send_topics("subscribe", list(self.rows))
+                    pinger = asyncio.ensure_future(self.ping(ws))
+                    on_status(f"Лента сделок {self.category}: {len(self.rows)} тикеров")
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.feed(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError, ValueError) as e:
+                on_status(f"Лента сделок: нет соединения ({e}), повтор через {delay} с")
+            finally:
+                self.ws = None
+                if pinger is not None:
+                    pinger.cancel()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
 
-class NotificationSystem:
-    def __init__(self, parent):
-        self.parent = parent
-        self.notified_pairs = set()
-        self.log = []
-        self.load_log()
-    def load_log(self):
-        if os.path.exists(NOTIFICATION_LOG_FILE):
-            with open(NOTIFICATION_LOG_FILE, "r", encoding="utf-8") as f:
-                self.log = [line.strip() for line in f if line.strip()]
-        else:
-            self.log = []
-    def save_log(self):
-        with open(NOTIFICATION_LOG_FILE, "w", encoding="utf-8") as f:
-            for entry in self.log:
-                f.write(entry + "\n")
-    def check_and_notify(self, ticker_data):
-        if not self.parent.isVisible():
+class CycleProfiler:
+    # Профиль по запросу на N циклов без перезапуска под профайлером: длительности стадий
+    # цикла и выборочный профиль потока event loop — отдельный поток раз в PROFILE_INTERVAL
+    # снимает его стек. Результат — свёрнутые стеки (flamegraph.pl) и файл speedscope
+    def __init__(self):
+        self.cycles_left = 0
+        self.thread = None
+
+    @property
+    def active(self):
+        return self.cycles_left > 0
+
+    def start(self, cycles):
+        import threading
+        from collections import Counter
+        if self.active:
+            self.cycles_left = max(self.cycles_left, cycles)
             return
-        for key, data in ticker_data.items():
-            if not data or 'datetime' not in data:
-                continue
-            notification_id = f"{key}-{data['datetime']}"
-            if notification_id in self.notified_pairs:
-                continue
-            if (data['ratio'] >= self.parent.settings["min_ratio"] and 
-                data['volume'] >= self.parent.settings["min_volume"]):
-                self.notified_pairs.add(notification_id)
-                self.send_notification(data)
-    def send_notification(self, data):
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        tv_symbol = f"BYBIT:{data['symbol']}"
-        if data['category'] == 'linear':
-            tv_symbol += '.P'
-        tv_url = f"https://www.tradingview.com/chart/?symbol={tv_symbol}"
-        hashtag_symbol = f"#{data['symbol']}"
-        price = data.get('price', None)
-        price_str = f"цена: {price:.3f}" if price is not None else ""
-        # Ссылка в формате Markdown
-        link_md = f"[ссылка на график]({tv_url})"
-        message = (f"{hashtag_symbol} ({data['category']}) - {data['ratio']:.1f}x - {link_md}\n"
-                   f"{price_str}\n"
-                   f"Объем: {data['volume']:,.0f} USD\nВремя: {now}")
-        log_entry = f"[{now}] {data['symbol']} ({data['category']}) - {data['ratio']:.1f}x, {price_str}, Объем: {data['volume']:,.0f} USD"
-        self.log.insert(0, log_entry)
-        self.log = self.log[:500]  # ограничим журнал 500 последних событий
-        self.save_log()
-        # Telegram и звук
-        s = self.parent.settings
-        if s.get("enable_telegram") and s.get("telegram_token") and s.get("telegram_chat_id"):
-            self.send_telegram_message(
-                s["telegram_token"],
-                s["telegram_chat_id"],
-                message,
-                s.get("telegram_thread_id"),
-                parse_mode="Markdown"
-            )
-        if self.parent.settings["enable_sound"]:
-            try:
-                QSound.play("alert.wav")
-            except:
-                print("Не удалось воспроизвести звук alert.wav")
-        print(f"[ALERT] {now} - {message}")
-        self.parent.show_notification_log(message)
+        self.cycles_left = cycles
+        self.cycles = cycles
+        self.stacks = Counter()
+        self.events = []  # (стадия, начало, конец) по perf_counter
+        self.totals = {}  # стадия без вложенности (разбор JSON по всем запросам) -> список длительностей
+        self.started = time.perf_counter()
+        self.target = threading.get_ident()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.sample_loop, name="cycle-profiler", daemon=True)
+        self.thread.start()
 
-    def send_telegram_message(self, token, chat_id, text, thread_id=None, parse_mode="HTML"):
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        data = {
-            "chat_id": chat_id,
-            "text": text,
-            "parse_mode": parse_mode,
-            "disable_web_page_preview": True
+    def sample_loop(self):
+        frames = sys._current_frames
+        while not self.stop_event.wait(PROFILE_INTERVAL):
+            frame = frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stage(self, name):
+        return _ProfileStage(self, name) if self.active else _NO_STAGE
+
+    def add(self, name, seconds):
+        if self.active:
+            self.totals.setdefault(name, []).append(seconds)
+
+    def cycle_done(self):
+        # -> (путь профиля, сводка) после последнего цикла, иначе None
+        if not self.active:
+            return None
+        self.cycles_left -= 1
+        if self.cycles_left:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return self.write()
+
+    def summary(self):
+        durations = {}
+        for name, start, end in self.events:
+            durations.setdefault(name, []).append(end - start)
+        for name, values in self.totals.items():
+            durations[f"{name} (сумма по запросам)"] = [sum(values)]
+        lines = [f"{'стадия':<28}{'раз':>6}{'всего, мс':>12}{'среднее, мс':>13}{'макс, мс':>11}"]
+        for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            lines.append(f"{name:<28}{len(values):>6}{sum(values) * 1000:>12.1f}"
+                         f"{sum(values) / len(values) * 1000:>13.1f}{max(values) * 1000:>11.1f}")
+        return "\n".join(lines)
+
+    def write(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, datetime.now().strftime("profile-%Y%m%d-%H%M%S"))
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = self.summary()
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"Циклов: {self.cycles}, снимков стека: {sum(self.stacks.values())}, "
+                    f"интервал {PROFILE_INTERVAL * 1000:.0f} мс\n\n{summary}\n")
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f, ensure_ascii=False)
+        return base, summary
+
+    def speedscope(self):
+        # Два профиля в одном файле: выборка стеков event loop и стадии циклов по времени
+        frames, index = [], {}
+        def frame(name):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            return index[name]
+        samples = [[frame(name) for name in stack.split(";")] for stack in self.stacks]
+        weights = [count * PROFILE_INTERVAL * 1000 for count in self.stacks.values()]
+        events, open_ends = [], []
+        # Вложенные стадии корректны по построению (синхронные внутри асинхронных);
+        # пересекающиеся без вложенности отбрасываются — speedscope их не принимает
+        for name, start, end in sorted(self.events, key=lambda e: (e[1], -e[2])):
+            while open_ends and open_ends[-1][1] <= start:
+                closed, at = open_ends.pop()
+                events.append({"type": "C", "frame": closed, "at": (at - self.started) * 1000})
+            if open_ends and end > open_ends[-1][1]:
+                continue
+            events.append({"type": "O", "frame": frame(f"стадия: {name}"), "at": (start - self.started) * 1000})
+            open_ends.append((frame(f"стадия: {name}"), end))
+        while open_ends:
+            closed, at = open_ends.pop()
+            events.append({"type": "C", "frame": closed, "at": (at - self.started) * 1000})
+        total = (time.perf_counter() - self.started) * 1000
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {"type": "sampled", "name": "event loop", "unit": "milliseconds",
+                 "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights},
+                {"type": "evented", "name": "стадии циклов", "unit": "milliseconds",
+                 "startValue": 0, "endValue": total, "events": events},
+            ],
+            "name": f"{self.cycles} циклов",
+            "exporter": "bybit_volume_spikes",
         }
-        if thread_id:
-            if thread_id.isdigit():
-                data["message_thread_id"] = int(thread_id)
+
+class _ProfileStage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.events.append((self.name, self.start, time.perf_counter()))
+
+class _NoStage:
+    # Профиль выключен: стадия ничего не стоит
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_NO_STAGE = _NoStage()
+
+class NumericItem(QTableWidgetItem):
+    # Ячейка, сортируемая по числу, а не по тексту («1,200» < «900» для строк)
+    def __init__(self, text, value):
+        super().__init__(text)
+        self.setData(Qt.UserRole, value)
+
+    def __lt__(self, other):
+        a, b = self.data(Qt.UserRole), other.data(Qt.UserRole)
+        if a is None or b is None:
+            return super().__lt__(other)
+        return a < b
+
+SPARK_ROLE = Qt.UserRole + 1  # UserRole занят числом для сортировки NumericItem
+
+class SparklineDelegate(QStyledItemDelegate):
+    # Мини-график объёмов последних свечей против базовой линии. Картинка на тикер рисуется
+    # один раз и дальше только копируется из кэша, пока не придут новые данные (другая
+    # последняя свеча или объём) или не изменится размер ячейки
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        from collections import OrderedDict
+        self.cache = OrderedDict()  # (symbol, category) -> (версия, QPixmap)
+
+    def paint(self, painter, option, index):
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        style = opt.widget.style() if opt.widget is not None else QApplication.style()
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, opt, painter, opt.widget)  # фон и выделение
+        spark = index.data(SPARK_ROLE)
+        rect = option.rect.adjusted(2, 3, -2, -3)
+        if not spark or rect.width() < 8 or rect.height() < 4:
+            return
+        key, stamp, volumes, baseline, threshold = spark
+        scale = opt.widget.devicePixelRatioF() if opt.widget is not None else 1.0
+        version = (stamp, rect.width(), rect.height(), scale)
+        cached = self.cache.get(key)
+        if cached is None or cached[0] != version:
+            cached = self.cache[key] = (version, self.render(volumes, baseline, threshold, rect.width(), rect.height(), scale))
+            if len(self.cache) > SPARK_CACHE:
+                self.cache.popitem(last=False)
+        self.cache.move_to_end(key)
+        painter.drawPixmap(rect.topLeft(), cached[1])
+
+    @staticmethod
+    def render(volumes, baseline, threshold, width, height, scale):
+        pixmap = QPixmap(int(width * scale), int(height * scale))
+        pixmap.setDevicePixelRatio(scale)
+        pixmap.fill(Qt.transparent)
+        top = max(float(np.nanmax(volumes)) if np.isfinite(volumes).any() else 0.0, baseline, 1e-9)
+        bar = width / len(volumes)
+        painter = QPainter(pixmap)
+        for i, volume in enumerate(volumes.tolist()):
+            if volume != volume or volume <= 0:
+                continue  # свечи нет в кольце
+            h = max(1.0, volume / top * height)
+            if volume >= baseline * threshold:
+                color = QColor(255, 165, 0)
+            elif i == len(volumes) - 1:
+                color = QColor(0, 200, 255)  # текущая свеча
             else:
-                print(f"[Telegram] Некорректный message_thread_id: {thread_id}")
-        try:
-            resp = requests.post(url, data=data, timeout=10)
-            if not resp.ok:
-                print(f"[Telegram] Ошибка отправки: {resp.status_code} {resp.text}")
-        except Exception as e:
-            print(f"[Telegram] Ошибка отправки: {e}")
-    def show_notification_log(self, current_message):
-        dlg = QDialog(self.parent)
-        dlg.setWindowTitle("Уведомление и журнал")
-        dlg.setMinimumWidth(600)
-        dlg.setMinimumHeight(400)
-        layout = QVBoxLayout(dlg)
-        label = QLabel(f"<b>Новое уведомление:</b><br>{current_message.replace(chr(10), '<br>')}")
-        layout.addWidget(label)
-        text_edit = QTextEdit(dlg)
-        text_edit.setReadOnly(True)
-        text_edit.setPlainText("\n".join(self.log))
-        layout.addWidget(text_edit)
-        btn_box = QDialogButtonBox(QDialogButtonBox.Ok)
-        btn_box.accepted.connect(dlg.accept)
-        layout.addWidget(btn_box)
-        # Авто-закрытие через 5 секунд
-        from PyQt5.QtCore import QTimer
-        QTimer.singleShot(5000, dlg.accept)
-        dlg.show()
+                color = QColor(110, 140, 170)
+            painter.fillRect(int(i * bar), int(height - h), max(1, int(bar) - 1), int(h) + 1, color)
+        if baseline > 0:
+            pen = QPen(QColor(200, 200, 200))
+            pen.setStyle(Qt.DashLine)
+            painter.setPen(pen)
+            y = int(height - baseline / top * height)
+            painter.drawLine(0, y, width, y)
+        painter.end()
+        return pixmap
+
+def quantile_item(quantile, q_ratio):
+    # Порог — квантиль 15м объёма тикера за горизонт; текущая 15м свеча выше него подсвечена
+    if quantile is None or quantile != quantile:
+        return NumericItem("—", float('-inf'))
+    item = NumericItem(f"{quantile:,.0f}", quantile)
+    if q_ratio is not None and q_ratio == q_ratio:
+        item.setToolTip(f"Текущая 15м свеча: {q_ratio:.2f} от квантиля")
+        if q_ratio >= 1:
+            item.setForeground(QBrush(QColor(0, 200, 255)))
+    return item
+
+def format_rank(value):
+    return "—" if value is None or value != value else f"{value:.0f}%"
+
+def pct_item(value, fmt):
+    # Пустые значения при сортировке уходят в конец
+    if value is None:
+        return NumericItem("—", float('-inf'))
+    return NumericItem(fmt.format(value), value)
 
 class BybitVolumeSpikesWidget(QWidget):
     def __init__(self):
@@ -336,6 +3320,11 @@ class BybitVolumeSpikesWidget(QWidget):
         self.status_label = QLabel("Загрузка...")
         self.status_label.setFont(QFont("Arial", 10))
         layout.addWidget(self.status_label)
+        # Перцентили задержки уведомлений, по участкам — во всплывающей подсказке
+        self.alert_traces = None  # AlertTraceLog, читается после показа окна (load_stats)
+        self.latency_label = QLabel()
+        self.latency_label.setFont(QFont("Arial", 10))
+        layout.addWidget(self.latency_label)
         
         # Панель фильтров
         filter_layout = QHBoxLayout()
@@ -368,6 +3357,11 @@ class BybitVolumeSpikesWidget(QWidget):
         self.show_all_cb = QCheckBox("Показывать все тикеры")
         self.show_all_cb.stateChanged.connect(self.update_table)
         filter_layout.addWidget(self.show_all_cb)
+
+        self.top_cb = QCheckBox(f"Топ-{TOP_K} аномалий")
+        self.top_cb.setToolTip("Самые высокие кратности по выбранному рынку, без учёта порогов")
+        self.top_cb.stateChanged.connect(self.update_table)
+        filter_layout.addWidget(self.top_cb)
         
         # Кнопки
         self.refresh_btn = QPushButton("Обновить")
@@ -381,15 +3375,25 @@ class BybitVolumeSpikesWidget(QWidget):
         self.log_btn = QPushButton("Журнал уведомлений")
         self.log_btn.clicked.connect(self.show_notification_log)
         filter_layout.addWidget(self.log_btn)
+        self.profile_btn = QPushButton("Профиль")
+        self.profile_btn.setToolTip(f"Записать профиль следующих {PROFILE_CYCLES} циклов в папку {PROFILE_DIR}/: "
+                                    "время стадий и выборку стеков (speedscope, flamegraph)")
+        self.profile_btn.clicked.connect(lambda: self.start_profile())
+        filter_layout.addWidget(self.profile_btn)
 
         filter_layout.addStretch(1)
         layout.addLayout(filter_layout)
         
         # Таблица
-        self.table = QTableWidget(0, 6)
+        self.table = QTableWidget(0, 14)
         self.table.setHorizontalHeaderLabels([
-            "Тикер", "Тип", "Средний объём", "Текущий объём", "Кратн.", "Время"
+            "Тикер", "Тип", "Средний объём", "Текущий объём", "Кратн.", "Время",
+            "Ранг кратн.", "Ранг оборота", "24ч", "OI 1ч", "Фандинг", "Стакан", "Квантиль 15м",
+            "График объёма"
         ])
+        self.table.setItemDelegateForColumn(13, SparklineDelegate(self.table))
+        # Клик по заголовку сортирует по столбцу; до первого клика порядок задаёт панель
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.DescendingOrder)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.setEditTriggers(QTableWidget.NoEditTriggers)
         self.table.setSelectionBehavior(QTableWidget.SelectRows)
@@ -403,6 +3407,24 @@ class BybitVolumeSpikesWidget(QWidget):
         self.ticker_data = {}
         self.tickers = []
         self.ignored_tickers = set()
+        self.scanner = None
+        self.store = None  # кольцо последних свечей по всем тикерам
+        self.candles_at = None  # время последней загрузки свечей в кольцо
+        self.profiler = CycleProfiler()  # профиль по запросу: кнопка, SIGUSR1 или --profile-cycles
+        self.curves = {}  # таймфрейм -> профиль набора объёма внутри свечи
+        self.curves_store = None  # кольцо, к строкам которого привязаны частичные объёмы профилей
+        self.correlation = VolumeCorrelation()  # совместные движения объёма для группировки уведомлений
+        self.sketch = None  # квантили 15м объёма за долгий горизонт, читаются при первых свечах (restore_sketch)
+        self.loading = False
+        self.unseeded = set()
+        self.session = None
+        self.fetcher = None
+        self.hub = None
+        self.hub_task = None
+        self.trade_stream = None  # лента сделок Bybit для ранних всплесков
+        self.trade_task = None
+        self.trade_timer = QTimer(self)
+        self.trade_timer.timeout.connect(self.check_trade_bursts)
         self.loop = None
         self.timer = QTimer(self)
         self.update_task = None
@@ -410,27 +3432,57 @@ class BybitVolumeSpikesWidget(QWidget):
         
         # Загрузка настроек
         self.load_settings()
+        self.limiters = make_limiters(self.settings["rate_limit_rps"])
         self.apply_font_size()
-        # Восстановить выбор типа
+        # Восстановить выбор типа (без сигнала, загрузку запускает главный цикл)
+        for radio in (self.spot_radio, self.linear_radio):
+            radio.blockSignals(True)
         if self.settings.get("selected_type", "spot") == "spot":
             self.spot_radio.setChecked(True)
         else:
             self.linear_radio.setChecked(True)
+        for radio in (self.spot_radio, self.linear_radio):
+            radio.blockSignals(False)
         self.timer.start(self.settings["update_interval"] * 1000)
         
-        # Система уведомлений
+        # Кэш списка инструментов и фоновая проверка новых листингов
+        self.universe = InstrumentUniverse(self.settings["universe_ttl"] * 60)
+        self.enricher = Enricher()
+        self.history = SpikeHistory() if self.settings["history_enabled"] else None
+        self.universe_timer = QTimer(self)
+        self.universe_timer.timeout.connect(lambda: qasync.asyncio.ensure_future(self.refresh_universe()))
+        self.universe_timer.start(self.settings["universe_ttl"] * 60 * 1000)
+        
+        # Система уведомлений и правила
+        self.market_stats = {}
+        self.rule_engine = AlertRuleEngine()
+        self.apply_alert_rules()
         self.notifier = NotificationSystem(self)
         
-        # Запуск инициализации
+        # Запуск инициализации: сразу показываем последний снимок, живые данные догружаются
         self.init_task = None
-        self.load_stats()
         self.notification_log_dialog = None
         self.apply_font_sizes()
         self.restore_main_window_geometry()
+        self.restore_snapshot()
+        self.snapshot_timer = QTimer(self)
+        self.snapshot_timer.timeout.connect(self.save_snapshot)
+        self.snapshot_timer.start(SNAPSHOT_INTERVAL * 1000)
 
     def set_status(self, text):
         self.status_label.setText(text)
 
+    def trace_log(self):
+        if self.alert_traces is None:
+            self.alert_traces = AlertTraceLog()
+        return self.alert_traces
+
+    def update_latency_label(self):
+        traces = self.trace_log()
+        self.latency_label.setText(traces.summary())
+        if len(traces.recent):
+            self.latency_label.setToolTip(f"<pre>{AlertTraceLog.table(traces.recent)}</pre>")
+
     def show_context_menu(self, pos):
         idx = self.table.indexAt(pos)
         if not idx.isValid() or idx.column() != 0:
@@ -443,26 +3495,41 @@ class BybitVolumeSpikesWidget(QWidget):
         menu = QMenu(self)
         
         # Открыть в TradingView
-        open_tv = QAction("Открыть в TradingView", self)
+        open_tv = QAction("Открыть в TradingView", menu)
         open_tv.triggered.connect(lambda: self.open_tradingview(symbol, category))
         menu.addAction(open_tv)
         
         # Скопировать тикер
-        copy_ticker = QAction("Скопировать тикер", self)
+        copy_ticker = QAction("Скопировать тикер", menu)
         copy_ticker.triggered.connect(lambda: self.copy_to_clipboard(symbol))
         menu.addAction(copy_ticker)
         
         # Игнорировать тикер
-        ignore_ticker = QAction("Игнорировать тикер", self)
+        ignore_ticker = QAction("Игнорировать тикер", menu)
         ignore_ticker.triggered.connect(lambda: self.ignore_ticker(symbol, category))
         menu.addAction(ignore_ticker)
         
+        # История всплесков тикера
+        if self.history is not None:
+            show_history = QAction("История всплесков (30 дней)", menu)
+            show_history.triggered.connect(lambda: self.show_spike_history(symbol, category))
+            menu.addAction(show_history)
+        
         # Показать все игнорируемые
-        show_ignored = QAction("Показать игнорируемые", self)
+        show_ignored = QAction("Показать игнорируемые", menu)
         show_ignored.triggered.connect(self.show_ignored_tickers)
         menu.addAction(show_ignored)
         
         menu.exec_(self.table.viewport().mapToGlobal(pos))
+        menu.deleteLater()  # меню и его действия не копятся среди дочерних объектов окна
+
+    def show_spike_history(self, symbol, category):
+        spikes = self.history.spikes(symbol, category, days=30, min_ratio=self.settings["min_ratio"])
+        lines = [f"{datetime.fromtimestamp(x['candle']).strftime('%d.%m %H:%M')} — {x['ratio']:.1f}x, "
+                 f"объём {x['volume']:,.0f}, цена {x['price']:.4g}" for x in spikes[-30:]]
+        text = (f"Всплесков ≥{self.settings['min_ratio']:.1f}x за 30 дней: {len(spikes)}\n\n" + "\n".join(lines)
+                if spikes else "За 30 дней всплесков не было")
+        QMessageBox.information(self, f"История {symbol} ({category})", text)
 
     def ignore_ticker(self, symbol, category):
         self.ignored_tickers.add((symbol, category))
@@ -482,6 +3549,7 @@ class BybitVolumeSpikesWidget(QWidget):
         msg.setDetailedText(ignored_list)
         msg.setStandardButtons(QMessageBox.Ok)
         msg.exec_()
+        msg.deleteLater()
 
     def copy_to_clipboard(self, text):
         clipboard = QApplication.clipboard()
@@ -494,60 +3562,99 @@ class BybitVolumeSpikesWidget(QWidget):
         min_ratio = self.settings["min_ratio"]
         min_volume = self.settings["min_volume"]
         show_all = self.show_all_cb.isChecked()
+        top_only = self.top_cb.isChecked()
+        # С прогнозом незакрытая свеча фильтруется, сортируется и подсвечивается по прогнозу
+        if self.settings["projection"] != "off":
+            ratio_of = lambda r: r.get('proj_ratio') or r['ratio']
+            volume_of = lambda r: r.get('proj_volume') or r['volume']
+        else:
+            ratio_of, volume_of = lambda r: r['ratio'], lambda r: r['volume']
         table_font = self.table.font()
         table_font.setPointSize(self.settings.get("font_size_table", 12))
-        print(f"[DEBUG] update_table: type_filter={type_filter}, show_all={show_all}, min_ratio={min_ratio}, min_volume={min_volume}")
-        print(f"[DEBUG] Всего тикеров в ticker_data: {len(self.ticker_data)}")
-        for k, v in self.ticker_data.items():
-            print(f"[DEBUG] {v['symbol']} category: {v['category']}, volume: {v['volume']}, ratio: {v['ratio']}")
         rows = []
         for key, v in self.ticker_data.items():
             if key in self.ignored_tickers:
                 continue
-            if v['category'] != type_filter:
+            if category_market(v['category']) != type_filter:
                 continue
             if name_filter and name_filter not in v['symbol'].upper():
                 continue
-            if not show_all:
-                if v['volume'] < min_volume or v['ratio'] < min_ratio:
+            if not show_all and not top_only:
+                if volume_of(v) < min_volume or ratio_of(v) < min_ratio:
                     continue
             rows.append(v)
         # Сортировка
-        if self.volume_sort_cb.isChecked():
+        if top_only:
+            ratios = np.fromiter((ratio_of(r) for r in rows), dtype=np.float64, count=len(rows))
+            rows = [rows[i] for i in top_k_indices(ratios, TOP_K)]
+        elif self.volume_sort_cb.isChecked():
             rows.sort(key=lambda x: x['volume'], reverse=True)
         else:
-            rows.sort(key=lambda x: x['ratio'], reverse=True)
+            rows.sort(key=ratio_of, reverse=True)
         # Отображение
-        max_ratio = max(r['ratio'] for r in rows) if rows else 0
+        max_ratio = max(ratio_of(r) for r in rows) if rows else 0
+        stale_after = self.settings["update_interval"] * STALE_AFTER_CYCLES
+        now = time.time()
+        sparks = self.sparklines(rows)
+        # Пока строки заполняются, сортировка по заголовку отключена, иначе строки «уезжают»
+        self.table.setSortingEnabled(False)
         self.table.setRowCount(len(rows))
         for row_idx, r in enumerate(rows):
+            ratio_pct, turnover_pct = r.get('ratio_pct'), r.get('turnover_pct')
+            ratio = ratio_of(r)
             items = [
                 QTableWidgetItem(r['symbol']),
                 QTableWidgetItem(r['category']),
-                QTableWidgetItem(f"{r['mean']:,.0f}"),
-                QTableWidgetItem(f"{r['volume']:,.0f}"),
-                QTableWidgetItem(f"{r['ratio']:.2f}"),
+                NumericItem(f"{r['mean']:,.0f}", r['mean']),
+                NumericItem(f"{r['volume']:,.0f}", r['volume']),
+                NumericItem(f"≈{ratio:.2f}" if ratio > r['ratio'] else f"{ratio:.2f}", ratio),
                 QTableWidgetItem(r['datetime']),
+                NumericItem(format_rank(ratio_pct), -1.0 if ratio_pct is None or ratio_pct != ratio_pct else ratio_pct),
+                NumericItem(format_rank(turnover_pct), -1.0 if turnover_pct is None or turnover_pct != turnover_pct else turnover_pct),
+                pct_item((self.market_stats.get((r['symbol'], r['category'])) or {}).get('change24h'), "{:+.1f}%"),
+                pct_item(r.get('oi_change'), "{:+.1f}%"),
+                pct_item(r.get('funding'), "{:+.4f}%"),
+                pct_item(r.get('imbalance'), "{:+.0f}%"),
+                quantile_item(r.get('quantile'), r.get('q_ratio')),
+                QTableWidgetItem(),
             ]
+            series = sparks.get((r['symbol'], r['category']))
+            if series is not None:
+                items[13].setData(SPARK_ROLE, ((r['symbol'], r['category']), (r.get('candle_ts'), r['volume'], r['mean'], min_ratio),
+                                               series, r['mean'], min_ratio))
+            if ratio > r['ratio']:
+                items[4].setToolTip(f"Прогноз по доле прошедшей свечи, сейчас {r['ratio']:.2f}x")
             # Применяем шрифт к каждому элементу
             for item in items:
                 item.setFont(table_font)
             # Цветовая индикация
-            if r['ratio'] == max_ratio and max_ratio > 1:
+            if ratio == max_ratio and max_ratio > 1:
                 for item in items:
                     item.setBackground(QBrush(QColor(0, 60, 0)))  # Темно-зеленый
                 items[4].setForeground(QBrush(QColor(0, 255, 0)))  # Зеленый текст для кратности
-            elif r['ratio'] > 3:
+            elif ratio > 3:
                 for item in items:
                     item.setBackground(QBrush(QColor(80, 50, 0)))  # Темно-оранжевый
                 items[4].setForeground(QBrush(QColor(255, 165, 0)))  # Оранжевый текст
-            elif r['ratio'] > 2:
+            elif ratio > 2:
                 for item in items:
                     item.setBackground(QBrush(QColor(60, 60, 0)))  # Темно-желтый
                 items[4].setForeground(QBrush(QColor(255, 215, 0)))  # Желтый текст
+            # Верхний перцентиль своей категории — аномалия относительно всего рынка
+            for col, pct in ((6, ratio_pct), (7, turnover_pct)):
+                if pct is not None and pct >= 99:
+                    items[col].setForeground(QBrush(QColor(0, 200, 255)))
+            # Устаревшие данные: давно не было успешного ответа по тикеру
+            age = now - (r.get('updated_at') or now)
+            if age > stale_after or r.get('from_snapshot'):
+                items[5].setText(f"{r['datetime']} ⚠")
+                for item in items:
+                    item.setForeground(QBrush(QColor(128, 128, 128)))
+                    item.setToolTip(f"Данные устарели: {age / 60:.0f} мин назад")
             # Установка элементов в таблицу
             for col_idx, item in enumerate(items):
                 self.table.setItem(row_idx, col_idx, item)
+        self.table.setSortingEnabled(True)
         # Обновление статуса
         visible_count = len(rows)
         total_count = len(self.ticker_data)
@@ -559,6 +3666,18 @@ class BybitVolumeSpikesWidget(QWidget):
         )
         self.table.resizeRowsToContents()
 
+    def sparklines(self, rows):
+        # Объёмы последних свечей показанных тикеров — срезом кольца, без запросов к бирже
+        store = self.store
+        if store is None:
+            return {}
+        keys = [(r['symbol'], r['category']) for r in rows if (r['symbol'], r['category']) in store.rows]
+        if not keys:
+            return {}
+        series = store.buckets([store.rows[key] for key in keys], self.candles_at or time.time(),
+                               SPARK_CANDLES, self.settings["timeframe"])
+        return dict(zip(keys, series))
+
     def manual_refresh(self):
         self.set_status("Ручное обновление...")
         import qasync
@@ -566,22 +3685,58 @@ class BybitVolumeSpikesWidget(QWidget):
 
     def open_settings(self):
         dialog = SettingsDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            new_settings = dialog.get_settings()
+        accepted = dialog.exec_() == QDialog.Accepted
+        new_settings = dialog.get_settings()
+        dialog.deleteLater()  # диалог — дочерний объект окна, без удаления копится при каждом открытии
+        if accepted:
             
             # Обновляем интервал таймера при изменении
             if new_settings["update_interval"] != self.settings["update_interval"]:
                 self.timer.stop()
                 self.timer.start(new_settings["update_interval"] * 1000)
+            if new_settings["universe_ttl"] != self.settings["universe_ttl"]:
+                self.universe.ttl = new_settings["universe_ttl"] * 60
+                self.universe_timer.start(new_settings["universe_ttl"] * 60 * 1000)
             
-            # Пересчитываем средние значения при изменении периода
-            if new_settings["mean_candles"] != self.settings["mean_candles"]:
-                self.set_status("Пересчёт средних значений...")
-                import qasync
-                qasync.asyncio.ensure_future(self.safe_update_online())
+            # Окно, метод и таймфрейм базовой линии пересчитываются по сохранённым свечам
+            import qasync
+            baseline_changed = any(new_settings[k] != self.settings[k] for k in ("mean_candles", "baseline", "timeframe", "projection", "sketch_quantile"))
             
+            # Перезагрузка при изменении числа процессов, лимита или площадок
+            restart_scanner = (
+                new_settings["worker_processes"] != self.settings["worker_processes"] or
+                new_settings["rate_limit_rps"] != self.settings["rate_limit_rps"] or
+                new_settings["exchanges"] != self.settings["exchanges"]
+            )
+            
+            hub_changed = any(new_settings[k] != self.settings[k] for k in ("hub_mode", "hub_port", "hub_bind", "hub_url"))
+            sinks_changed = any(new_settings[k] != self.settings[k] for k in ("sink_webhook_url", "sink_jsonl_path", "sink_socket_path"))
+            # Порог ленты читается при каждой проверке, перезапуск — только при включении/выключении
+            trade_changed = (hub_changed or new_settings["exchanges"] != self.settings["exchanges"] or
+                             (new_settings["trade_ratio"] > 0) != (self.settings["trade_ratio"] > 0))
+            
+            new_settings["selected_type"] = self.settings["selected_type"]
             self.settings = new_settings
             self.save_settings()
+            self.limiters = make_limiters(self.settings["rate_limit_rps"])
+            self.apply_alert_rules()
+            if self.settings["history_enabled"] != (self.history is not None):
+                self.history = SpikeHistory() if self.settings["history_enabled"] else None
+            if self.fetcher is not None:
+                self.fetcher.limiters = self.limiters
+            if hub_changed:
+                self.apply_hub_mode()
+                if self.settings["hub_mode"] != "subscribe":
+                    restart_scanner = True
+            if trade_changed:
+                self.apply_trade_stream()
+            if sinks_changed:
+                self.notifier.apply_sinks()
+            if restart_scanner and self.settings["hub_mode"] != "subscribe":
+                self.set_status("Перезапуск сканеров...")
+                qasync.asyncio.ensure_future(self.async_load_stats())
+            elif baseline_changed and self.settings["hub_mode"] != "subscribe":
+                self.recompute_baselines()
             self.apply_font_size()
             self.apply_font_sizes()
             self.update_table()
@@ -666,11 +3821,8 @@ class BybitVolumeSpikesWidget(QWidget):
         """
 
     def open_tradingview(self, symbol, category):
-        tv_symbol = f"BYBIT:{symbol}"
-        if category == 'linear':
-            tv_symbol += '.P'
-        url = f"https://www.tradingview.com/chart/?symbol={tv_symbol}"
-        webbrowser.open(url)
+        adapter, market = resolve_category(category)
+        webbrowser.open(adapter.chart_url(symbol, market))
 
     def on_double_click(self, index):
         if index.row() >= 0 and index.column() >= 0:
@@ -678,29 +3830,55 @@ class BybitVolumeSpikesWidget(QWidget):
             category = self.table.item(index.row(), 1).text()
             self.open_tradingview(symbol, category)
 
-    def on_type_changed(self):
+    def on_type_changed(self, checked=True):
+        if not checked:
+            return  # toggled приходит и от снятой кнопки
         selected = "spot" if self.spot_radio.isChecked() else "linear"
         self.settings["selected_type"] = selected
         self.save_settings()
+        if self.settings["hub_mode"] == "subscribe":
+            self.update_table()  # рынок сканирует хаб, показываем то, что он раздаёт
+            return
+        self.apply_trade_stream()
         self.set_status("Загрузка истории и расчёт средних...")
         import qasync
         qasync.asyncio.ensure_future(self.async_load_stats())
 
     def load_settings(self):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
         self.settings = {
             "min_ratio": settings.value("min_ratio", 2.0, float),
             "min_volume": settings.value("min_volume", 10000, float),
             "update_interval": settings.value("update_interval", 90, int),
             "mean_candles": settings.value("mean_candles", 20, int),
+            "baseline": settings.value("baseline", "mean", str),
+            "timeframe": settings.value("timeframe", 15, int),
+            "projection": settings.value("projection", "off", str),
+            "sketch_quantile": settings.value("sketch_quantile", 0.99, float),
+            "sketch_days": settings.value("sketch_days", 30, int),
+            "worker_processes": settings.value("worker_processes", 0, int),
+            "rate_limit_rps": settings.value("rate_limit_rps", 50, int),
+            "exchanges": settings.value("exchanges", "bybit", str),
+            "universe_ttl": settings.value("universe_ttl", 5, int),
+            "enrich_ratio": settings.value("enrich_ratio", 1.5, float),
+            "trade_ratio": settings.value("trade_ratio", 0.0, float),
+            "history_enabled": settings.value("history_enabled", True, bool),
+            "hub_mode": settings.value("hub_mode", "off", str),
+            "hub_port": settings.value("hub_port", HUB_PORT, int),
+            "hub_bind": settings.value("hub_bind", HUB_BIND, str),
+            "hub_url": settings.value("hub_url", f"ws://127.0.0.1:{HUB_PORT}/ws", str),
+            "alert_rules": settings.value("alert_rules", DEFAULT_ALERT_RULES, str),
             "enable_sound": settings.value("enable_sound", True, bool),
             "enable_popup": settings.value("enable_popup", True, bool),
+            "popup_min_interval": settings.value("popup_min_interval", 10, int),
             "selected_type": settings.value("selected_type", "spot", str),
             "telegram_token": settings.value("telegram_token", "", str),
             "telegram_chat_id": settings.value("telegram_chat_id", "", str),
             "telegram_thread_id": settings.value("telegram_thread_id", "", str),
             "enable_telegram": settings.value("enable_telegram", False, bool),
-            "log_limit": settings.value("log_limit", 50, int),
+            "sink_webhook_url": settings.value("sink_webhook_url", "", str),
+            "sink_jsonl_path": settings.value("sink_jsonl_path", "", str),
+            "sink_socket_path": settings.value("sink_socket_path", "", str),
             "font_size": settings.value("font_size", 12, int),
             "font_size_table": settings.value("font_size_table", 12, int),
             "font_size_panel": settings.value("font_size_panel", 12, int),
@@ -712,7 +3890,7 @@ class BybitVolumeSpikesWidget(QWidget):
             self.ignored_tickers = set(tuple(t.split(':')) for t in ignored.split(';') if t)
 
     def save_settings(self):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
         for key, value in self.settings.items():
             settings.setValue(key, value)
         # Сохранение игнорируемых тикеров
@@ -720,72 +3898,289 @@ class BybitVolumeSpikesWidget(QWidget):
         settings.setValue("ignored_tickers", ignored_str)
 
     def load_stats(self):
+        # Запускается из главного цикла: хабу и подписке нужен работающий event loop
+        self.update_latency_label()
+        self.apply_hub_mode()
+        if self.settings["hub_mode"] == "subscribe":
+            return  # данные приходят с хаба, к бирже не обращаемся
+        self.apply_trade_stream()
         self.set_status("Загрузка истории и расчёт средних...")
         asyncio.ensure_future(self.async_load_stats())
 
-    async def recalculate_means(self):
-        from_ts = self.get_window_timestamp()
-        selected_type = self.settings.get("selected_type", "spot")
-        for idx, (symbol, category) in enumerate(self.tickers):
-            if (symbol, category) in self.ignored_tickers:
-                continue
-                
-            klines = await self.get_klines(symbol, category, from_ts)
-            if not klines or len(klines) < 4:  # Минимум 1 час данных
-                continue
-                
-            volumes = [float(k[5]) for k in klines]
-            mean = float(np.mean(volumes))
-            
-            if (symbol, category) in self.ticker_data:
-                self.ticker_data[(symbol, category)]['mean'] = mean
-                # Пересчитываем соотношение
-                volume = self.ticker_data[(symbol, category)].get('volume', 0)
-                self.ticker_data[(symbol, category)]['ratio'] = volume / (mean + 1e-9)
-            
-            if (idx+1) % 20 == 0:
-                self.set_status(f"Пересчёт: {idx+1}/{len(self.tickers)}")
-                
+    def bucket_start(self, now=None):
+        # Начало текущей свечи выбранного таймфрейма (UTC, как у бирж)
+        period = self.settings["timeframe"] * 60
+        return int(now or time.time()) // period * period
+
+    def required_retain(self):
+        return max(CANDLE_RETAIN, required_retain(self.settings["mean_candles"], self.settings["timeframe"]))
+
+    def derive_candles(self, keys, now=None):
+        rows = [self.store.rows[key] for key in keys]
+        return self.store.derive(rows, now or time.time(), self.settings["mean_candles"],
+                                 self.settings["timeframe"], self.settings["baseline"])
+
+    def apply_candles(self, keys, now=None):
+        # Объём текущей и двух предыдущих свечей, базовая линия и кратность — одним проходом
+        if self.store is None:
+            return
+        keys = [key for key in keys if key in self.store.rows and key in self.ticker_data]
+        if not keys:
+            return
+        now = now or time.time()
+        self.candles_at = now
+        baseline, volume, prev, prev2 = self.derive_candles(keys, now)
+        # Прогноз незакрытой свечи: объём делится на долю, обычно набранную к этому моменту.
+        # Считается всегда (его получают и подписчики хаба), в правила идёт при включённом прогнозе
+        period = self.settings["timeframe"] * 60
+        start = self.bucket_start(now)
+        fraction = (now - start) / period
+        curve = self.volume_curve()
+        curve.observe([self.store.rows[key] for key in keys], start // period, fraction, volume, prev)
+        self.correlation.update(self.store, now)
+        # Квантиль 15м объёма за горизонт и текущая 15м свеча относительно него
+        if self.sketch is None:
+            self.restore_sketch()
+        self.sketch.update(keys, self.store, now, self.settings["sketch_days"])
+        quantile = self.sketch.quantile(keys, self.settings["sketch_quantile"])
+        volume15 = np.nan_to_num(self.store.buckets([self.store.rows[key] for key in keys], now, 1, 15)[:, 0])
+        for key, q, q_ratio in zip(keys, quantile.tolist(), (volume15 / quantile).tolist()):
+            self.ticker_data[key].update(quantile=q, q_ratio=q_ratio)
+        share = curve.share(fraction) if self.settings["projection"] == "curve" else fraction
+        projected = volume / max(share, PROJECTION_FLOOR)
+        for key, mean, vol, prev_vol, prev2_vol, proj in zip(keys, baseline.tolist(), volume.tolist(),
+                                                              prev.tolist(), prev2.tolist(), projected.tolist()):
+            row = self.ticker_data[key]
+            if mean == mean:  # NaN — в окне мало свечей, остаётся прежняя базовая линия
+                row['mean'] = mean
+            row.update(volume=vol, prev_volume=prev_vol, prev2_volume=prev2_vol,
+                       ratio=vol / (row['mean'] + 1e-9),
+                       proj_volume=max(proj, vol), proj_ratio=max(proj, vol) / (row['mean'] + 1e-9))
+
+    def spike_groups(self, keys):
+        # -> списки позиций keys: тикеры, чей объём движется вместе, в одной группе;
+        # без кольца свечей (подписчик хаба) каждый тикер сам по себе
+        store = self.store
+        positions = [i for i, key in enumerate(keys) if store is not None and key in store.rows]
+        grouped = {}
+        if positions and self.correlation.store is store:
+            labels = self.correlation.groups([store.rows[keys[i]] for i in positions])
+            for i, label in zip(positions, labels.tolist()):
+                grouped.setdefault(positions[label], []).append(i)
+        placed = {i for group in grouped.values() for i in group}
+        return list(grouped.values()) + [[i] for i in range(len(keys)) if i not in placed]
+
+    def volume_curve(self):
+        # Профиль свой у каждого таймфрейма и сохраняется в настройках между запусками
+        timeframe = self.settings["timeframe"]
+        curve = self.curves.get(timeframe)
+        if curve is None:
+            saved = QSettings("VolumeSpikes", SETTINGS_APP).value(f"volume_curve_{timeframe}", "", str)
+            try:
+                shape = [float(x) for x in saved.split(",")] if saved else None
+            except ValueError:
+                shape = None
+            curve = self.curves[timeframe] = VolumeCurve(shape)
+        if self.curves_store is not self.store:
+            # Строки нового кольца не совпадают со старыми: частичные объёмы набираются заново
+            self.curves_store = self.store
+            for c in self.curves.values():
+                c.reset()
+        return curve
+
+    def save_curves(self):
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
+        for timeframe, curve in self.curves.items():
+            settings.setValue(f"volume_curve_{timeframe}", ",".join(f"{x:.4f}" for x in curve.shape))
+
+    def recompute_baselines(self):
+        # Окно, метод и таймфрейм пересчитываются по сохранённым свечам без запросов к бирже;
+        # догрузка нужна, только если окно длиннее сохранённой истории
+        if self.store is None:
+            return
+        if not self.store.covers(self.settings["mean_candles"], self.settings["timeframe"]):
+            self.set_status("Окно длиннее сохранённой истории — догрузка свечей...")
+            asyncio.ensure_future(self.fill_candle_gap())
+            return
+        started = time.perf_counter()
+        # Относительно момента последней загрузки: новая свеча ещё не скачана
+        now = self.candles_at or time.time()
+        bucket_start = self.bucket_start(now)
+        dt = datetime.fromtimestamp(bucket_start, timezone.utc).strftime('%H:%M')
+        keys = [key for key, row in self.ticker_data.items() if not row.get('from_snapshot')]
+        for key in keys:
+            self.ticker_data[key].update(datetime=dt, candle_ts=bucket_start)
+        self.apply_candles(keys, now)
         self.update_table()
-        self.set_status("Средние значения пересчитаны")
+        self.set_status(f"Базовые линии пересчитаны по сохранённым свечам за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    async def fill_candle_gap(self):
+        if self.scanner is not None:
+            # Кольцо свечей шардов лежит в общей памяти фиксированного размера — перезапуск с запасом
+            await self.async_load_stats()
+            return
+        retain = self.required_retain()
+        self.store = store = self.store.resized(retain)
+        from_ts = int(time.time()) - retain * CANDLE_SECONDS
+        keys = [key for key, row in self.ticker_data.items()
+                if key in store.rows and key not in self.ignored_tickers and not row.get('from_snapshot')]
+        sem = asyncio.Semaphore(16)
+        progress = {'done': 0}
+
+        async def fill(symbol, category):
+            async with sem:
+                klines = await self.get_klines(symbol, category, from_ts)
+            if klines:
+                store.put((symbol, category), klines)
+            progress['done'] += 1
+            if progress['done'] % 50 == 0:
+                self.set_status(f"Догрузка свечей: {progress['done']}/{len(keys)}")
 
-    def get_window_timestamp(self):
-        now = datetime.now(timezone.utc)
-        n_candles = self.settings.get("mean_candles", 20)
-        return int((now - timedelta(minutes=15 * n_candles)).timestamp())
+        await asyncio.gather(*(fill(symbol, category) for symbol, category in keys))
+        if store is self.store:
+            self.recompute_baselines()
 
     async def async_load_stats(self):
-        from_ts = self.get_window_timestamp()
+        self.loading = True
+        try:
+            await self._async_load_stats()
+        finally:
+            self.loading = False
+        self.set_status("Готово. Ожидание онлайн-обновлений...")
+        await self.update_online()
+
+    async def _async_load_stats(self):
+        retain = self.required_retain()
+        from_ts = int(time.time()) - retain * CANDLE_SECONDS
         selected_type = self.settings.get("selected_type", "spot")
         self.tickers = await self.get_all_tickers(selected_type)
-        self.ticker_data = {}
+        # Строки из снимка остаются на экране, пока по тикеру не загрузится свежая история
+        self.ticker_data = {k: v for k, v in self.ticker_data.items() if v.get('from_snapshot')}
+        self.unseeded = set()
+        self.close_scanner()
+        
+        if self.settings.get("worker_processes", 0) > 0 and self.tickers:
+            await self.async_load_stats_sharded(from_ts, retain)
+            return
         
+        self.store = CandleStore(retain, capacity=len(self.tickers) + 64)
         for idx, (symbol, category) in enumerate(self.tickers):
             klines = await self.get_klines(symbol, category, from_ts)
-            if not klines or len(klines) < 4:  # Минимум 1 час данных
+            if klines:
+                self.store.put((symbol, category), klines)
+            mean = float(self.derive_candles([(symbol, category)])[0][0]) if klines else float('nan')
+            if mean != mean:  # Мало свечей для базовой линии
+                self.unseeded.add((symbol, category))
                 continue
-                
-            volumes = [float(k[5]) for k in klines]
-            mean = float(np.mean(volumes))
             
-            self.ticker_data[(symbol, category)] = {
-                'symbol': symbol,
-                'category': category,
-                'mean': mean,
-                'volume': 0.0,
-                'ratio': 0.0,
-                'datetime': ''
-            }
-            self.update_table()
+            self.ticker_data[(symbol, category)] = self.new_row(symbol, category, mean)
             
             if (idx+1) % 20 == 0:
+                self.update_table()
                 self.set_status(f"Загрузка: {idx+1}/{len(self.tickers)}")
-                
-        self.set_status("Готово. Ожидание онлайн-обновлений...")
-        await self.update_online()
+        self.drop_snapshot_rows()
+        self.update_table()
+
+    async def async_load_stats_sharded(self, from_ts, retain):
+        n_workers = self.settings["worker_processes"]
+        self.set_status(f"Загрузка истории в {n_workers} процессах...")
+        self.scanner = ShardedScanner(self.tickers, n_workers, self.settings.get("rate_limit_rps", 50), retain)
+        self.store = self.scanner.store
+        await self.scanner.run_cycle("stats", from_ts)
+        cols = self.scanner.cols
+        loaded = [key for key, row in self.scanner.rows.items() if cols[COL_OK, row] > 0]
+        means = dict(zip(loaded, self.derive_candles(loaded)[0].tolist())) if loaded else {}
+        for key in self.scanner.rows:
+            mean = means.get(key, float('nan'))
+            if mean != mean:
+                self.unseeded.add(key)
+                continue
+            symbol, category = key
+            self.ticker_data[(symbol, category)] = self.new_row(symbol, category, mean)
+        self.drop_snapshot_rows()
+        self.update_table()
+
+    def new_row(self, symbol, category, mean):
+        row = {
+            'symbol': symbol,
+            'category': category,
+            'mean': mean,
+            'volume': 0.0,
+            'ratio': 0.0,
+            'datetime': ''
+        }
+        old = self.ticker_data.get((symbol, category))
+        if old and old.get('from_snapshot'):
+            # До первого онлайн-обновления показываем последние известные значения
+            row.update({
+                'volume': old['volume'],
+                'ratio': old['volume'] / (mean + 1e-9),
+                'datetime': old['datetime'],
+                'price': old.get('price'),
+                'updated_at': old.get('updated_at'),
+                'from_snapshot': True
+            })
+        return row
+
+    def drop_snapshot_rows(self):
+        # Тикеры из снимка, по которым свежая история так и не загрузилась
+        loaded = set(self.tickers) - self.unseeded
+        for key in [k for k, v in self.ticker_data.items() if v.get('from_snapshot') and k not in loaded]:
+            del self.ticker_data[key]
+
+    def restore_snapshot(self):
+        if not os.path.exists(SNAPSHOT_FILE):
+            return
+        try:
+            loaded = StateSnapshot.load(SNAPSHOT_FILE)
+        except Exception as e:
+            print(f"Не удалось прочитать снимок {SNAPSHOT_FILE}: {e}")
+            return
+        if loaded is None:
+            return
+        header, ticker_data = loaded
+        self.ticker_data = ticker_data
+        self.update_table()
+        saved_at = datetime.fromtimestamp(header["saved_at"]).strftime('%H:%M:%S')
+        self.set_status(f"Показан снимок от {saved_at} (устаревшие данные), идёт загрузка...")
+
+    def restore_sketch(self):
+        # Матрица скетчей — numpy, поэтому создаётся с первыми свечами, а не до показа окна
+        self.sketch = None
+        if os.path.exists(SKETCH_FILE):
+            try:
+                self.sketch = VolumeSketch.load(SKETCH_FILE)
+            except Exception as e:
+                print(f"Не удалось прочитать квантили {SKETCH_FILE}: {e}")
+        if self.sketch is None:
+            self.sketch = VolumeSketch()
+
+    def save_snapshot(self):
+        # Строки, ещё не обновлённые после запуска, сохраняются как есть
+        if not self.ticker_data:
+            return
+        try:
+            StateSnapshot.save(SNAPSHOT_FILE, self.ticker_data, self.settings.get("selected_type", "spot"))
+        except Exception as e:
+            print(f"Не удалось сохранить снимок {SNAPSHOT_FILE}: {e}")
+        try:
+            if self.sketch is not None:
+                self.sketch.save(SKETCH_FILE)
+        except Exception as e:
+            print(f"Не удалось сохранить квантили {SKETCH_FILE}: {e}")
+        self.save_curves()
+
+    def close_scanner(self):
+        if self.scanner is not None:
+            if self.store is self.scanner.store:
+                self.store = None
+            self.scanner.close()
+            self.scanner = None
 
     async def safe_update_online(self, async_manual=False):
         import logging
+        if self.settings["hub_mode"] == "subscribe":
+            return
         if self.update_task and not self.update_task.done():
             print("[DEBUG] Обновление уже выполняется, новый запуск отменён.")
             return  # Уже идёт обновление
@@ -796,80 +4191,419 @@ class BybitVolumeSpikesWidget(QWidget):
             print(f"[DEBUG] Обновление завершено (async_manual={async_manual})")
         self.update_task.add_done_callback(on_done)
 
-    async def get_all_tickers(self, selected_type):
-        tickers = []
-        async with aiohttp.ClientSession() as session:
+    def apply_alert_rules(self):
+        try:
+            self.rule_engine.set_rules(self.settings["alert_rules"])
+        except RuleError as e:
+            print(f"[Правила] {e}; используется правило по умолчанию")
+            self.rule_engine.set_rules(DEFAULT_ALERT_RULES)
+
+    async def update_market_stats(self, selected_type):
+        # Суточная статистика по всем тикерам площадки — один запрос на площадку за цикл
+        fetcher = self.get_fetcher()
+        for adapter in self.enabled_exchanges():
             try:
-                url = BYBIT_SYMBOLS_URL.format(category=selected_type)
-                async with session.get(url, timeout=10) as resp:
-                    data = await resp.json()
-                    for x in data['result']['list']:
-                        tickers.append((x['symbol'], selected_type))
+                data = await fetcher.get_json(adapter, adapter.tickers_url(selected_type))
             except Exception as e:
-                print(f"Ошибка получения тикеров {selected_type}: {e}")
+                print(f"Ошибка получения суточной статистики {adapter.name}: {e!r}")
+                continue
+            if not data:
+                continue
+            category = adapter.category(selected_type)
+            for symbol, stats in adapter.decode_tickers(data, selected_type).items():
+                self.market_stats[(symbol, category)] = stats
+
+    def enabled_exchanges(self):
+        names = [n for n in self.settings.get("exchanges", "bybit").split(";") if n in EXCHANGES]
+        return [EXCHANGES[n] for n in names] or [EXCHANGES["bybit"]]
+
+    def get_fetcher(self):
+        # Одна сессия с пулом соединений на всё время работы вместо сессии на каждый запрос
+        if self.fetcher is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=16))
+            self.fetcher = ResilientFetcher(self.session, self.limiters, profiler=self.profiler)
+        return self.fetcher
+
+    async def get_all_tickers(self, selected_type):
+        # Список берётся из кэша, пока он свежий; сеть — только по истечении TTL
+        tickers = []
+        for adapter in self.enabled_exchanges():
+            category = adapter.category(selected_type)
+            symbols = self.universe.get(category)
+            if symbols is None:
+                symbols = await self.fetch_instruments(adapter, selected_type)
+                if symbols is None:
+                    continue
+                self.universe.update(category, symbols)
+            tickers.extend((symbol, category) for symbol in sorted(symbols))
         return tickers
 
+    async def fetch_instruments(self, adapter, market):
+        try:
+            symbols = await adapter.fetch_instruments(self.get_fetcher().getter(adapter), market)
+        except Exception as e:
+            print(f"Ошибка получения тикеров {adapter.name} {market}: {e!r}")
+            return None
+        # Пустой ответ не считаем делистингом всего рынка
+        return symbols or None
+
+    async def refresh_universe(self):
+        if self.loading or not self.ticker_data or self.settings["hub_mode"] == "subscribe":
+            return
+        selected_type = self.settings.get("selected_type", "spot")
+        added, removed = [], []
+        for adapter in self.enabled_exchanges():
+            category = adapter.category(selected_type)
+            symbols = await self.fetch_instruments(adapter, selected_type)
+            if symbols is None:
+                continue
+            new, gone = self.universe.update(category, symbols)
+            added += [(symbol, category) for symbol in new]
+            removed += [(symbol, category) for symbol in gone]
+        if self.loading or self.settings.get("selected_type", "spot") != selected_type:
+            return  # Пока шёл запрос, началась полная перезагрузка
+        # Делистинги удаляются, историю остальных тикеров не трогаем
+        removed_set = set(removed)
+        if removed:
+            for key in removed:
+                self.ticker_data.pop(key, None)
+                self.market_stats.pop(key, None)
+            self.unseeded -= removed_set
+            self.notifier.forget(removed_set)
+            if self.sketch is not None:
+                self.sketch.drop(removed_set)
+            self.tickers = [key for key in self.tickers if key not in removed_set]
+            if self.scanner is not None:
+                self.scanner.drop(removed)
+            elif self.store is not None:
+                self.store.drop(removed)
+        self.tickers += [key for key in added if key not in self.ticker_data]
+        # Новые листинги (и те, кому раньше не хватило истории) догружаются отдельно
+        to_seed = [key for key in set(added) | self.unseeded if key not in self.ticker_data]
+        seeded = await self.seed_tickers(to_seed) if to_seed else []
+        if added or removed:
+            print(f"[Листинги] новые: {added}, делистинг: {removed}")
+            self.set_status(f"Новых листингов: {len(added)} (загружено {len(seeded)}), делистинг: {len(removed)}")
+        if seeded or removed:
+            self.update_table()
+
+    async def seed_tickers(self, keys):
+        if self.store is None:
+            return []
+        from_ts = int(time.time()) - self.store.retain * CANDLE_SECONDS
+        seeded = []
+        if self.scanner is not None:
+            if not self.scanner.add(keys):
+                # Запас строк в общем буфере исчерпан — пересоздаём шарды
+                await self.async_load_stats()
+                return keys
+            scanner = self.scanner
+            rows = [scanner.rows[key] for key in keys]
+            await scanner.run_cycle("stats", from_ts, only=rows)
+            if scanner is not self.scanner:
+                return []
+            loaded = [key for key, row in zip(keys, rows) if scanner.cols[COL_OK, row] > 0]
+        else:
+            store = self.store
+            klines_list = await asyncio.gather(*(self.get_klines(symbol, category, from_ts) for symbol, category in keys))
+            if store is not self.store:
+                return []
+            loaded = []
+            for key, klines in zip(keys, klines_list):
+                if klines:
+                    store.put(key, klines)
+                    loaded.append(key)
+        means = dict(zip(loaded, self.derive_candles(loaded)[0].tolist())) if loaded else {}
+        means = {key: mean for key, mean in means.items() if mean == mean}
+        for key in keys:
+            if key not in means:
+                self.unseeded.add(key)
+                continue
+            self.unseeded.discard(key)
+            self.ticker_data[key] = self.new_row(key[0], key[1], means[key])
+            seeded.append(key)
+        return seeded
+
     async def get_klines(self, symbol, category, from_ts):
+        adapter, market = resolve_category(category)
         try:
-            url = BYBIT_KLINE_URL.format(category=category, symbol=symbol, from_ts=from_ts)
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=15) as resp:
-                    if resp.status != 200:
-                        return []
-                    data = await resp.json()
-                    return data.get('result', {}).get('list', [])
+            return await adapter.fetch_klines(self.get_fetcher().getter(adapter), symbol, market, from_ts)
         except Exception as e:
-            print(f"Ошибка получения данных для {symbol}: {e}")
+            print(f"Ошибка получения данных для {symbol}: {e!r}")
             return []
 
     async def update_online(self, async_manual=False):
+        # Цикл целиком — стадия профиля; циклы профиля по запросу отсчитываются здесь
+        with self.profiler.stage("update_online"):
+            await self.run_online_cycle(async_manual)
+        self.profile_cycle_done()
+
+    async def run_online_cycle(self, async_manual=False):
         import asyncio
         try:
             if not self.ticker_data:
                 return
-            now = datetime.now(timezone.utc)
-            from_ts = int((now - timedelta(minutes=30)).timestamp())
-            count = 0
+            now = time.time()
+            bucket_start = self.bucket_start(now)
+            # Минимум две последние 15м свечи и все 15м свечи текущей свечи таймфрейма
+            from_ts = min(int(now) - 2 * CANDLE_SECONDS, bucket_start)
+            if self.scanner is not None:
+                await self.update_online_sharded(now, from_ts, bucket_start)
+                return
             selected_type = self.settings.get("selected_type", "spot")
-            for idx, (symbol, category) in enumerate(list(self.ticker_data.keys())):
-                if (symbol, category) in self.ignored_tickers:
-                    continue
-                if category != selected_type:
-                    continue
-                mean = self.ticker_data[(symbol, category)]['mean']
-                klines = await self.get_klines(symbol, category, from_ts)
-                if not klines:
-                    continue
-                last = klines[0]
-                vol = float(last[5])
-                ts = int(last[0]) // 1000
-                dt = datetime.fromtimestamp(ts, timezone.utc).strftime('%H:%M')
-                ratio = vol / (mean + 1e-9)
-                price = float(last[4])
+            keys = [key for key in self.ticker_data
+                    if key not in self.ignored_tickers and category_market(key[1]) == selected_type]
+            sem = asyncio.Semaphore(16)
+            progress = {'done': 0, 'ok': 0}
+            store = self.store
+            dt = datetime.fromtimestamp(bucket_start, timezone.utc).strftime('%H:%M')
+            fresh = []
+
+            async def update_one(symbol, category):
+                async with sem:
+                    started = time.time()
+                    klines = await self.get_klines(symbol, category, from_ts)
+                progress['done'] += 1
+                if async_manual and progress['done'] % 20 == 0:
+                    self.set_status(f"Обновление: {progress['done']}/{len(keys)}")
+                if not klines or (symbol, category) not in self.ticker_data:
+                    return
+                # Объём, предыдущие свечи и базовая линия считаются ниже по кольцу свечей
+                store.put((symbol, category), klines)
                 self.ticker_data[(symbol, category)].update({
-                    'volume': vol,
-                    'ratio': ratio,
                     'datetime': dt,
-                    'price': price
+                    'price': float(klines[0][4]),
+                    'open': bucket_open(klines, bucket_start * 1000),
+                    'candle_ts': bucket_start,
+                    'fetch_started': started,
+                    'updated_at': time.time(),
+                    'from_snapshot': False
                 })
-                count += 1
-                if async_manual and (idx+1) % 20 == 0:
-                    self.set_status(f"Обновление: {idx+1}/{len(self.ticker_data)}")
-            self.notifier.check_and_notify(self.ticker_data)
-            self.update_table()
-            self.set_status(f"Обновлено: {count} тикеров, {datetime.now().strftime('%H:%M:%S')}")
+                fresh.append((symbol, category))
+                progress['ok'] += 1
+
+            # Цикл ограничен по времени: «отстающие» отменяются и остаются помеченными как устаревшие
+            tasks = [asyncio.ensure_future(update_one(symbol, category)) for symbol, category in keys]
+            tasks.append(asyncio.ensure_future(self.update_market_stats(selected_type)))
+            if tasks:
+                with self.profiler.stage("fetch"):
+                    _, pending = await asyncio.wait(tasks, timeout=self.settings["update_interval"] * CYCLE_BUDGET)
+                for task in pending:
+                    task.cancel()
+            failed = len(keys) - progress['ok']
+            with self.profiler.stage("apply_candles"):
+                self.apply_candles(fresh, now)
+            with self.profiler.stage("enrich"):
+                await self.enrich_spiking()
+            with self.profiler.stage("evaluate_cycle"):
+                self.evaluate_cycle()
+            with self.profiler.stage("update_table"):
+                self.update_table()
+            self.set_status(f"Обновлено: {progress['ok']} тикеров, без данных: {failed}, {datetime.now().strftime('%H:%M:%S')}")
         except asyncio.CancelledError:
             return
 
-    def show_notification_log(self, current_message=None):
+    def start_profile(self, cycles=PROFILE_CYCLES):
+        self.profiler.start(cycles)
+        self.profile_btn.setText(f"Профиль: {self.profiler.cycles_left} цикл.")
+        self.set_status(f"Профиль следующих {self.profiler.cycles_left} циклов...")
+
+    def profile_cycle_done(self):
+        result = self.profiler.cycle_done()
+        if self.profiler.active:
+            self.profile_btn.setText(f"Профиль: {self.profiler.cycles_left} цикл.")
+        elif result is not None:
+            base, summary = result
+            self.profile_btn.setText("Профиль")
+            print(f"[Профиль] {base}.speedscope.json, {base}.collapsed\n{summary}")
+            self.set_status(f"Профиль сохранён: {base}.speedscope.json")
+
+    async def enrich_spiking(self):
+        # Точечные запросы только для тикеров выше порога предупреждения
+        threshold = self.settings["enrich_ratio"]
+        if threshold > 0:
+            candidates = [k for k, v in self.ticker_data.items()
+                          if v.get('ratio', 0) >= threshold and not v.get('from_snapshot')
+                          and k not in self.ignored_tickers]
+            candidates.sort(key=lambda k: self.ticker_data[k]['ratio'], reverse=True)
+            try:
+                await asyncio.wait_for(self.enricher.enrich(self.get_fetcher(), candidates, time.time()),
+                                       timeout=ENRICH_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass  # успевшие ответы уже в кэше, остальные догрузятся в следующем цикле
+        now = time.time()
+        for key, row in self.ticker_data.items():
+            fields = self.enricher.get(key, now) or {}
+            for field in ENRICH_FIELDS:
+                row[field] = fields.get(field)
+
+    def evaluate_cycle(self):
+        # Строки из снимка прошлого запуска и ещё не обновлённые в правила не попадают
+        with self.profiler.stage("build_state"):
+            keys, env = self.rule_engine.build_state(self.ticker_data, self.market_stats, self.settings)
+        for key, ratio_pct, turnover_pct in zip(keys, env["ratio_pct"].tolist(), env["turnover_pct"].tolist()):
+            row = self.ticker_data[key]
+            row['ratio_pct'] = ratio_pct
+            row['turnover_pct'] = turnover_pct
+        if self.history is not None and keys:
+            try:
+                candles = np.fromiter((self.ticker_data[k].get('candle_ts') or 0 for k in keys), dtype=np.int64, count=len(keys))
+                # В историю — фактические объёмы: прогноз незакрытой свечи не считается всплеском
+                with self.profiler.stage("history"):
+                    self.history.append(time.time(), keys, self.rule_engine.confirmed_env(env), candles)
+            except OSError as e:
+                print(f"Ошибка записи истории: {e}")
+        with self.profiler.stage("check_and_notify"):
+            self.notifier.check_and_notify(self.ticker_data, keys, env)
+        if self.hub is not None:
+            self.hub.publish(self.ticker_data, self.market_stats, self.settings.get("selected_type", "spot"))
+        self.sync_trade_stream()
+
+    def apply_trade_stream(self):
+        # (Пере)запуск ленты сделок Bybit выбранного рынка по текущим настройкам
+        self.trade_timer.stop()
+        if self.trade_task is not None:
+            self.trade_task.cancel()
+            self.trade_task = None
+        self.trade_stream = None
+        if (self.settings["trade_ratio"] <= 0 or self.settings["hub_mode"] == "subscribe"
+                or EXCHANGES["bybit"] not in self.enabled_exchanges()):
+            return
+        category = EXCHANGES["bybit"].category(self.settings.get("selected_type", "spot"))
+        self.trade_stream = TradeStream(category, BYBIT_TRADE_WS_URL.format(category=category))
+        self.sync_trade_stream()
+        self.get_fetcher()
+        self.trade_task = asyncio.ensure_future(self.trade_stream.run(self.session, self.set_status))
+        self.trade_timer.start(TRADE_BUCKET_SECONDS * 1000)
+
+    def sync_trade_stream(self):
+        # Подписка следует за вселенной, базовый темп — за средними после каждого цикла
+        stream = self.trade_stream
+        if stream is None:
+            return
+        stream.set_symbols([symbol for symbol, category in self.tickers
+                            if category == stream.category and (symbol, category) not in self.ignored_tickers])
+        seconds = self.settings["timeframe"] * 60
+        stream.set_baselines({symbol: row['mean'] / seconds for (symbol, category), row in self.ticker_data.items()
+                              if category == stream.category and not row.get('from_snapshot')})
+
+    def check_trade_bursts(self):
+        stream = self.trade_stream
+        if stream is None or not stream.last_ms:
+            return
+        period = self.settings["timeframe"] * 60
+        candle = stream.last_ms // 1000 // period * period
+        for symbol, volume, pace in stream.bursts(self.settings["trade_ratio"]):
+            key = (symbol, stream.category)
+            data = self.ticker_data.get(key)
+            if data is None or key in self.ignored_tickers:
+                continue
+            self.notifier.notify_early(data, candle, pace, volume)
+
+    def apply_hub_mode(self):
+        # (Пере)запуск раздачи или подписки по текущим настройкам
+        if self.hub_task is not None:
+            self.hub_task.cancel()
+            self.hub_task = None
+        if self.hub is not None:
+            asyncio.ensure_future(self.hub.stop())
+            self.hub = None
+        mode = self.settings["hub_mode"]
+        if mode == "publish":
+            self.hub = SpikeHub(self.settings["hub_port"], self.settings["hub_bind"])
+            self.hub_task = asyncio.ensure_future(self.start_hub(self.hub))
+        elif mode == "subscribe":
+            self.get_fetcher()
+            subscriber = HubSubscriber(self.settings["hub_url"], self.on_hub_message, self.set_status)
+            self.hub_task = asyncio.ensure_future(subscriber.run(self.session))
+
+    async def start_hub(self, hub):
+        try:
+            await hub.start()
+        except OSError as e:
+            self.set_status(f"Хаб: не удалось открыть порт {hub.port}: {e}")
+            return
+        # Подключившиеся сразу получают текущее состояние, не дожидаясь цикла
+        hub.publish(self.ticker_data, self.market_stats, self.settings.get("selected_type", "spot"))
+        print(f"[Хаб] Раздача на порту {hub.port}")
+
+    def on_hub_message(self, message):
+        if message.get("type") == "snapshot":
+            self.ticker_data = {}
+            self.market_stats = {}
+            rows, remove = message.get("rows", []), []
+        else:
+            rows, remove = message.get("upsert", []), message.get("remove", [])
+        for symbol, category in remove:
+            self.ticker_data.pop((symbol, category), None)
+            self.market_stats.pop((symbol, category), None)
+        for row in rows:
+            key = (row['symbol'], row['category'])
+            stats = {f: row.pop(f) for f in ("turnover24h", "change24h") if f in row}
+            self.ticker_data[key] = row
+            if any(v is not None for v in stats.values()):
+                self.market_stats[key] = stats
+        market = message.get("market")
+        if market in CATEGORIES and market != self.settings["selected_type"]:
+            # Рынок выбирает хаб: переключаем радиокнопки без перезагрузки
+            self.settings["selected_type"] = market
+            for radio in (self.spot_radio, self.linear_radio):
+                radio.blockSignals(True)
+            (self.spot_radio if market == "spot" else self.linear_radio).setChecked(True)
+            for radio in (self.spot_radio, self.linear_radio):
+                radio.blockSignals(False)
+        # У подписчика хаба циклом профиля считается каждое сообщение хаба
+        with self.profiler.stage("evaluate_cycle"):
+            self.evaluate_cycle()
+        with self.profiler.stage("update_table"):
+            self.update_table()
+        self.profile_cycle_done()
+        self.set_status(f"Хаб: {len(self.ticker_data)} тикеров, изменено {len(rows)}, {datetime.now().strftime('%H:%M:%S')}")
+
+    async def update_online_sharded(self, now, from_ts, bucket_start):
+        scanner = self.scanner
+        started = time.time()  # время запросов по тикерам шарды не возвращают — границы цикла
+        with self.profiler.stage("fetch"):
+            await asyncio.gather(scanner.run_cycle("online", from_ts, bucket_start),
+                                 self.update_market_stats(self.settings.get("selected_type", "spot")))
+        if scanner is not self.scanner:
+            return  # Шарды перезапущены во время цикла
+        cols = scanner.cols
+        dt = datetime.fromtimestamp(bucket_start, timezone.utc).strftime('%H:%M')
+        fresh = []
+        for row in np.flatnonzero(cols[COL_OK] > 0):
+            key = scanner.tickers[row]
+            if key is None or key in self.ignored_tickers or key not in self.ticker_data:
+                continue
+            self.ticker_data[key].update({
+                'datetime': dt,
+                'price': float(cols[COL_PRICE, row]),
+                'open': float(cols[COL_OPEN, row]),
+                'candle_ts': bucket_start,
+                'fetch_started': started,
+                'updated_at': time.time(),
+                'from_snapshot': False
+            })
+            fresh.append(key)
+        # Объёмы и кратности — векторно по кольцу свечей в общей памяти
+        with self.profiler.stage("apply_candles"):
+            self.apply_candles(fresh, now)
+        with self.profiler.stage("enrich"):
+            await self.enrich_spiking()
+        with self.profiler.stage("evaluate_cycle"):
+            self.evaluate_cycle()
+        with self.profiler.stage("update_table"):
+            self.update_table()
+        self.set_status(f"Обновлено: {len(fresh)} тикеров ({scanner.n_workers} проц.), {datetime.now().strftime('%H:%M:%S')}")
+
+    def show_notification_log(self):
         if self.notification_log_dialog is None or not self.notification_log_dialog.isVisible():
             self.notification_log_dialog = NotificationLogDialog(self)
             self.notification_log_dialog.show()
-        if current_message is not None:
-            # Обновить содержимое
-            self.notification_log_dialog.load_log()
-            self.notification_log_dialog.raise_()
-            self.notification_log_dialog.activateWindow()
+        else:
+            self.notification_log_dialog.follow()
+        self.notification_log_dialog.raise_()
+        self.notification_log_dialog.activateWindow()
 
     def apply_font_size(self):
         font_size = self.settings.get("font_size", 12)
@@ -890,17 +4624,17 @@ class BybitVolumeSpikesWidget(QWidget):
         # Панель и кнопки
         panel_font = self.font()
         panel_font.setPointSize(self.settings.get("font_size_panel", 12))
-        for widget in [self.status_label, self.spot_radio, self.linear_radio, self.name_filter_edit, self.volume_sort_cb, self.refresh_btn, self.settings_btn, self.log_btn, self.show_all_cb]:
+        for widget in [self.status_label, self.spot_radio, self.linear_radio, self.name_filter_edit, self.volume_sort_cb, self.refresh_btn, self.settings_btn, self.log_btn, self.profile_btn, self.latency_label, self.show_all_cb, self.top_cb]:
             if widget:
                 widget.setFont(panel_font)
         # Журнал уведомлений (если открыт)
         if self.notification_log_dialog is not None:
-            log_font = self.notification_log_dialog.text_edit.font()
+            log_font = self.notification_log_dialog.log_view.font()
             log_font.setPointSize(self.settings.get("font_size_log", 12))
-            self.notification_log_dialog.text_edit.setFont(log_font)
+            self.notification_log_dialog.set_log_font(log_font)
 
     def restore_main_window_geometry(self):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
         geometry = settings.value("main_window_geometry")
         if geometry:
             self.restoreGeometry(geometry)
@@ -909,17 +4643,526 @@ class BybitVolumeSpikesWidget(QWidget):
             self.move(pos)
 
     def closeEvent(self, event):
-        settings = QSettings("VolumeSpikes", "BybitMonitor")
+        settings = QSettings("VolumeSpikes", SETTINGS_APP)
         settings.setValue("main_window_geometry", self.saveGeometry())
         settings.setValue("main_window_pos", self.pos())
+        self.save_snapshot()
+        self.close_scanner()
+        self.notifier.close()
+        self.trade_timer.stop()
+        if self.trade_task is not None:
+            self.trade_task.cancel()
+            self.trade_task = None
+        if self.hub_task is not None:
+            self.hub_task.cancel()
+            self.hub_task = None
+        if self.hub is not None:
+            asyncio.ensure_future(self.hub.stop())
+            self.hub = None
+        if self.session is not None:
+            asyncio.ensure_future(self.session.close())
+            self.session = None
+            self.fetcher = None
         super().closeEvent(event)
 
+def run_history_query(args):
+    history = SpikeHistory()
+    if args.spikes:
+        symbol, _, category = args.spikes.partition(":")
+        for x in history.spikes(symbol, category or None, days=args.days or 30, min_ratio=args.min_ratio):
+            print(f"{datetime.fromtimestamp(x['candle']).strftime('%Y-%m-%d %H:%M')}  {x['symbol']:<24} "
+                  f"{x['ratio']:6.1f}x  объём {x['volume']:,.0f}  цена {x['price']:.6g}")
+    else:
+        for name, count in history.repeat_offenders(days=args.days or 7, min_ratio=args.min_ratio,
+                                                    min_spikes=args.min_spikes):
+            print(f"{name:<32} {count}")
+
+def run_latency_report(args):
+    if not os.path.exists(TRACE_FILE):
+        print(f"Нет {TRACE_FILE}: уведомлений ещё не было")
+        return
+    records = AlertTraceLog.load(TRACE_FILE)
+    records = records[records["detected"] >= time.time() - (args.days or 7) * 86400]
+    print(f"Уведомлений за {args.days or 7} дн.: {len(records)}")
+    print(AlertTraceLog.table(records))
+
+SOAK_CYCLE_SECONDS = 300  # симулированных секунд между циклами обновления (3 цикла на 15м свечу)
+SOAK_SAMPLE_EVERY = 12  # циклов между замерами памяти
+SOAK_SYMBOLS = 200
+SOAK_LISTING_SECONDS = 6 * 3600  # раз в 6 симулированных часов — новый листинг и делистинг
+SOAK_WARMUP = 0.25  # доля замеров в начале прогона, не участвующая в оценке роста
+SOAK_GROWTH_LIMIT = 0.10  # относительный рост после прогрева, считающийся утечкой
+SOAK_TRADE_RATE = 20000  # сделок в секунду на всю ленту стенда
+SOAK_BURST_EVERY = 60  # сек: раз в минуту один тикер ленты стенда ускоряется
+SOAK_BURST_SECONDS = 20
+SOAK_BURST_FACTOR = 10
+
+class SimClock:
+    # Подменяет модуль time в этом файле: time.time() идёт по симулированным часам,
+    # остальное (perf_counter, sleep) и часы event loop — настоящие
+    def __init__(self, real, start):
+        self.real = real
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def __getattr__(self, attr):
+        return getattr(self.real, attr)
+
+def point_bybit_at(base):
+    # Все URL Bybit — на другой адрес; процессы-шарды получают его через окружение
+    global BYBIT_API_URL, BYBIT_TRADE_WS_URL
+    for name, value in list(globals().items()):
+        if name.startswith("BYBIT_") and name.endswith("_URL") and name != "BYBIT_API_URL":
+            globals()[name] = value.replace(BYBIT_API_URL, base, 1)
+    BYBIT_API_URL = os.environ["BYBIT_API_URL"] = base
+    BYBIT_TRADE_WS_URL = "ws" + base[len("http"):] + "/v5/public/{category}"
+
+class MockBybitServer:
+    # Локальный стенд API Bybit: свечи детерминированно выводятся из (символ, номер свечи)
+    # по симулированным часам, ~1% свечей — всплески, список инструментов медленно ротируется.
+    # Лента publicTrade идёт в темпе объёма текущей свечи с периодическими ускорениями.
+    # latency — задержка ответа REST в секундах, как сетевой путь до биржи
+    def __init__(self, clock, symbols=SOAK_SYMBOLS, trade_rate=SOAK_TRADE_RATE, latency=0.0):
+        self.clock = clock
+        self.symbols = symbols
+        self.trade_rate = trade_rate
+        self.latency = latency
+        self.runner = None
+
+    async def start(self):
+        from aiohttp import web
+
+        @web.middleware
+        async def delay(request, handler):
+            if self.latency and not request.path.startswith('/v5/public/'):
+                await asyncio.sleep(self.latency)
+            return await handler(request)
+        app = web.Application(middlewares=[delay])
+        app.router.add_get('/v5/market/instruments-info', self.instruments)
+        app.router.add_get('/v5/market/kline', self.kline)
+        app.router.add_get('/v5/market/tickers', self.tickers)
+        app.router.add_get('/v5/market/orderbook', self.orderbook)
+        app.router.add_get('/v5/market/open-interest', self.open_interest)
+        app.router.add_get('/v5/public/{category}', self.trade_socket)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def listed(self):
+        shift = int(self.clock.time()) // SOAK_LISTING_SECONDS
+        return [f"SOAK{i}USDT" for i in range(shift, shift + self.symbols)]
+
+    @staticmethod
+    def candle(symbol, index):
+        import zlib
+        rng = random.Random(zlib.crc32(f"{symbol}:{index}".encode()))
+        base = 10000 + zlib.crc32(symbol.encode()) % 90000
+        volume = base * rng.uniform(0.5, 1.5) * (rng.uniform(4, 12) if rng.random() < 0.01 else 1.0)
+        price = 1 + (zlib.crc32(symbol.encode()) % 1000) / 100 + rng.uniform(-0.05, 0.05)
+        return volume, price
+
+    def respond(self, result):
+        from aiohttp import web
+        return web.json_response({"retCode": 0, "retMsg": "OK", "result": result})
+
+    async def instruments(self, request):
+        return self.respond({"list": [{"symbol": s, "status": "Trading"} for s in self.listed()]})
+
+    async def kline(self, request):
+        symbol = request.query['symbol']
+        now = self.clock.time()
+        current = int(now) // CANDLE_SECONDS
+        start = int(request.query.get('start', 0)) // 1000 // CANDLE_SECONDS
+        end = min(current, int(request.query.get('end', now * 1000)) // 1000 // CANDLE_SECONDS)
+        rows = []
+        for index in range(end, max(start, end - int(request.query.get('limit', 200))), -1):
+            volume, price = self.candle(symbol, index)
+            if index == current:  # формирующаяся свеча набирает объём по ходу
+                volume *= max(0.05, (now - index * CANDLE_SECONDS) / CANDLE_SECONDS)
+            rows.append([str(index * CANDLE_SECONDS * 1000), f"{price * 0.999:.4f}", f"{price * 1.01:.4f}",
+                         f"{price * 0.99:.4f}", f"{price:.4f}", f"{volume:.2f}", f"{volume * price:.2f}"])
+        return self.respond({"category": request.query.get('category'), "symbol": symbol, "list": rows})
+
+    async def tickers(self, request):
+        symbols = [request.query['symbol']] if 'symbol' in request.query else self.listed()
+        current = int(self.clock.time()) // CANDLE_SECONDS
+        rows = []
+        for symbol in symbols:
+            volume, price = self.candle(symbol, current)
+            rows.append({"symbol": symbol, "lastPrice": f"{price:.4f}", "turnover24h": f"{volume * price * 96:.2f}",
+                         "price24hPcnt": f"{(price % 0.1) - 0.05:.4f}", "fundingRate": "0.0001"})
+        return self.respond({"list": rows})
+
+    async def orderbook(self, request):
+        _, price = self.candle(request.query['symbol'], int(self.clock.time()) // CANDLE_SECONDS)
+        return self.respond({"b": [[f"{price * 0.999:.4f}", "120"]], "a": [[f"{price * 1.001:.4f}", "80"]]})
+
+    async def open_interest(self, request):
+        return self.respond({"list": [{"openInterest": "1050"}, {"openInterest": "1000"}]})
+
+    def burst_topic(self, topics, now):
+        # Ускорение ленты: первые SOAK_BURST_SECONDS каждой минуты, тикер меняется по кругу
+        second = int(now)
+        if second % SOAK_BURST_EVERY >= SOAK_BURST_SECONDS:
+            return None
+        return topics[second // SOAK_BURST_EVERY % len(topics)]
+
+    async def trade_socket(self, request):
+        from aiohttp import web
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        topics = []
+        sender = asyncio.ensure_future(self.send_trades(ws, topics))
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                op = json.loads(msg.data)
+                if op.get("op") == "subscribe":
+                    topics.extend(topic for topic in op["args"] if topic not in topics)
+                elif op.get("op") == "unsubscribe":
+                    topics[:] = [topic for topic in topics if topic not in op["args"]]
+                elif op.get("op") == "ping":
+                    await ws.send_str('{"op":"pong","success":true}')
+        finally:
+            sender.cancel()
+        return ws
+
+    async def send_trades(self, ws, topics):
+        tick = 0.1
+        candles = {}
+        while not ws.closed:
+            await asyncio.sleep(tick)
+            if not topics:
+                continue
+            now = self.clock.time()
+            now_ms = int(now * 1000)
+            index = int(now) // CANDLE_SECONDS
+            per_topic = max(1, int(self.trade_rate * tick / len(topics)))
+            burst = self.burst_topic(topics, now)
+            for topic in list(topics):
+                symbol = topic[len("publicTrade."):]
+                if candles.get(symbol, (None,))[0] != index:
+                    candles[symbol] = (index,) + self.candle(symbol, index)
+                _, volume, price = candles[symbol]
+                size = volume / CANDLE_SECONDS * tick / per_topic * (SOAK_BURST_FACTOR if topic == burst else 1)
+                trade = f'{{"T":{now_ms},"s":"{symbol}","S":"Buy","v":"{size:.6f}","p":"{price:.4f}","BT":false}}'
+                await ws.send_str(f'{{"topic":"{topic}","type":"snapshot","ts":{now_ms},"data":[{",".join([trade] * per_topic)}]}}')
+
+def read_rss():
+    # Текущий RSS в байтах; без /proc (не Linux) — пиковый из getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class SoakProbe:
+    # Замеры прогона: трассируемая память, число объектов Python и Qt, RSS, задержка цикла,
+    # размеры известных контейнеров; в конце — отчёт с монотонно растущими рядами
+    def __init__(self, widget):
+        import tracemalloc
+        self.widget = widget
+        self.samples = []
+        self.latencies = []
+        self.baseline_snapshot = None
+        self.baseline_types = self.last_types = None
+        self.bounds = {}
+        tracemalloc.start()
+
+    def containers(self):
+        # Внутренние словари -> (размер, граница): по ним нельзя судить о тренде — они законно
+        # растут до размера вселенной, — поэтому утечкой считается только выход за границу
+        w = self.widget
+        universe = len(w.tickers)
+        rules = len(w.rule_engine.rules)
+        rows = len(w.store.rows) + len(w.store.free_rows) if w.store is not None else 0
+        return {
+            "ticker_data": (len(w.ticker_data), universe),
+            "market_stats": (len(w.market_stats), universe),
+            "notified": (len(w.notifier.notified_candles), universe * rules),
+            "last_fired": (len(w.rule_engine.last_fired), universe * rules),
+            "enrich_cache": (len(w.enricher.cache), universe),
+            "candle_rows": (rows, universe),
+            "sketch_rows": (len(w.sketch.rows) + len(w.sketch.free_rows) if w.sketch is not None else 0, universe),
+            "sink_queues": (sum(len(sink.queue) for sink in w.notifier.bus.sinks),
+                            sum(sink.queue_size for sink in w.notifier.bus.sinks)),
+        }
+
+    def sample(self, cycle, sim_time):
+        import gc, tracemalloc
+        from collections import Counter
+        from PyQt5.QtCore import QObject
+        gc.collect()
+        types = Counter(type(o).__name__ for o in gc.get_objects())
+        latency = self.latencies[-SOAK_SAMPLE_EVERY:]
+        self.samples.append({
+            "cycle": cycle,
+            "sim_time": sim_time,
+            "traced": tracemalloc.get_traced_memory()[0],
+            "objects": sum(types.values()),
+            "qt_children": len(self.widget.findChildren(QObject)),
+            "rss": read_rss(),
+            "latency_ms": 1000 * sum(latency) / max(1, len(latency)),
+        })
+        self.bounds = self.containers()
+        # Точка отсчёта для сравнения снимков и типов — конец прогрева
+        if self.baseline_snapshot is None and len(self.samples) >= 2:
+            self.baseline_snapshot = tracemalloc.take_snapshot()
+            self.baseline_types = types
+        self.last_types = types
+
+    @staticmethod
+    def growth(values):
+        # -> (относительный рост по линейной регрессии, доля неубывающих шагов)
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) < 4 or not values.any():
+            return 0.0, 0.0
+        x = np.arange(len(values))
+        slope, intercept = np.polyfit(x, values, 1)
+        start = max(abs(intercept), 1e-9)
+        steps = np.diff(values)
+        return slope * (len(values) - 1) / start, float((steps >= 0).mean())
+
+    def report(self, sim_hours):
+        import tracemalloc
+        lines = [f"Прогон: {sim_hours:g} ч симулированного времени, {self.samples[-1]['cycle']} циклов, "
+                 f"{len(self.samples)} замеров", ""]
+        fields = [k for k in self.samples[0] if k not in ("cycle", "sim_time")]
+        header = f"{'цикл':>6} {'сим. время':>16} " + " ".join(f"{f:>13}" for f in fields)
+        lines.append(header)
+        for x in self.samples:
+            stamp = datetime.fromtimestamp(x["sim_time"], timezone.utc).strftime('%Y-%m-%d %H:%M')
+            lines.append(f"{x['cycle']:>6} {stamp:>16} " + " ".join(
+                f"{x[f] / 1048576:>11.1f}МБ" if f in ("traced", "rss") else f"{x[f]:>13.1f}" if f == "latency_ms"
+                else f"{x[f]:>13}" for f in fields))
+        lines.append("")
+        warm = self.samples[int(len(self.samples) * SOAK_WARMUP):]
+        flagged = []
+        for field in fields:
+            growth, monotonic = self.growth([x[field] for x in warm])
+            mark = growth > SOAK_GROWTH_LIMIT and monotonic >= 0.7
+            if mark:
+                flagged.append(field)
+            lines.append(f"{'РОСТ' if mark else 'ок':>5}  {field:<14} {growth * 100:+7.1f}% после прогрева, "
+                         f"неубывающих шагов {monotonic * 100:.0f}%")
+        if self.baseline_snapshot is not None:
+            lines += ["", "Рост памяти по строкам кода (от конца прогрева):"]
+            diff = tracemalloc.take_snapshot().compare_to(self.baseline_snapshot, 'lineno')
+            for stat in diff[:10]:
+                lines.append(f"  {stat.size_diff / 1024:+10.1f} КБ  {stat.count_diff:+8d} блоков  {stat.traceback[0]}")
+            lines += ["", "Рост числа объектов по типам:"]
+            delta = self.last_types.copy()
+            delta.subtract(self.baseline_types)
+            for name, count in delta.most_common(10):
+                if count > 0:
+                    lines.append(f"  {count:+8d}  {name}")
+        lines += ["", "Внутренние словари (размер / граница по числу тикеров и правил):"]
+        for name, (size, bound) in self.bounds.items():
+            mark = size > bound
+            if mark:
+                flagged.append(name)
+            lines.append(f"{'РОСТ' if mark else 'ок':>5}  {name:<14} {size} / {bound}")
+        lines += ["", f"Монотонный рост: {', '.join(flagged)}" if flagged else "Монотонного роста не обнаружено"]
+        return "\n".join(lines), flagged
+
+async def soak(widget, probe, clock, hours):
+    # Полный движок (загрузка, онлайн-циклы, правила, журнал, история, ротация листингов)
+    # против стенда; таймеры окна остановлены, циклы двигают симулированные часы
+    widget.timer.stop()
+    widget.universe_timer.stop()
+    await widget.async_load_stats()
+    universe_every = max(1, widget.settings["universe_ttl"] * 60 // SOAK_CYCLE_SECONDS)
+    cycles = int(hours * 3600 / SOAK_CYCLE_SECONDS)
+    for cycle in range(1, cycles + 1):
+        clock.advance(SOAK_CYCLE_SECONDS)
+        if cycle % universe_every == 0:
+            await widget.refresh_universe()
+        started = time.perf_counter()
+        await widget.update_online()
+        probe.latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0)  # очередь событий Qt между циклами, как в обычной работе
+        if cycle % SOAK_SAMPLE_EVERY == 0 or cycle == cycles:
+            probe.sample(cycle, clock.time())
+            print(f"[Прогон] цикл {cycle}/{cycles}, RSS {probe.samples[-1]['rss'] / 1048576:.1f} МБ, "
+                  f"цикл {probe.samples[-1]['latency_ms']:.0f} мс")
+
+def run_trade_bench(args):
+    # Лента сделок против локального стенда: пропускная способность приёма на одном ядре
+    # и задержка раннего сигнала от начала ускорения тикера
+    async def bench():
+        server = MockBybitServer(time, args.soak_symbols, args.trade_rate)
+        base = await server.start()
+        stream = TradeStream("linear", "ws" + base[len("http"):] + "/v5/public/linear")
+        symbols = server.listed()
+        stream.set_symbols(symbols)
+        index = int(time.time()) // CANDLE_SECONDS
+        stream.set_baselines({symbol: sum(server.candle(symbol, index - i)[0] for i in range(1, 21)) / 20 / CANDLE_SECONDS
+                              for symbol in symbols})
+        feed, spent = stream.feed, [0.0]
+
+        def timed_feed(raw):
+            started = time.perf_counter()
+            feed(raw)
+            spent[0] += time.perf_counter() - started
+        stream.feed = timed_feed
+        detected = {}
+        async with aiohttp.ClientSession() as session:
+            task = asyncio.ensure_future(stream.run(session, print))
+            await asyncio.sleep(1)  # подписка
+            trades, cpu, wall = stream.trades, time.process_time(), time.perf_counter()
+            spent[0] = 0.0
+            for _ in range(args.trade_bench):
+                await asyncio.sleep(1)
+                now = time.time()
+                for symbol, volume, pace in stream.bursts(args.trade_ratio):
+                    start = now - now % SOAK_BURST_EVERY
+                    detected.setdefault((symbol, start), now - start)
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            task.cancel()
+        await server.stop()
+        trades = stream.trades - trades
+        print(f"Тикеров: {len(symbols)}, сделок: {trades} за {wall:.1f} с ({trades / wall:,.0f} в секунду)")
+        print(f"Разбор ленты (feed): {spent[0] / wall * 100:.1f}% ядра, {spent[0] / max(1, trades) * 1e6:.2f} мкс на сделку")
+        print(f"Процесс целиком со стендом и WebSocket: {cpu / wall * 100:.0f}% ядра")
+        for (symbol, _), delay in sorted(detected.items(), key=lambda x: x[0][1]):
+            print(f"Ранний всплеск {symbol}: через {delay:.1f} с после начала ускорения")
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(bench())
+
+def run_shard_bench(args):
+    # Масштабирование шардов: время онлайн-цикла по всей вселенной стенда для разного числа
+    # процессов. Стенд отвечает с задержкой --shard-latency — цикл упирается в сетевые
+    # ожидания, как с настоящей биржей, а не в процессор стенда в этом же процессе
+    async def bench():
+        server = MockBybitServer(time, args.soak_symbols, latency=args.shard_latency)
+        point_bybit_at(await server.start())
+        keys = [(symbol, "linear") for symbol in server.listed()]
+        bucket_start = int(time.time()) // CANDLE_SECONDS * CANDLE_SECONDS
+        from_ts = bucket_start - 20 * CANDLE_SECONDS
+        results = []
+        for n_workers in (int(n) for n in args.shard_workers.split(",")):
+            scanner = ShardedScanner(keys, n_workers, 0)
+            try:
+                await scanner.run_cycle("online", from_ts, bucket_start)  # прогрев: запуск процессов, соединения
+                spent = []
+                for _ in range(args.shard_bench):
+                    started = time.perf_counter()
+                    ok = await scanner.run_cycle("online", from_ts, bucket_start)
+                    spent.append(time.perf_counter() - started)
+            finally:
+                scanner.close()
+            median = float(np.median(spent))
+            results.append((scanner.n_workers, median, ok))
+            speedup = results[0][1] / median
+            print(f"Процессов: {scanner.n_workers}, цикл {median * 1000:.0f} мс (медиана {len(spent)}), "
+                  f"тикеров {ok}/{len(keys)}, {len(keys) / median:,.0f} запросов/с, "
+                  f"ускорение {speedup:.2f}x ({speedup / (scanner.n_workers / results[0][0]) * 100:.0f}% от линейного)")
+        await server.stop()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(bench())
+
+def run_soak(args):
+    import tempfile
+    report_path = os.path.abspath(args.soak_report)
+    # Журнал, история и снимок — во временном каталоге, настройки — отдельные; рабочие не трогаются
+    global SETTINGS_APP
+    SETTINGS_APP = "BybitMonitorSoak"
+    workdir = tempfile.mkdtemp(prefix="soak-")
+    os.chdir(workdir)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    settings = QSettings("VolumeSpikes", SETTINGS_APP)
+    settings.clear()
+    for key, value in {"selected_type": "linear", "exchanges": "bybit", "hub_mode": "off",
+                       "worker_processes": args.soak_workers, "rate_limit_rps": 0, "history_enabled": True,
+                       "enable_sound": False, "enable_telegram": False}.items():
+        settings.setValue(key, value)
+    settings.sync()
+    clock = SimClock(time, float(int(time.time()) // CANDLE_SECONDS * CANDLE_SECONDS))
+    globals()["time"] = clock
+    app = QApplication(sys.argv[:1])
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    server = MockBybitServer(clock, args.soak_symbols)
+    with loop:
+        point_bybit_at(loop.run_until_complete(server.start()))
+        widget = BybitVolumeSpikesWidget()
+        widget.show()
+        probe = SoakProbe(widget)
+        try:
+            loop.run_until_complete(soak(widget, probe, clock, args.soak))
+        finally:
+            widget.close()
+            loop.run_until_complete(server.stop())
+    text, flagged = probe.report(args.soak)
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    print(text)
+    print(f"\nОтчёт: {report_path}, рабочий каталог прогона: {workdir}")
+    sys.exit(1 if flagged else 0)
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    import argparse
+    parser = argparse.ArgumentParser(description="Монитор всплесков объёма")
+    parser.add_argument("--spikes", metavar="SYMBOL[:CATEGORY]", help="всплески тикера из истории (по умолчанию за 30 дней)")
+    parser.add_argument("--offenders", action="store_true", help="тикеры с повторными всплесками (по умолчанию за 7 дней)")
+    parser.add_argument("--days", type=int, help="глубина запроса в днях")
+    parser.add_argument("--min-ratio", type=float, default=2.0, help="минимальная кратность всплеска")
+    parser.add_argument("--min-spikes", type=int, default=3, help="минимум всплесков для --offenders")
+    parser.add_argument("--soak", type=float, metavar="HOURS", help="прогон на утечки: HOURS симулированных часов против локального стенда")
+    parser.add_argument("--soak-symbols", type=int, default=SOAK_SYMBOLS, help="тикеров на стенде")
+    parser.add_argument("--soak-workers", type=int, default=0, help="процессов-сканеров в прогоне")
+    parser.add_argument("--soak-report", default="soak_report.txt", help="файл отчёта прогона")
+    parser.add_argument("--trade-bench", type=int, metavar="SECONDS", help="замер приёма ленты сделок против локального стенда")
+    parser.add_argument("--trade-rate", type=int, default=SOAK_TRADE_RATE, help="сделок в секунду на ленте стенда")
+    parser.add_argument("--trade-ratio", type=float, default=5.0, help="порог темпа раннего всплеска для замера")
+    parser.add_argument("--shard-bench", type=int, metavar="CYCLES", help="замер времени цикла шардов против локального стенда")
+    parser.add_argument("--shard-workers", default="1,2,4", help="числа процессов для --shard-bench через запятую")
+    parser.add_argument("--shard-latency", type=float, default=0.05, help="задержка ответа стенда в секундах для --shard-bench")
+    parser.add_argument("--alert-latency", action="store_true", help="перцентили задержки уведомлений по участкам (--days, по умолчанию 7)")
+    parser.add_argument("--profile-cycles", type=int, metavar="N", help=f"записать профиль первых N циклов в {PROFILE_DIR}/")
+    args, qt_args = parser.parse_known_args()
+    if args.spikes or args.offenders:
+        run_history_query(args)
+        sys.exit(0)
+    if args.alert_latency:
+        run_latency_report(args)
+        sys.exit(0)
+    if args.soak:
+        run_soak(args)
+    if args.trade_bench:
+        run_trade_bench(args)
+        sys.exit(0)
+    if args.shard_bench:
+        run_shard_bench(args)
+        sys.exit(0)
+    app = QApplication(sys.argv[:1] + qt_args)
     loop = qasync.QEventLoop(app)
     asyncio.set_event_loop(loop)
     widget = BybitVolumeSpikesWidget()
     widget.show()
+    if args.profile_cycles:
+        widget.start_profile(args.profile_cycles)
+    import signal
+    if hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> — профиль работающего экземпляра; обработчик срабатывает
+        # при ближайшем событии Qt, поэтому запуск профиля только ставится в очередь
+        signal.signal(signal.SIGUSR1, lambda *_: loop.call_soon_threadsafe(widget.start_profile))
     loop.call_soon_threadsafe(widget.load_stats)
     with loop:
         loop.run_forever()
\ No newline at end of file
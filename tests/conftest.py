@@ -0,0 +1,14 @@
+import importlib.util
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Скрипт называется с дефисом — импортируем по пути под именем bybit_volume_spikes_v2
+spec = importlib.util.spec_from_file_location("bybit_volume_spikes_v2", os.path.join(ROOT, "bybit_volume_spikes-v2.py"))
+module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = module
+spec.loader.exec_module(module)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import bybit_volume_spikes_v2 as bvs
+from conftest import FIXTURES
+
+T = 1760000400000
+Q = 900000
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def replay(routes):
+    # get_json, отвечающий записанным ответом по первой подстроке url из routes
+    requested = []
+
+    async def get_json(url):
+        requested.append(url)
+        for part, name in routes:
+            if part in url:
+                return fixture(name)
+        raise AssertionError(f"нет ответа для {url}")
+    get_json.requested = requested
+    return get_json
+
+
+def test_bybit_instruments_skip_inactive_and_follow_cursor():
+    adapter = bvs.EXCHANGES["bybit"]
+    assert adapter.decode_instruments(fixture("bybit/instruments_spot.json")) == (["BTCUSDT", "ETHUSDC"], None)
+    get_json = replay([("cursor=", "bybit/instruments_linear_page2.json"),
+                       ("category=linear", "bybit/instruments_linear_page1.json")])
+    symbols = asyncio.run(adapter.fetch_instruments(get_json, "linear"))
+    assert symbols == ["BTCUSDT", "SOLUSDT"]
+    assert "cursor=" not in get_json.requested[0] and "cursor=" in get_json.requested[1]
+
+
+def test_bybit_tickers_and_klines():
+    adapter = bvs.EXCHANGES["bybit"]
+    stats = adapter.decode_tickers(fixture("bybit/tickers_spot.json"), "spot")
+    assert stats["BTCUSDT"] == {"turnover24h": pytest.approx(1234567890.1234), "change24h": pytest.approx(1.22)}
+    assert stats["ETHUSDC"]["turnover24h"] == 0.0
+    klines = asyncio.run(adapter.fetch_klines(replay([("kline", "bybit/klines_linear.json")]), "BTCUSDT", "linear", (T + Q) / 1000))
+    assert [int(k[0]) for k in klines] == [T + 2 * Q, T + Q]
+    assert klines[0][5] == "120.512" and klines[0][6] == "7474500.12"
+
+
+def test_binance_instruments_keep_trading_usdt_perpetuals():
+    adapter = bvs.EXCHANGES["binance"]
+    assert adapter.decode_instruments(fixture("binance/exchangeinfo_spot.json")) == (["BTCUSDT", "SOLUSDT"], None)
+    assert adapter.decode_instruments(fixture("binance/exchangeinfo_linear.json")) == (["BTCUSDT"], None)
+
+
+def test_binance_klines_normalized_to_bybit_order():
+    adapter = bvs.EXCHANGES["binance"]
+    klines = adapter.decode_klines(fixture("binance/klines_spot.json"), "spot")
+    # Как у Bybit: от свежих к старым, [start, o, h, l, c, объём, оборот в котируемой]
+    assert klines[0] == [T + 2 * Q, "62010.00", "62100.00", "61990.50", "62050.50", "120.51200", "7474500.12"]
+    assert [k[0] for k in klines] == [T + 2 * Q, T + Q, T]
+    assert adapter.decode_klines({"code": -1121, "msg": "Invalid symbol."}, "spot") == []
+
+
+def test_binance_tickers():
+    stats = bvs.EXCHANGES["binance"].decode_tickers(fixture("binance/ticker24hr_spot.json"), "spot")
+    assert stats["SOLUSDT"] == {"turnover24h": pytest.approx(150200000.5), "change24h": pytest.approx(-2.05)}
+
+
+def test_okx_instruments_and_swap_volumes():
+    adapter = bvs.EXCHANGES["okx"]
+    assert adapter.decode_instruments(fixture("okx/instruments_swap.json")) == (["BTC-USDT-SWAP", "ETH-USDC-SWAP"], None)
+    klines = adapter.decode_klines(fixture("okx/candles_swap.json"), "linear")
+    # У SWAP объём в контрактах — берётся volCcy в базовой монете
+    assert klines[0] == [str(T + 2 * Q), "62010.0", "62100.0", "61990.5", "62050.5", "120.512", "7474500.12"]
+
+
+def test_okx_tickers_turnover_in_quote():
+    stats = bvs.EXCHANGES["okx"].decode_tickers(fixture("okx/tickers_swap.json"), "linear")
+    assert stats["BTC-USDT-SWAP"]["turnover24h"] == pytest.approx(19950.12 * 62050.2)
+    assert stats["BTC-USDT-SWAP"]["change24h"] == pytest.approx((62050.2 / 61300 - 1) * 100)
+    assert stats["ETH-USDC-SWAP"]["change24h"] == 0.0
+
+
+@pytest.mark.parametrize("venue,market,category", [("bybit", "linear", "linear"), ("binance", "spot", "binance-spot"),
+                                                   ("okx", "linear", "okx-linear")])
+def test_categories_resolve_back_to_adapter(venue, market, category):
+    adapter = bvs.EXCHANGES[venue]
+    assert adapter.category(market) == category
+    assert bvs.resolve_category(category) == (adapter, market)
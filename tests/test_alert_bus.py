@@ -0,0 +1,96 @@
+import asyncio
+
+import bybit_volume_spikes_v2 as bvs
+
+
+class RecordingSink(bvs.AlertSink):
+    def __init__(self, name="rec", delay=0.0, **kwargs):
+        kwargs.setdefault("window", 0.01)
+        super().__init__(name, **kwargs)
+        self.delay = delay
+        self.batches = []
+
+    async def deliver(self, batch):
+        await asyncio.sleep(self.delay)
+        self.batches.append([alert["traces"][0]["i"] for alert in batch])
+
+
+def alert(i, destinations=()):
+    return {"destinations": set(destinations), "traces": [{"i": i}]}
+
+
+def test_traces_finish_once_when_group_and_members_have_no_sinks():
+    async def run():
+        finished = []
+        bus = bvs.AlertBus(finished.append)
+        members = [alert(i) for i in range(3)]
+        for member in members:
+            bus.publish(member)
+        bus.publish({"destinations": set(), "traces": [m["traces"][0] for m in members]})
+        await asyncio.sleep(0.01)
+        assert sorted(trace["i"] for trace in finished) == [0, 1, 2]
+    asyncio.run(run())
+
+
+def test_trace_finishes_after_every_sink_of_member_and_group():
+    async def run():
+        finished = []
+        bus = bvs.AlertBus(finished.append)
+        fast, slow = RecordingSink("fast"), RecordingSink("slow", delay=0.1)
+        bus.set_sinks([fast, slow])
+        member = alert(0)
+        bus.publish(member)
+        bus.publish({"destinations": set(), "traces": member["traces"]})
+        await asyncio.sleep(0.05)
+        assert fast.batches == [[0, 0]] and not finished
+        await asyncio.sleep(0.1)
+        assert finished == member["traces"] and "pending" not in finished[0]
+        bus.set_sinks([])
+    asyncio.run(run())
+
+
+def test_window_batches_and_slow_sink_does_not_delay_others():
+    async def run():
+        bus = bvs.AlertBus(lambda trace: None)
+        fast, slow = RecordingSink("fast", max_batch=4), RecordingSink("slow", delay=1.0)
+        bus.set_sinks([fast, slow])
+        for i in range(6):
+            bus.publish(alert(i))
+        await asyncio.sleep(0.1)
+        assert fast.batches == [[0, 1, 2, 3], [4, 5]]
+        assert slow.batches == []
+        bus.set_sinks([])
+    asyncio.run(run())
+
+
+def test_overflow_policies_release_dropped_alerts():
+    async def run():
+        finished = []
+        bus = bvs.AlertBus(finished.append)
+        oldest = RecordingSink("oldest", delay=10, queue_size=3)
+        newest = RecordingSink("newest", delay=10, queue_size=3, policy="drop_newest")
+        bus.set_sinks([oldest, newest])
+        for i in range(10):
+            bus.publish(alert(i))
+        assert [a["traces"][0]["i"] for a in oldest.queue] == [7, 8, 9]
+        assert [a["traces"][0]["i"] for a in newest.queue] == [0, 1, 2]
+        assert oldest.dropped == newest.dropped == 7
+        # Оба получателя потеряли 3..6 — эти уведомления закрыты сразу
+        assert sorted(trace["i"] for trace in finished) == [3, 4, 5, 6]
+        bus.set_sinks([])
+        await asyncio.sleep(0)
+        assert len(finished) == 10
+    asyncio.run(run())
+
+
+def test_destination_sinks_follow_rule_destinations():
+    class Parent:
+        settings = {"enable_sound": True, "enable_popup": False}
+
+    class Notifier:
+        parent = Parent()
+
+    sound, popup = bvs.SoundSink(Notifier()), bvs.PopupSink(Notifier())
+    assert sound.accepts(alert(0, {"sound"}))
+    assert not sound.accepts(alert(0, {"log"}))
+    assert not popup.accepts(alert(0, {"popup"}))  # выключено в настройках
@@ -0,0 +1,47 @@
+import numpy as np
+
+import bybit_volume_spikes_v2 as bvs
+
+RETAIN = 40
+
+
+def fill(store, key, volumes, last):
+    row = store.row(key)
+    for index, volume in zip(range(last - len(volumes) + 1, last + 1), volumes):
+        store.ring[0, row, index % RETAIN] = volume
+        store.ring[1, row, index % RETAIN] = index
+    return row
+
+
+def market(seed=1):
+    rng = np.random.default_rng(seed)
+    factor = np.exp(rng.normal(0, 1, RETAIN))
+    store = bvs.CandleStore(RETAIN, capacity=8)
+    last = 10_000
+    for i, key in enumerate([("AUSDT", "linear"), ("BUSDT", "linear"), ("CUSDT", "linear")]):
+        fill(store, key, 1000 * factor * np.exp(rng.normal(0, 0.1, RETAIN)), last)
+    return store, last, rng
+
+
+def test_comoving_tickers_form_one_group():
+    store, last, rng = market()
+    fill(store, ("NOISEUSDT", "linear"), 1000 * np.exp(rng.normal(0, 1, RETAIN)), last)
+    corr = bvs.VolumeCorrelation()
+    corr.update(store, (last + 2) * bvs.CANDLE_SECONDS)
+    labels = corr.groups([store.rows[key] for key in store.rows])
+    assert list(labels) == [0, 0, 0, 3]
+
+
+def test_reused_row_does_not_inherit_history():
+    store, last, rng = market()
+    corr = bvs.VolumeCorrelation()
+    now = (last + 2) * bvs.CANDLE_SECONDS
+    corr.update(store, now)
+    old = store.rows[("AUSDT", "linear")]
+    # Делистинг и новый листинг в пределах одной свечи: строка переходит новому тикеру
+    store.drop([("AUSDT", "linear")])
+    assert store.row(("NEWUSDT", "linear")) == old
+    corr.update(store, now)
+    assert not corr.cov[old].any() and not corr.cov[:, old].any()
+    rows = [store.rows[key] for key in (("NEWUSDT", "linear"), ("BUSDT", "linear"), ("CUSDT", "linear"))]
+    assert list(corr.groups(rows)) == [0, 1, 1]
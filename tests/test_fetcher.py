@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+import bybit_volume_spikes_v2 as bvs
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return self.body
+
+
+class FakeSession:
+    # Ответ через delays[i] секунд для i-го запроса (последняя задержка — для остальных)
+    def __init__(self, delays=(0.0,), status=200, body=b'{"ok": 1}'):
+        self.delays = list(delays)
+        self.status = status
+        self.body = body
+        self.calls = 0
+        self.active = 0
+
+    def get(self, url, timeout=None):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        session = self
+
+        class Request:
+            async def __aenter__(self):
+                session.active += 1
+                try:
+                    await asyncio.sleep(delay)
+                except BaseException:
+                    session.active -= 1
+                    raise
+                return FakeResponse(session.status, session.body)
+
+            async def __aexit__(self, *exc):
+                session.active -= 1
+                return False
+
+        return Request()
+
+
+class FakeAdapter:
+    name = "fake"
+
+    def is_rate_limited(self, status, data):
+        return status == 429
+
+
+def make_fetcher(session, **kwargs):
+    kwargs.setdefault("backoff", 0.0)
+    return bvs.ResilientFetcher(session, {"fake": bvs.RateLimiter(0)}, **kwargs)
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = bvs.CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure(0)
+    assert breaker.allow(1)
+    breaker.record_failure(1)
+    assert not breaker.allow(5)
+    assert breaker.allow(11)  # пробный запрос
+    assert not breaker.allow(11)  # второй ждёт исхода пробного
+    breaker.record_failure(12)
+    assert not breaker.allow(13)
+    assert breaker.allow(22)
+    breaker.record_success()
+    assert breaker.allow(22) and breaker.allow(22)
+
+
+def test_fetch_success_and_failures_open_breaker():
+    async def run():
+        fetcher = make_fetcher(FakeSession(status=503, body=b"{}"), retries=1)
+        fetcher.breakers["fake/x"] = bvs.CircuitBreaker(failure_threshold=2)
+        for _ in range(2):
+            with pytest.raises(bvs.RetryableError):
+                await fetcher.get_json(FakeAdapter(), "http://h/x")
+        with pytest.raises(bvs.CircuitOpenError):
+            await fetcher.get_json(FakeAdapter(), "http://h/x")
+        ok = make_fetcher(FakeSession())
+        assert await ok.get_json(FakeAdapter(), "http://h/x") == {"ok": 1}
+    asyncio.run(run())
+
+
+def test_cancelled_probe_releases_breaker():
+    async def run():
+        session = FakeSession(delays=(5.0,))
+        fetcher = make_fetcher(session)
+        breaker = fetcher.breakers["fake/x"] = bvs.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure(asyncio.get_running_loop().time())
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(fetcher.get_json(FakeAdapter(), "http://h/x"), 0.05)
+        assert not breaker.probing
+        session.delays = [0.0]
+        assert await fetcher.get_json(FakeAdapter(), "http://h/x") == {"ok": 1}
+        assert breaker.opened_at is None
+    asyncio.run(run())
+
+
+def test_hedged_request_wins_and_losers_are_cancelled():
+    async def run():
+        session = FakeSession(delays=(5.0, 0.0))
+        fetcher = make_fetcher(session, min_hedge_delay=0.05)
+        assert await fetcher.get_json(FakeAdapter(), "http://h/x") == {"ok": 1}
+        assert session.calls == 2
+        await asyncio.sleep(0)
+        assert session.active == 0
+    asyncio.run(run())
+
+
+def test_cancel_during_first_wait_cancels_primary():
+    async def run():
+        session = FakeSession(delays=(5.0,))
+        fetcher = make_fetcher(session, min_hedge_delay=1.0)
+        task = asyncio.ensure_future(fetcher.get_json(FakeAdapter(), "http://h/x"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        assert session.calls == 1 and session.active == 0
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import aiohttp
+
+import bybit_volume_spikes_v2 as bvs
+
+
+def test_hub_listens_on_loopback_by_default():
+    async def run():
+        hub = bvs.SpikeHub(0)
+        await hub.start()
+        try:
+            assert [address[0] for address in hub.runner.addresses] == ["127.0.0.1"]
+        finally:
+            await hub.stop()
+    asyncio.run(run())
+
+
+def test_subscriber_skips_malformed_messages_and_stays_connected():
+    async def run():
+        hub = bvs.SpikeHub(0)
+        await hub.start()
+        port = hub.runner.addresses[0][1]
+        received, statuses = [], []
+
+        def on_message(message):
+            # Как on_hub_message: строки без symbol и remove не из пар падают
+            for symbol, category in message.get("remove", []):
+                received.append(("remove", symbol))
+            for row in message.get("rows", message.get("upsert", [])):
+                received.append(("row", row["symbol"]))
+
+        subscriber = bvs.HubSubscriber(f"ws://127.0.0.1:{port}/ws", on_message, statuses.append)
+        async with aiohttp.ClientSession() as session:
+            task = asyncio.ensure_future(subscriber.run(session))
+            while not hub.clients:
+                await asyncio.sleep(0.01)
+            for message in ({"type": "delta", "upsert": [{"category": "spot"}]},
+                            {"type": "delta", "remove": ["AUSDT"]},
+                            [1, 2],
+                            {"type": "delta", "upsert": [{"symbol": "BUSDT", "category": "spot"}]}):
+                hub.broadcast(message)
+            for queue in hub.clients:
+                queue.put_nowait("{не json")
+            hub.broadcast({"type": "delta", "remove": [["CUSDT", "spot"]]})
+            for _ in range(100):
+                if len(received) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert not task.done()
+            assert received == [("row", "BUSDT"), ("remove", "CUSDT")]
+            assert len([s for s in statuses if "подключено" in s]) == 1
+            task.cancel()
+        await hub.stop()
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+import os
+
+import bybit_volume_spikes_v2 as bvs
+
+
+def entry(day, symbol, category, ratio, tag=None):
+    tag_str = f" [{tag}]" if tag else ""
+    return f"[2026-10-{day:02d} 12:00:00] {symbol} ({category}){tag_str} - {ratio:.1f}x, цена: 1.000, Объем: 50,000 USD"
+
+
+def write(path, lines, mode="a"):
+    with open(path, mode, encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def test_index_reads_pages_and_bisects_dates(tmp_path):
+    path = str(tmp_path / "log.txt")
+    lines = [entry(day, f"T{day}USDT", "linear", day / 2) for day in range(1, 21) for _ in range(3)]
+    write(path, lines)
+    index = bvs.LogIndex(path)
+    assert len(index) == 60
+    assert index.read_lines(3, 6) == lines[3:6]
+    assert index.read_lines(5, 5) == []
+    assert index.bisect_date("2026-10-05") == 12
+    assert index.bisect_date("2026-11-01") == 60
+
+
+def test_index_persists_and_reads_only_the_tail(tmp_path):
+    path = str(tmp_path / "log.txt")
+    write(path, [entry(1, "AUSDT", "spot", 2.0)] * 5)
+    bvs.LogIndex(path)
+    assert os.path.getsize(path + ".idx") == 5 * 8
+    write(path, [entry(2, "BUSDT", "spot", 3.0)] * 2)
+    index = bvs.LogIndex(path)
+    assert len(index) == 7
+    write(path, [entry(3, "CUSDT", "spot", 4.0)])
+    assert index.refresh() == 1
+    assert index.read_lines(6, 8) == [entry(2, "BUSDT", "spot", 3.0), entry(3, "CUSDT", "spot", 4.0)]
+
+
+def test_rewritten_log_rebuilds_index(tmp_path):
+    path = str(tmp_path / "log.txt")
+    write(path, [entry(1, "AUSDT", "spot", 2.0)] * 10)
+    bvs.LogIndex(path)
+    write(path, [entry(5, "ZUSDT", "linear", 9.0)], mode="w")
+    index = bvs.LogIndex(path)
+    assert len(index) == 1 and index.read_lines(0, 1) == [entry(5, "ZUSDT", "linear", 9.0)]
+
+
+def test_append_log_lines_keeps_one_entry_per_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bvs.append_log_lines([entry(1, "AUSDT", "spot", 2.0), "многострочная\nзапись"])
+    index = bvs.LogIndex(bvs.NOTIFICATION_LOG_FILE)
+    assert index.read_lines(0, len(index)) == [entry(1, "AUSDT", "spot", 2.0), "многострочная запись"]
+
+
+def test_migrate_reverses_newest_first_log(tmp_path):
+    path = str(tmp_path / "log.txt")
+    lines = [entry(day, "AUSDT", "spot", 2.0) for day in (3, 2, 1)]
+    write(path, lines)
+    bvs.migrate_notification_log(path)
+    with open(path, encoding="utf-8") as f:
+        assert f.read().splitlines() == lines[::-1]
+    bvs.migrate_notification_log(path)  # уже по возрастанию — не трогает
+    with open(path, encoding="utf-8") as f:
+        assert f.read().splitlines() == lines[::-1]
+
+
+def test_filter_matches_fields():
+    line = entry(10, "PEPEUSDT", "binance-linear", 4.5, tag="Основное")
+    assert not bvs.LogFilter().active()
+    assert bvs.LogFilter(symbol="pepe").match(line)
+    assert bvs.LogFilter(category="binance-linear", ratio_min=4, ratio_max=5).match(line)
+    assert not bvs.LogFilter(category="linear").match(line)
+    assert not bvs.LogFilter(ratio_max=4).match(line)
+    assert bvs.LogFilter(date_from="2026-10-10", date_to="2026-10-10").match(line)
+    assert not bvs.LogFilter(date_from="2026-10-11").match(line)
+    # Строки групп и прочие записи не по формату не проходят активный фильтр
+    assert not bvs.LogFilter(symbol="PEPE").match("[2026-10-10 12:00:00] Совместный всплеск: 5 тикеров (linear)")
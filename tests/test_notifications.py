@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import bybit_volume_spikes_v2 as bvs
+
+
+class Parent:
+    def __init__(self):
+        self.settings = {"enable_sound": False, "enable_popup": False}
+        self.rule_engine = bvs.AlertRuleEngine()
+        self.market_stats = {}
+        self.notification_log_dialog = None
+        self.recorded = []
+
+    def trace_log(self):
+        parent = self
+
+        class Log:
+            def append(self, traces):
+                parent.recorded.extend(traces)
+        return Log()
+
+    def update_latency_label(self):
+        pass
+
+
+class Capture(bvs.AlertSink):
+    def __init__(self):
+        super().__init__("capture", window=0.01)
+        self.alerts = []
+
+    async def deliver(self, batch):
+        self.alerts.extend(batch)
+
+
+def spikes(n):
+    return [({"symbol": f"T{i}USDT", "category": "linear", "ratio": 5.0 + i, "volume": 1e5, "price": 1.0,
+              "candle_ts": 1760000400}, None, True) for i in range(n)]
+
+
+@pytest.fixture
+def notifier(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return bvs.NotificationSystem(Parent())
+
+
+def run_group(notifier, destinations):
+    async def run():
+        capture = Capture()
+        notifier.bus.set_sinks([capture])
+        rule = bvs.AlertRule("Только Telegram", "ratio > 1", 0, destinations)
+        notifier.send_group(spikes(4), rule, detected=1.0)
+        await asyncio.sleep(0.05)
+        notifier.bus.set_sinks([])
+        await asyncio.sleep(0)
+        return capture.alerts
+    return asyncio.run(run())
+
+
+def test_group_members_skip_log_when_rule_does_not_route_there(notifier):
+    alerts = run_group(notifier, ["telegram"])
+    assert [(a["type"], a["destinations"]) for a in alerts] == [("group", {"telegram"})]
+    # Путь каждого участника всё равно записан — один раз
+    assert sorted(t["symbol"] for t in notifier.parent.recorded) == [f"T{i}USDT" for i in range(4)]
+
+
+def test_group_members_logged_when_rule_routes_to_log(notifier):
+    alerts = run_group(notifier, ["log", "telegram"])
+    assert sorted(a["type"] for a in alerts) == ["group"] + ["spike"] * 4
+    assert all(a["destinations"] == {"log"} for a in alerts if a["type"] == "spike")
+    assert len(notifier.parent.recorded) == 4
+
+
+def test_confirmation_of_projected_candle_passes_rule_cooldown(notifier):
+    parent = notifier.parent
+    parent.settings.update(projection="linear", min_ratio=3.0, min_volume=0.0)
+    parent.isVisible = lambda: True
+    parent.spike_groups = lambda pairs: [[i] for i in range(len(pairs))]
+    parent.rule_engine.set_rules("Пауза | ratio >= 3 | 30 | telegram")
+    key = ("AUSDT", "linear")
+
+    def cycle(candle, ratio, proj_ratio):
+        data = {"symbol": "AUSDT", "category": "linear", "datetime": "x", "candle_ts": candle, "price": 1.0,
+                "open": 1.0, "mean": 100.0, "volume": ratio * 100, "ratio": ratio,
+                "proj_volume": proj_ratio * 100, "proj_ratio": proj_ratio}
+        ticker_data = {key: data}
+        keys, env = parent.rule_engine.build_state(ticker_data, {}, parent.settings)
+        notifier.check_and_notify(ticker_data, keys, env)
+
+    async def run():
+        capture = Capture()
+        notifier.bus.set_sinks([capture])
+        cycle(1000, 1.0, 4.0)  # прогноз
+        cycle(1000, 2.0, 4.5)  # ещё не подтверждено — повтора нет
+        cycle(1000, 3.5, 4.5)  # подтверждение той же свечи, пауза ещё идёт
+        cycle(1000, 4.0, 4.5)  # уже подтверждено
+        cycle(1900, 5.0, 6.0)  # следующая свеча внутри паузы
+        await asyncio.sleep(0.05)
+        notifier.bus.set_sinks([])
+        await asyncio.sleep(0)
+        return capture.alerts
+
+    alerts = asyncio.run(run())
+    assert ["подтверждено" in a["text"] for a in alerts] == [False, True]
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import bybit_volume_spikes_v2 as bvs
+
+
+def env(**columns):
+    base = {
+        "ratio": np.array([1.0, 3.0, 6.0, 12.0]),
+        "volume": np.array([5e3, 2e4, 8e4, 1e6]),
+        "change": np.array([0.0, -1.0, 2.5, 4.0]),
+        "min_ratio": 2.0,
+        "min_volume": 1e4,
+        "symbol": np.array(["AUSDT", "BBTC", "CUSDT", "DUSDC"], dtype=object),
+        "market": np.array(["spot", "linear", "linear", "spot"], dtype=object),
+        "quote": np.array(["USDT", "BTC", "USDT", "USDC"], dtype=object),
+    }
+    base.update(columns)
+    return base
+
+
+def mask(expression, **columns):
+    return bvs.compile_rule_expression(expression)(env(**columns)).tolist()
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os').system('true')",
+    "ratio.__class__",
+    "symbol[0] == 'A'",
+    "open('x')",
+    "(lambda: 1)()",
+    "[x for x in ratio]",
+    "ratio ** 2 > 1",
+    "ratio // 2 > 1",
+    "ratio & volume",
+    "ratio if volume else mean",
+    "_isin(symbol, ['AUSDT'])",
+    "secret > 0",
+    "ratio > True",
+    "f'{ratio}' == '1'",
+    "(y := ratio) > 1",
+    "ratio in volume",
+])
+def test_rejects_anything_outside_whitelist(expression):
+    with pytest.raises(bvs.RuleError):
+        bvs.compile_rule_expression(expression)
+
+
+def test_syntax_error_is_rule_error():
+    with pytest.raises(bvs.RuleError, match="синтаксическая"):
+        bvs.compile_rule_expression("ratio >= ")
+
+
+def test_boolean_logic_is_vectorized():
+    assert mask("ratio >= min_ratio and volume >= min_volume") == [False, True, True, True]
+    assert mask("ratio < 2 or change > 3") == [True, False, False, True]
+    assert mask("not ratio > 5") == [True, True, False, False]
+    assert mask("2 < ratio <= 6") == [False, True, True, False]
+    assert mask("-change > 0") == [False, True, False, False]
+    assert mask("volume / ratio > 1e4 - 1") == [False, False, True, True]
+
+
+def test_string_membership_and_constants():
+    assert mask("quote in ('USDT', 'USDC') and market == 'spot'") == [True, False, False, True]
+    assert mask("symbol not in ['BBTC']") == [True, False, True, True]
+    assert mask("1 > 0") == [True] * 4  # константа растягивается на всю вселенную
+
+
+def test_parse_rules_and_errors():
+    rules = bvs.parse_alert_rules("# комментарий\n\n"
+                                  "Основное | ratio >= min_ratio | 0 | log,telegram\n"
+                                  "Серия | ratio >= 5 | 15\n")
+    assert [(r.name, r.cooldown, r.destinations) for r in rules] == [
+        ("Основное", 0, {"log", "telegram"}), ("Серия", 15, set(bvs.RULE_DESTINATIONS))]
+    for text, message in [("Без выражения", "ожидается"), ("A | ratio > 1 | x", "пауза"),
+                          ("A | ratio > 1 | 0 | email", "email"), ("A | ratio.real > 1", "строка 1 \\(A\\)")]:
+        with pytest.raises(bvs.RuleError, match=message):
+            bvs.parse_alert_rules(text)
+
+
+def test_engine_applies_cooldown_per_rule_and_ticker():
+    engine = bvs.AlertRuleEngine()
+    engine.set_rules("Быстрое | ratio > 5 | 10\nВсе | ratio > 5 | 0")
+    keys = [("AUSDT", "spot"), ("BBTC", "linear"), ("CUSDT", "linear"), ("DUSDC", "spot")]
+    (fast, idx_fast), (_, idx_all) = engine.evaluate(keys, env(), now=1000)
+    assert list(idx_fast) == [2, 3] and list(idx_all) == [2, 3]
+    engine.mark_fired(fast, keys[2], 1000)
+    (_, idx_fast), (_, idx_all) = engine.evaluate(keys, env(), now=1000 + 9 * 60)
+    assert list(idx_fast) == [3] and list(idx_all) == [2, 3]
+    (_, idx_fast), _ = engine.evaluate(keys, env(), now=1000 + 10 * 60)
+    assert list(idx_fast) == [2, 3]
+    engine.forget({keys[2]})
+    assert not engine.last_fired
@@ -0,0 +1,50 @@
+import asyncio
+import queue
+import threading
+
+import bybit_volume_spikes_v2 as bvs
+
+
+class Worker:
+    # Вместо процесса: отвечает на команды цикла в done_queue с задержкой
+    def __init__(self, worker_id, done_queue, n_ok, delay=0.0):
+        self.worker_id = worker_id
+        self.done_queue = done_queue
+        self.n_ok = n_ok
+        self.delay = delay
+
+    def put(self, cmd):
+        def reply():
+            self.done_queue.put((self.worker_id, cmd[-1], self.n_ok))
+        threading.Timer(self.delay, reply).start()
+
+
+def make_scanner(workers):
+    scanner = object.__new__(bvs.ShardedScanner)
+    scanner.done_queue = queue.Queue()
+    scanner.cmd_queues = [Worker(i, scanner.done_queue, n_ok, delay) for i, (n_ok, delay) in enumerate(workers)]
+    scanner.processes = [None] * len(workers)
+    scanner.cycle = 0
+    scanner.cycle_lock = asyncio.Lock()
+    return scanner
+
+
+def test_late_reply_is_not_counted_in_next_cycle():
+    async def run():
+        scanner = make_scanner([(10, 0.0), (20, 0.3)])
+        # Второй шард не успевает: цикл засчитывает только первый
+        assert await scanner.run_cycle("online", 0, 0, timeout=0.1) == 10
+        await asyncio.sleep(0.3)
+        scanner.cmd_queues[1].delay = 0.0
+        # Опоздавший ответ прошлого цикла лежит в очереди, но не засчитывается
+        assert await scanner.run_cycle("online", 0, 0, timeout=1) == 30
+    asyncio.run(run())
+
+
+def test_concurrent_cycles_do_not_steal_replies():
+    async def run():
+        scanner = make_scanner([(1, 0.05), (2, 0.05)])
+        totals = await asyncio.gather(scanner.run_cycle("online", 0, 0, timeout=1),
+                                      scanner.run_cycle("stats", 0, only=[0], timeout=1))
+        assert totals == [3, 3]
+    asyncio.run(run())
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import bybit_volume_spikes_v2 as bvs
+
+# Представитель корзины (γ^(b-1), γ^b] отличается от любого её значения не больше чем на α
+ALPHA = (bvs.SKETCH_GAMMA - 1) / (bvs.SKETCH_GAMMA + 1)
+DAYS = 7
+KEY = ("AUSDT", "linear")
+
+
+def stream(volumes, retain=40):
+    # Свечи по одной через кольцо, как в онлайн-цикле
+    store = bvs.CandleStore(retain, capacity=4)
+    sketch = bvs.VolumeSketch(capacity=4)
+    row = store.row(KEY)
+    start = 10_000
+    for index, volume in enumerate(volumes, start):
+        store.ring[0, row, index % retain] = volume
+        store.ring[1, row, index % retain] = index
+        sketch.update([KEY], store, (index + 1) * bvs.CANDLE_SECONDS, DAYS)
+    return sketch
+
+
+def weighted_quantile(volumes, q):
+    # Точный квантиль с тем же забыванием: первая по величине свеча, на которой накопленный вес ≥ q
+    decay = 1 - 1 / (DAYS * 24 * 3600 / bvs.CANDLE_SECONDS)
+    weights = decay ** np.arange(len(volumes) - 1, -1, -1)
+    order = np.argsort(volumes)
+    cum = np.cumsum(weights[order])
+    return volumes[order][np.searchsorted(cum, q * cum[-1] * (1 - 1e-6))]
+
+
+@pytest.mark.parametrize("q", sorted(bvs.QUANTILES))
+def test_quantile_within_relative_accuracy(q):
+    errors = []
+    for seed in range(20):
+        volumes = np.exp(np.random.default_rng(seed).normal(10, 2, 200))
+        estimate = stream(volumes).quantile([KEY], q)[0]
+        exact = weighted_quantile(volumes, q)
+        errors.append(abs(estimate / exact - 1))
+    assert max(errors) <= ALPHA + 1e-6
+
+
+def test_quantile_needs_a_day_of_candles():
+    volumes = np.full(50, 1000.0)
+    assert np.isnan(stream(volumes).quantile([KEY], 0.99)[0])
+    assert np.isnan(stream(volumes).quantile([("NONE", "spot")], 0.99)[0])
+
+
+def test_save_load_roundtrip(tmp_path):
+    volumes = np.exp(np.random.default_rng(0).normal(10, 2, 200))
+    sketch = stream(volumes)
+    path = str(tmp_path / "sketch.bin")
+    sketch.save(path)
+    loaded = bvs.VolumeSketch.load(path)
+    assert loaded.quantile([KEY], 0.99)[0] == sketch.quantile([KEY], 0.99)[0]
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+CHECK = """
+import importlib.util, os, sys
+spec = importlib.util.spec_from_file_location("bvs", {script!r})
+bvs = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bvs)
+heavy = lambda: sorted(name for name in ("numpy", "aiohttp", "requests") if name in sys.modules)
+print("import", heavy())
+from PyQt5.QtWidgets import QApplication
+bvs.SETTINGS_APP = "VolumeSpikesStartupTest"
+app = QApplication([])
+widget = bvs.BybitVolumeSpikesWidget()
+print("widget", heavy())
+"""
+
+
+def test_heavy_modules_load_after_show(tmp_path):
+    # Тяжёлые модули не должны грузиться ни при импорте, ни при создании окна
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    out = subprocess.run([sys.executable, "-c", CHECK.format(script=os.path.join(ROOT, "bybit_volume_spikes-v2.py"))],
+                         cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert "import []" in out.stdout and "widget []" in out.stdout, out.stdout
@@ -0,0 +1,76 @@
+import os
+
+import bybit_volume_spikes_v2 as bvs
+from conftest import FIXTURES
+
+
+def recorded(name):
+    with open(os.path.join(FIXTURES, "bybit", name), encoding="utf-8") as f:
+        return [line for line in f.read().splitlines() if line]
+
+
+def slot_of(ms):
+    bucket = ms // (bvs.TRADE_BUCKET_SECONDS * 1000)
+    return bucket, bucket % bvs.TRADE_SLOTS
+
+
+def test_feed_accumulates_buckets_and_wraps_the_ring():
+    stream = bvs.TradeStream("spot", "wss://example", capacity=4)
+    stream.set_symbols(["BTCUSDT", "SOLUSDT"])
+    row = stream.rows["publicTrade.BTCUSDT"]
+    messages = recorded("public_trade_spot.jsonl")
+    first, second = slot_of(1700000000000), slot_of(1700000002100)
+
+    # Ответы на подписку и pong не трогают кольца
+    for raw in messages[:2]:
+        stream.feed(raw)
+    assert stream.trades == 0 and not stream.volume.any()
+
+    # Две сделки в одной корзине складываются, третья — в следующей
+    stream.feed(messages[2])
+    assert stream.stamps[row, first[1]] == first[0]
+    assert stream.volume[row, first[1]] == 0.75
+    assert stream.volume[row, second[1]] == 1.0
+    # Следующее сообщение докладывает в уже открытую корзину
+    stream.feed(messages[3])
+    assert stream.volume[row, second[1]] == 1.125
+    assert stream.trades == 4
+    assert stream.price[row] == 37012.5
+
+    # Через TRADE_SLOTS корзин слот переиспользуется, старый объём сбрасывается
+    wrapped = slot_of(1700000128500)
+    assert wrapped[1] == first[1] and wrapped[0] == first[0] + bvs.TRADE_SLOTS
+    stream.feed(messages[5])
+    assert stream.stamps[row, first[1]] == wrapped[0]
+    assert stream.volume[row, first[1]] == 2.0
+    assert stream.last_ms == 1700000128500
+    assert stream.trades == 5
+    # Окно bursts видит только свежие корзины
+    stream.set_baselines({"BTCUSDT": 0.01})
+    assert [(s, v) for s, v, _ in stream.bursts(1.0)] == [("BTCUSDT", 2.0)]
+
+
+def test_feed_ignores_topics_outside_the_stream():
+    stream = bvs.TradeStream("spot", "wss://example", capacity=4)
+    stream.set_symbols(["BTCUSDT"])
+    stream.feed(recorded("public_trade_spot.jsonl")[4])  # ETHUSDT не подписан
+    assert "publicTrade.ETHUSDT" not in stream.rows
+    assert stream.trades == 0 and stream.last_ms == 0
+    assert not stream.volume.any() and not stream.price.any()
+
+
+def test_fresh_symbol_starts_with_zero_baseline():
+    stream = bvs.TradeStream("spot", "wss://example", capacity=2)
+    stream.set_symbols(["BTCUSDT", "SOLUSDT"])
+    stream.set_baselines({"BTCUSDT": 0.5, "SOLUSDT": 0.25})
+    # SOLUSDT уходит, его строку занимает ETHUSDT; ещё один тикер растит кольца
+    stream.set_symbols(["BTCUSDT", "ETHUSDT", "XRPUSDT"])
+    for symbol in ("ETHUSDT", "XRPUSDT"):
+        row = stream.rows[f"publicTrade.{symbol}"]
+        assert stream.baseline[row] == 0.0
+        assert (stream.stamps[row] == -1).all()
+    assert stream.baseline[stream.rows["publicTrade.BTCUSDT"]] == 0.5
+    # Пока базы нет, всплеск по новому тикеру не выдаётся
+    for raw in recorded("public_trade_spot.jsonl")[2:4]:
+        stream.feed(raw.replace("BTCUSDT", "ETHUSDT"))
+    assert stream.bursts(1.0) == []